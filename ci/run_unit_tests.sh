@@ -11,4 +11,5 @@ fi
 py.test $extra_flags \
 	tests/custom_lint.py \
 	tests/unit \
-	tests/stress.py
+	tests/stress.py \
+	tests/benchmark.py
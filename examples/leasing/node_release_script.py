@@ -122,7 +122,12 @@ def release_nodes(
     or removes the node from the project.
     """
 
-    free_node_list = hil_client.node.list('free')
+    # Fetch the details of all the nodes in one go, rather than calling
+    # node.show for each of them:
+    node_details = {info['name']: info
+                    for info in hil_client.node.show_many(page_size=500)}
+    free_node_list = [name for name, info in node_details.items()
+                      if info['project'] is None]
     # Only these nodes should be updated in
     # the file(either for project or for time)
     nodes_to_update = list(set(
@@ -139,7 +144,7 @@ def release_nodes(
         project = nodes[node]['project']
         time = nodes[node]['time']
 
-        node_current_info = hil_client.node.show(node)
+        node_current_info = node_details[node]
         project_in_hil = node_current_info['project']
         new_time = int(time)+1
         # Just update the time for the nodes which have been in
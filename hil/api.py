@@ -10,10 +10,11 @@ import flask
 from schema import Schema, And, Optional, SchemaError
 from urlparse import urlparse
 
-from hil import model, errors
+from hil import model, errors, deferred
 from hil.model import db
 from hil.auth import get_auth_backend
 from hil.config import cfg
+from hil.listing import list_schema, paginate, parse_fields, rows_by_name
 from hil.rest import rest_call
 from hil.class_resolver import concrete_class_for
 from hil.network_allocator import get_network_allocator
@@ -22,18 +23,39 @@ import logging
 
 # Project Code #
 ################
-@rest_call('GET', '/projects', Schema({}))
-def list_projects():
+@rest_call('GET', '/projects', list_schema({}))
+def list_projects(limit=None, cursor=None, fields=None):
     """List all projects.
 
     Returns a JSON array of strings representing a list of projects.
 
     Example:  '["project1", "project2", "project3"]'
+
+    Supports pagination, and the fields ``nodes`` and ``networks`` (those the
+    project has access to); see `hil.listing`.
     """
     get_auth_backend().require_admin()
-    projects = model.Project.query.all()
-    projects = sorted([p.label for p in projects])
-    return json.dumps(projects)
+    fields = parse_fields(fields, ['nodes', 'networks'])
+    projects = paginate(db.session.query(model.Project.label),
+                        model.Project.label, limit, cursor)
+    names = [p.label for p in projects]
+    if fields is None:
+        return json.dumps(names)
+
+    related = {
+        'nodes': db.session.query(model.Project.label, model.Node.label)
+        .join(model.Node, model.Project.nodes)
+        .order_by(model.Node.label),
+        'networks': db.session.query(model.Project.label, model.Network.label)
+        .join(model.Network, model.Project.networks_access)
+        .order_by(model.Network.label),
+    }
+    result = [{'name': name} for name in names]
+    for field in fields:
+        rows = rows_by_name(related[field], model.Project.label, names)
+        for item in result:
+            item[field] = [label for _, label in rows[item['name']]]
+    return json.dumps(result, sort_keys=True)
 
 
 @rest_call('PUT', '/project/<project>', Schema({'project': basestring}))
@@ -447,6 +469,7 @@ def node_connect_network(node, nic, network, channel=None):
                                           channel=channel,
                                           uuid=unique_id,
                                           status='PENDING'))
+    deferred.wake_daemon()
     db.session.commit()
     return json.dumps({'status_id': unique_id}), 202
 
@@ -492,6 +515,7 @@ def node_detach_network(node, nic, network):
                                           status='PENDING',
                                           new_network=None))
 
+    deferred.wake_daemon()
     db.session.commit()
     return json.dumps({'status_id': unique_id}), 202
 
@@ -723,28 +747,76 @@ def headnode_detach_network(headnode, hnic):
 # Network Code #
 ################
 
-@rest_call('GET', '/networks', Schema({}))
-def list_networks():
-    """Lists all networks"""
-    result = {}
+@rest_call('GET', '/networks', list_schema({
+    Optional('project'): basestring,
+}))
+def list_networks(project=None, limit=None, cursor=None, fields=None):
+    """Lists all networks
+
+    If `project` is not None, only lists the networks it has access to.
+
+    Supports pagination, and selecting the fields (``network_id`` and
+    ``projects``) of each network; see `hil.listing`.
+    """
+    fields = parse_fields(fields, ['network_id', 'projects'])
+    if fields is None:
+        fields = ['network_id', 'projects']
+    query = db.session.query(model.Network.label, model.Network.network_id)
+    if project is not None:
+        project = get_or_404(model.Project, project)
+        query = query.filter(model.Network.access.contains(project))
     # Admin Operation
-    if get_auth_backend().have_admin():
-        networks = db.session.query(model.Network).all()
+    admin = get_auth_backend().have_admin()
+    if not admin:
+        query = query.filter(~model.Network.access.any())
+    networks = paginate(query, model.Network.label, limit, cursor)
+
+    names = [n.label for n in networks]
+    if admin and 'projects' in fields:
+        access = rows_by_name(
+            db.session.query(model.Network.label, model.Project.label)
+            .join(model.Project, model.Network.access)
+            .order_by(model.Project.label),
+            model.Network.label, names)
     else:
-        networks = db.session.query(model.Network).filter_by(access=None).all()
+        access = {}
 
-    for n in networks:
-        if n.access:
-            projects = sorted([p.label for p in n.access])
-            result[n.label] = {'network_id': n.network_id,
-                               'projects': projects}
-        else:
-            result[n.label] = {'network_id': n.network_id,
-                               'projects': None}
+    result = {}
+    for network in networks:
+        item = {
+            'network_id': network.network_id,
+            'projects': [label for _, label in access.get(network.label, [])]
+            or None,
+        }
+        result[network.label] = {field: item[field] for field in fields}
 
     return json.dumps(result, sort_keys=True)
 
 
+def _network_attachments(network, project_ids=None):
+    """Query the attachments of nodes' nics to `network`.
+
+    The result is a query yielding tuples of the labels of the node, the nic,
+    the channel and the node's project, in order of attachment. If
+    `project_ids` is not None, only nodes in those projects are included.
+    """
+    query = db.session.query(model.Node.label,
+                             model.Nic.label,
+                             model.NetworkAttachment.channel,
+                             model.Project.label) \
+        .select_from(model.NetworkAttachment) \
+        .join(model.Nic, model.NetworkAttachment.nic) \
+        .join(model.Node, model.Nic.owner) \
+        .outerjoin(model.Project, model.Node.project) \
+        .filter(model.NetworkAttachment.network_id == network.id) \
+        .order_by(model.NetworkAttachment.id)
+    if project_ids is not None:
+        if not project_ids:
+            return query.filter(db.false())
+        query = query.filter(model.Node.project_id.in_(project_ids))
+    return query
+
+
 @rest_call('GET', '/network/<network>/attachments', schema=Schema({
     'network': basestring, Optional('project'): basestring,
 }))
@@ -779,16 +851,15 @@ def list_network_attachments(network, project=None):
                 raise errors.AuthorizationError(
                     "You do not have access to this project.")
 
-    attachments = network.attachments
+    attachments = _network_attachments(
+        network, None if project is None else [project.id])
     nodes = {}
-    for attachment in attachments:
-        if project is None or project is attachment.nic.owner.project:
-            node = {
-                'nic': attachment.nic.label,
-                'channel': attachment.channel,
-                'project': attachment.nic.owner.project.label
-            }
-            nodes[attachment.nic.owner.label] = node
+    for node, nic, channel, project_label in attachments:
+        nodes[node] = {
+            'nic': nic,
+            'channel': channel,
+            'project': project_label,
+        }
 
     return json.dumps(nodes, sort_keys=True)
 
@@ -844,16 +915,20 @@ def network_create(network, owner, access, net_id):
             access = [get_or_404(model.Project, access)]
 
     # Allocate net_id, if requested
+    allocator = get_network_allocator()
     if net_id == "":
-        net_id = get_network_allocator().get_new_network_id()
+        net_id = allocator.get_new_network_id()
         if net_id is None:
             raise errors.AllocationError('No more networks')
+        allocated = True
     else:
-        if not get_network_allocator().validate_network_id(net_id):
+        if not allocator.validate_network_id(net_id):
             raise errors.BadArgumentError("Invalid net_id")
-        get_network_allocator().claim_network_id(net_id)
+        allocated = allocator.claim_network_id(net_id)
+        if allocated is None:
+            # Allocators written before claim_network_id reported this:
+            allocated = allocator.is_network_id_in_pool(net_id)
 
-    allocated = get_network_allocator().is_network_id_in_pool(net_id)
     network = model.Network(owner, access, allocated, net_id, network)
     db.session.add(network)
     db.session.commit()
@@ -897,10 +972,8 @@ def show_network(network):
     network = get_or_404(model.Network, network)
 
     if network.access:
-        authorized = False
-        for proj in network.access:
-            authorized = authorized or auth_backend.have_project_access(proj)
-
+        authorized = any(auth_backend.have_project_access(proj)
+                         for proj in network.access)
         if not authorized:
             raise errors.AuthorizationError(
                 "You do not have access to this network.")
@@ -919,16 +992,17 @@ def show_network(network):
     else:
         result['access'] = None
 
+    # Callers with access to the network's owner can see all of the nodes
+    # attached to it; others only those in projects they have access to.
+    if auth_backend.have_project_access(network.owner):
+        attachments = _network_attachments(network)
+    else:
+        attachments = _network_attachments(
+            network, auth_backend.project_ids())
     connected_nodes = {}
-    for n in network.attachments:
-        if auth_backend.have_project_access(network.owner) or \
-                auth_backend.have_project_access(n.nic.owner.project):
-            node, nic = n.nic.owner.label, n.nic.label
-            # build a dictonary mapping a node to list of nics
-            if node not in connected_nodes:
-                connected_nodes[node] = [nic]
-            else:
-                connected_nodes[node].append(nic)
+    for node, nic, _, _ in attachments:
+        # build a dictonary mapping a node to list of nics
+        connected_nodes.setdefault(node, []).append(nic)
     result['connected-nodes'] = connected_nodes
 
     return json.dumps(result, sort_keys=True)
@@ -1029,11 +1103,17 @@ def show_switch(switch):
     """
     get_auth_backend().require_admin()
     switch = get_or_404(model.Switch, switch)
+    if switch.last_saved is None:
+        last_saved = None
+    else:
+        last_saved = switch.last_saved.isoformat()
     return json.dumps({
         'name': switch.label,
         'ports': [{'label': port.label}
                   for port in switch.ports],
         'capabilities': switch.get_capabilities(),
+        'last_saved': last_saved,
+        'save_pending': switch.save_pending,
     }, sort_keys=True)
 
 
@@ -1058,18 +1138,25 @@ def show_port(switch, port):
     return json.dumps(return_obj)
 
 
-@rest_call('GET', '/switches', Schema({}))
-def list_switches():
+@rest_call('GET', '/switches', list_schema({}))
+def list_switches(limit=None, cursor=None, fields=None):
     """List all switches.
 
     Returns a JSON array of strings representing a list of switches.
 
     Example:  '["cisco3", "brocade1", "mock2"]'
+
+    Supports pagination, and the field ``type``; see `hil.listing`.
     """
     get_auth_backend().require_admin()
-    switches = model.Switch.query.all()
-    snames = sorted([s.label for s in switches])
-    return json.dumps(snames)
+    fields = parse_fields(fields, ['type'])
+    switches = paginate(db.session.query(model.Switch.label,
+                                         model.Switch.type),
+                        model.Switch.label, limit, cursor)
+    if fields is None:
+        return json.dumps([s.label for s in switches])
+    return json.dumps([{'name': s.label, 'type': s.type} for s in switches],
+                      sort_keys=True)
 
 
 @rest_call('POST', '/switch/<switch>/port/<path:port>/connect_nic', Schema({
@@ -1153,6 +1240,7 @@ def port_revert(switch, port):
                                     new_network=None)
 
     db.session.add(action)
+    deferred.wake_daemon()
     db.session.commit()
     return json.dumps({'status_id': unique_id})
 
@@ -1184,36 +1272,146 @@ def show_networking_action(status_id):
     return json.dumps(action_info)
 
 
-@rest_call('GET', '/nodes/<is_free>', Schema({'is_free': basestring}))
-def list_nodes(is_free):
+# The arguments for filtering lists of nodes; see `_list_nodes`:
+NODE_FILTERS = {
+    Optional('metadata'): basestring,
+    Optional('switch'): basestring,
+    Optional('network'): basestring,
+}
+
+
+@rest_call('GET', '/nodes/<is_free>', list_schema(NODE_FILTERS, {
+    'is_free': basestring,
+    Optional('project'): basestring,
+}))
+def list_nodes(is_free, project=None, metadata=None, switch=None,
+               network=None, limit=None, cursor=None, fields=None):
     """List all nodes or all free nodes
 
     Returns a JSON array of strings representing a list of nodes.
 
     Example:  '["node1", "node2", "node3"]'
+
+    The other arguments filter the list; see `_list_nodes`. Using them
+    requires admin access, since they reveal how the nodes are allocated.
     """
-    if is_free == "free":
-        nodes = model.Node.query.filter_by(project_id=None).all()
-    else:
-        nodes = model.Node.query.all()
+    filters = {'project': project, 'metadata': metadata, 'switch': switch,
+               'network': network}
+    if fields is not None or any(v is not None for v in filters.values()):
+        get_auth_backend().require_admin()
 
-    nodes = sorted([n.label for n in nodes])
-    return json.dumps(nodes)
+    query = db.session.query(model.Node.label)
+    if is_free == "free":
+        query = query.filter(model.Node.project_id.is_(None))
+    if project is not None:
+        project = get_or_404(model.Project, project)
+        query = query.filter(model.Node.project_id == project.id)
+    return _list_nodes(query, metadata, switch, network, limit, cursor,
+                       fields)
 
 
-@rest_call('GET', '/project/<project>/nodes', Schema({'project': basestring}))
-def list_project_nodes(project):
+@rest_call('GET', '/project/<project>/nodes', list_schema(NODE_FILTERS, {
+    'project': basestring,
+}))
+def list_project_nodes(project, metadata=None, switch=None, network=None,
+                       limit=None, cursor=None, fields=None):
     """List all nodes belonging the given project.
 
     Returns a JSON array of strings representing a list of nodes.
 
     Example:  '["node1", "node2", "node3"]'
+
+    The other arguments filter the list; see `_list_nodes`. Filtering by
+    switch requires admin access.
     """
     project = get_or_404(model.Project, project)
     get_auth_backend().require_project_access(project)
-    nodes = project.nodes
-    nodes = [n.label for n in nodes]
-    return json.dumps(nodes)
+    if switch is not None:
+        get_auth_backend().require_admin()
+    query = db.session.query(model.Node.label) \
+        .filter(model.Node.project_id == project.id)
+    return _list_nodes(query, metadata, switch, network, limit, cursor,
+                       fields)
+
+
+def _list_nodes(query, metadata, switch, network, limit, cursor, fields):
+    """Do the work of `list_nodes` and `list_project_nodes`.
+
+    `query` is a query for the labels of the nodes to list, which is further
+    restricted by `_filter_nodes`.
+
+    The result is paginated, and may include the fields ``project`` and
+    ``metadata``; see `hil.listing`.
+    """
+    fields = parse_fields(fields, ['project', 'metadata'])
+    query = _filter_nodes(query, metadata, switch, network)
+
+    if fields is None:
+        nodes = paginate(query, model.Node.label, limit, cursor)
+        return json.dumps([n.label for n in nodes])
+
+    nodes = paginate(
+        query.outerjoin(model.Project, model.Node.project)
+        .add_columns(model.Project.label.label('project')),
+        model.Node.label, limit, cursor)
+    names = [n.label for n in nodes]
+    result = []
+    if 'metadata' in fields:
+        metadata = rows_by_name(
+            db.session.query(model.Node.label, model.Metadata.label,
+                             model.Metadata.value)
+            .join(model.Metadata, model.Node.metadata),
+            model.Node.label, names)
+    for node in nodes:
+        item = {'name': node.label}
+        if 'project' in fields:
+            item['project'] = node.project
+        if 'metadata' in fields:
+            item['metadata'] = {label: value
+                                for _, label, value in metadata[node.label]}
+        result.append(item)
+    return json.dumps(result, sort_keys=True)
+
+
+def _metadata_encodings(value):
+    """Return the ways a metadata value given as the string `value` may be
+    stored; see `_filter_nodes`.
+    """
+    encodings = {json.dumps(value)}
+    try:
+        encodings.add(json.dumps(json.loads(value)))
+    except ValueError:
+        pass
+    return sorted(encodings)
+
+
+def _filter_nodes(query, metadata, switch, network):
+    """Restrict `query`, a query involving nodes, to:
+
+    * if `metadata` is not None, nodes with that metadata. It is either a
+      label, or a label and value separated by '=', e.g. 'rack=R12'. Since
+      metadata values are stored as JSON, the value matches both the string
+      it is (so 'rack=12' matches "12") and the JSON it encodes (12).
+    * if `switch` is not None, nodes with a nic connected to that switch.
+    * if `network` is not None, nodes with a nic attached to that network.
+    """
+    if metadata is not None:
+        if '=' in metadata:
+            label, value = metadata.split('=', 1)
+            query = query.filter(model.Node.metadata.any(
+                (model.Metadata.label == label) &
+                model.Metadata.value.in_(_metadata_encodings(value))))
+        else:
+            query = query.filter(model.Node.metadata.any(label=metadata))
+    if switch is not None:
+        switch = get_or_404(model.Switch, switch)
+        query = query.filter(model.Node.nics.any(model.Nic.port.has(
+            model.Port.owner_id == switch.id)))
+    if network is not None:
+        network = get_or_404(model.Network, network)
+        query = query.filter(model.Node.nics.any(model.Nic.attachments.any(
+            model.NetworkAttachment.network_id == network.id)))
+    return query
 
 
 @rest_call('GET', '/project/<project>/networks', Schema({
@@ -1240,7 +1438,18 @@ def show_node(nodename):
     Returns a JSON object representing a node.
     """
 
-    node = get_or_404(model.Node, nodename)
+    # Load everything we report on up front, so that the number of queries
+    # doesn't grow with the number of nics and attachments:
+    nics = db.subqueryload(model.Node.nics)
+    node = model.Node.query.options(
+        db.joinedload(model.Node.project),
+        db.subqueryload(model.Node.metadata),
+        nics.joinedload(model.Nic.port).joinedload(model.Port.owner),
+        nics.subqueryload(model.Nic.attachments)
+        .joinedload(model.NetworkAttachment.network),
+    ).filter_by(label=nodename).first()
+    if node is None:
+        raise errors.NotFoundError("Node %s does not exist." % nodename)
     if node.project is not None:
         get_auth_backend().require_project_access(node.project)
 
@@ -1268,6 +1477,101 @@ def show_node(nodename):
     }, sort_keys=True)
 
 
+@rest_call('GET', '/nodes/<is_free>/detail', list_schema(NODE_FILTERS, {
+    'is_free': basestring,
+    Optional('project'): basestring,
+}))
+def show_nodes(is_free, project=None, metadata=None, switch=None,
+               network=None, limit=None, cursor=None, fields=None):
+    """Show the details of many nodes.
+
+    Returns a JSON array of objects, each as returned by `show_node`, in
+    order of name. The nodes are chosen as for `list_nodes`, except that
+    callers without admin access only see the free nodes and those in
+    projects they have access to. Filtering by switch requires admin
+    access.
+
+    The result can be paginated (see `hil.listing`); it takes a fixed
+    number of queries per page.
+    """
+    auth_backend = get_auth_backend()
+    parse_fields(fields, [])
+    admin = auth_backend.have_admin()
+    if switch is not None:
+        auth_backend.require_admin()
+
+    query = db.session.query(model.Node.label,
+                             model.Project.label.label('project')) \
+        .outerjoin(model.Project, model.Node.project)
+    if is_free == "free":
+        query = query.filter(model.Node.project_id.is_(None))
+    if project is not None:
+        project = get_or_404(model.Project, project)
+        auth_backend.require_project_access(project)
+        query = query.filter(model.Node.project_id == project.id)
+    if not admin:
+        projects = auth_backend.project_ids()
+        visible = model.Node.project_id.is_(None)
+        if projects:
+            visible = visible | model.Node.project_id.in_(projects)
+        query = query.filter(visible)
+    query = _filter_nodes(query, metadata, switch, network)
+    nodes = paginate(query, model.Node.label, limit, cursor)
+
+    # Read the nics, their attachments and the metadata of every node on the
+    # page, with one query each:
+    names = [node.label for node in nodes]
+    nics = rows_by_name(
+        db.session.query(model.Node.label,
+                         model.Nic.id,
+                         model.Nic.label,
+                         model.Nic.mac_addr,
+                         model.Port.label,
+                         model.Switch.label)
+        .join(model.Nic, model.Node.nics)
+        .outerjoin(model.Port, model.Nic.port)
+        .outerjoin(model.Switch, model.Port.owner)
+        .order_by(model.Nic.id),
+        model.Node.label, names)
+    attachments = {}
+    query = db.session.query(model.Node.label,
+                             model.Nic.id,
+                             model.NetworkAttachment.channel,
+                             model.Network.label) \
+        .join(model.Nic, model.Node.nics) \
+        .join(model.NetworkAttachment, model.Nic.attachments) \
+        .join(model.Network, model.NetworkAttachment.network)
+    for rows in rows_by_name(query, model.Node.label, names).values():
+        for _, nic_id, channel, network_label in rows:
+            attachments.setdefault(nic_id, {})[channel] = network_label
+    metadata = rows_by_name(
+        db.session.query(model.Node.label, model.Metadata.label,
+                         model.Metadata.value)
+        .join(model.Metadata, model.Node.metadata),
+        model.Node.label, names)
+
+    result = []
+    for node in nodes:
+        node_nics = []
+        for _, nic_id, label, mac_addr, port, switch_label \
+                in nics[node.label]:
+            nic = {'label': label,
+                   'macaddr': mac_addr,
+                   'networks': attachments.get(nic_id, {})}
+            if admin:
+                nic['port'] = port
+                nic['switch'] = switch_label
+            node_nics.append(nic)
+        result.append({
+            'name': node.label,
+            'project': node.project,
+            'nics': node_nics,
+            'metadata': {label: value
+                         for _, label, value in metadata[node.label]},
+        })
+    return json.dumps(result, sort_keys=True)
+
+
 @rest_call('GET', '/project/<project>/headnodes', Schema({
     'project': basestring,
 }))
@@ -4,11 +4,36 @@ from hil.errors import AuthorizationError
 from hil import model
 from abc import ABCMeta, abstractmethod
 
+import flask
 import sys
 
 _auth_backend = None
 
 
+class AuthContext(object):
+    """What the current request is authorized to do, as far as it has been
+    worked out so far.
+
+    Attributes:
+
+        admin (bool): whether the request has admin access.
+        listed (bool): whether the backend has been asked to list the
+            request's projects (see `AuthBackend._project_ids`).
+        project_ids (frozenset or None): the ids of the projects the request
+            may act as, or None if they haven't been listed.
+        project_access (dict): maps the ids of projects checked one at a
+            time to whether the request may act as them.
+
+    See `AuthBackend.context`.
+    """
+
+    def __init__(self, admin):
+        self.admin = admin
+        self.listed = False
+        self.project_ids = None
+        self.project_access = {}
+
+
 class AuthBackend(object):
     """An authentication/authorization backend.
 
@@ -17,9 +42,10 @@ class AuthBackend(object):
     of the subclass
 
     Subclasses of AuthBackend must override `authenticate`, `_have_admin`,
-    and `_have_project_access`, and nothing else. Users of the AuthBackend must
-    not invoke `_have_admin` and `_have_project_access`, preferring
-    `have_admin` and `have_project_access`.
+    and `_have_project_access`, and may override `_project_ids`, but nothing
+    else. Users of the AuthBackend must not invoke `_have_admin`,
+    `_have_project_access` and `_project_ids`, preferring `have_admin`,
+    `have_project_access` and `project_ids`.
     """
 
     __metaclass__ = ABCMeta
@@ -64,6 +90,71 @@ class AuthBackend(object):
         the `have_*` and `require_*` wrappers handle this.
         """
 
+    def _project_ids(self):
+        """Return the ids of the projects the request may act as, or None.
+
+        This will be called at most once per request, and only for requests
+        without admin access. Backends which can find the projects cheaply
+        (e.g. with one query) should override it. The default returns None,
+        in which case `_have_project_access` is called for each project as
+        it is checked, and only `project_ids` checks every project.
+        """
+        return None
+
+    def context(self):
+        """Return the `AuthContext` of the request.
+
+        It is kept for the whole request, and remembers what
+        `have_project_access` and `project_ids` work out, so that checking
+        access to many projects, or the same one many times, is cheap.
+
+        Backends whose authorization state can change after
+        ``authenticate()`` must call `invalidate_context` when it does.
+        """
+        if not flask.has_app_context():
+            # Nowhere to keep it (e.g. the api is being called directly, as
+            # the tests sometimes do), so just work it out.
+            return self._make_context()
+        auth = getattr(flask.g, 'auth', None)
+        cached = getattr(flask.g, 'auth_context', None)
+        # Tests sometimes swap out local.auth directly, so make sure the
+        # context is still for the same one:
+        if cached is not None and cached[0] is auth:
+            return cached[1]
+        context = self._make_context()
+        flask.g.auth_context = (auth, context)
+        return context
+
+    def _make_context(self):
+        """Start the `AuthContext` of the request; see `context`."""
+        return AuthContext(admin=self._have_admin())
+
+    def _listed_project_ids(self, context):
+        """Return the project ids `_project_ids` lists for the request in
+        `context` (None if it doesn't), asking it at most once.
+        """
+        if not context.listed:
+            project_ids = self._project_ids()
+            if project_ids is not None:
+                context.project_ids = frozenset(project_ids)
+            context.listed = True
+        return context.project_ids
+
+    def _check_project_access(self, context, project):
+        """Return `_have_project_access(project)`, remembering the answer
+        in `context`.
+        """
+        if project.id not in context.project_access:
+            context.project_access[project.id] = \
+                self._have_project_access(project)
+        return context.project_access[project.id]
+
+    @staticmethod
+    def invalidate_context():
+        """Forget the request's `AuthContext`; see `context`."""
+        if flask.has_app_context():
+            flask.g.auth_context = None
+
     def have_admin(self):
         """Check if the request is authorized to act as an administrator.
 
@@ -89,7 +180,33 @@ class AuthBackend(object):
             return self._have_admin()
 
         assert isinstance(project, model.Project)
-        return self._have_admin() or self._have_project_access(project)
+        context = self.context()
+        if context.admin:
+            return True
+        project_ids = self._listed_project_ids(context)
+        if project_ids is not None:
+            return project.id in project_ids
+        return self._check_project_access(context, project)
+
+    def project_ids(self):
+        """Return the ids (a frozenset) of the projects the request may act
+        as.
+
+        Admins may act as any project, so this is empty for them. This can be
+        used to restrict queries to what the caller can see. Unless the
+        backend overrides `_project_ids`, it checks every project (once per
+        request), so it is best avoided where `have_project_access` will do.
+        """
+        context = self.context()
+        if context.admin:
+            return frozenset()
+        project_ids = self._listed_project_ids(context)
+        if project_ids is None:
+            project_ids = frozenset(
+                project.id for project in model.Project.query
+                if self._check_project_access(context, project))
+            context.project_ids = project_ids
+        return project_ids
 
     def require_admin(self):
         """Ensure the request is authorized to act as an administrator.
@@ -3,7 +3,9 @@
 import sys
 import os
 
-from hil.client.client import Client, RequestsHTTPClient, KeystoneHTTPClient
+from hil.client.base import ClientBase
+from hil.client.client import Client, RequestsHTTPClient, \
+    KeystoneHTTPClient, BearerAuth
 
 
 def setup_http_client():
@@ -14,10 +16,14 @@ def setup_http_client():
     Sets http_client to an object which makes HTTP requests with
     authentication. It chooses an authentication backend as follows:
 
-    1. If the environment variables HIL_USERNAME and HIL_PASSWORD
-       are defined, it will use HTTP basic auth, with the corresponding
-       user name and password.
-    2. If the `python-keystoneclient` library is installed, and the
+    1. If the environment variable HIL_TOKEN is defined, it will use it
+       as an API token (see ``hil user token``).
+    2. If the environment variables HIL_USERNAME and HIL_PASSWORD
+       are defined, it will exchange the corresponding user name and
+       password for an API token, and use that for the rest of the
+       session. If the server doesn't issue tokens, it will use HTTP basic
+       auth instead.
+    3. If the `python-keystoneclient` library is installed, and the
        environment variables:
 
            * OS_AUTH_URL
@@ -26,7 +32,7 @@ def setup_http_client():
            * OS_PROJECT_NAME
 
        are defined, Keystone is used.
-    3. Otherwise, do not supply authentication information.
+    4. Otherwise, do not supply authentication information.
 
     This may be extended with other backends in the future.
 
@@ -34,18 +40,26 @@ def setup_http_client():
     Until all calls are moved to client library, this will support
     both ways of intereacting with HIL.
     """
-    # First try basic auth:
     ep = os.environ.get('HIL_ENDPOINT')
 
     if ep is None:
         sys.exit("Error: HIL_ENDPOINT not set \n")
 
+    # First try an API token:
+    token = os.getenv('HIL_TOKEN')
+    if token is not None:
+        http_client = RequestsHTTPClient()
+        http_client.auth = BearerAuth(token)
+        return Client(ep, http_client), http_client
+
+    # Then basic auth:
     basic_username = os.getenv('HIL_USERNAME')
     basic_password = os.getenv('HIL_PASSWORD')
     if basic_username is not None and basic_password is not None:
         # For calls with no client library support yet.
         # Includes all headnode calls; registration of nodes and switches.
-        http_client = RequestsHTTPClient()
+        http_client = RequestsHTTPClient(
+            token_url=ClientBase(ep, None).object_url('auth/basic/token'))
         http_client.auth = (basic_username, basic_password)
         # For calls using the client library
         return Client(ep, http_client), http_client
@@ -2,6 +2,7 @@
 import json
 import sys
 import os
+import click
 from prettytable import PrettyTable
 
 try:
@@ -16,6 +17,48 @@ def print_json(raw_output):
     sys.exit(0)
 
 
+def page_size_option(f):
+    """Add a --page-size option to the command `f`."""
+    return click.option('--page-size', type=int,
+                        help='Fetch the list this many items at a time.')(f)
+
+
+def node_filter_options(f):
+    """Add the options for filtering and describing lists of nodes to the
+    command `f`.
+    """
+    options = [
+        click.option('--metadata', help='Only list nodes with this metadata '
+                     'label, or label=value.'),
+        click.option('--switch', help='Only list nodes connected to this '
+                     'switch.'),
+        click.option('--network', help='Only list nodes attached to this '
+                     'network.'),
+        click.option('--field', 'fields', multiple=True,
+                     type=click.Choice(['project', 'metadata']),
+                     help='Also show this field of each node.'),
+        page_size_option,
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+
+def node_rows(raw_output, fields):
+    """Return table rows for a list of nodes, with the extra `fields`."""
+    if not fields:
+        return [[i] for i in raw_output]
+    return [[node['name']] + [_format_field(node[field]) for field in fields]
+            for node in raw_output]
+
+
+def _format_field(value):
+    """Format the value of a node's field for a table cell."""
+    if isinstance(value, dict):
+        return ', '.join('%s=%s' % (k, v) for k, v in sorted(value.items()))
+    return value
+
+
 def make_table(field_names, rows):
     """Generate a PrettyTable and return it.
     If there's only field, then it will add the count of items in the header.
@@ -1,7 +1,7 @@
 """Commands related to networks are in this module"""
 import click
 from hil.cli.client_setup import client
-from hil.cli.helper import print_json, make_table
+from hil.cli.helper import print_json, make_table, page_size_option
 
 
 @click.group()
@@ -59,10 +59,13 @@ def network_show(network, jsonout):
 
 
 @network.command(name='list')
+@click.option('--project', help='Only list networks this project can '
+              'access.')
+@page_size_option
 @click.option('--json', 'jsonout', is_flag=True)
-def network_list(jsonout):
+def network_list(project, page_size, jsonout):
     """List all networks"""
-    raw_output = client.network.list()
+    raw_output = client.network.list(project=project, page_size=page_size)
 
     if jsonout:
         print_json(raw_output)
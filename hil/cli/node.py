@@ -3,7 +3,8 @@ import click
 import sys
 from prettytable import PrettyTable
 from hil.cli.client_setup import client
-from hil.cli.helper import print_json, make_table
+from hil.cli.helper import print_json, make_table, node_filter_options, \
+    node_rows
 
 
 @click.group()
@@ -13,33 +14,62 @@ def node():
 
 @node.command(name='list')
 @click.argument('pool', type=click.Choice(['free', 'all']), required=True)
+@click.option('--project', help='Only list nodes in this project.')
+@node_filter_options
 @click.option('--json', 'jsonout', is_flag=True)
-def nodes_list(pool, jsonout):
+def nodes_list(pool, project, metadata, switch, network, fields, page_size,
+               jsonout):
     """List all nodes or free nodes"""
-    raw_output = client.node.list(pool)
+    fields = list(fields) or None
+    raw_output = client.node.list(pool, project=project, metadata=metadata,
+                                  switch=switch, network=network,
+                                  fields=fields, page_size=page_size)
 
     if jsonout:
         print_json(raw_output)
 
     if pool == 'free':
-        print(make_table(field_names=['Free Nodes'],
-                         rows=[[i] for i in raw_output]))
+        title = 'Free Nodes'
     else:
-        print(make_table(field_names=['All Nodes'],
-                         rows=[[i] for i in raw_output]))
+        title = 'All Nodes'
+    print(make_table(field_names=[title] + [f.title() for f in fields or []],
+                     rows=node_rows(raw_output, fields)))
 
 
 @node.command(name='show')
-@click.argument('node')
+@click.argument('node', required=False)
+@click.option('--all', 'show_all', is_flag=True,
+              help='Show all nodes, instead of just <node>.')
+@click.option('--free', is_flag=True, help='With --all, only free nodes.')
+@click.option('--project', help='With --all, only nodes in this project.')
+@click.option('--page-size', type=int, default=500,
+              help='With --all, fetch this many nodes at a time.')
 @click.option('--json', 'jsonout', is_flag=True)
-def node_show(node, jsonout):
+def node_show(node, show_all, free, project, page_size, jsonout):
     """Show node information"""
-    raw_output = client.node.show(node)
-    node_table = PrettyTable()
+    if show_all == (node is not None):
+        raise click.UsageError('Specify either a node or --all.')
+    if show_all:
+        raw_output = client.node.show_many('free' if free else 'all',
+                                           project=project,
+                                           page_size=page_size)
+    else:
+        raw_output = client.node.show(node)
 
     if jsonout:
         print_json(raw_output)
 
+    if show_all:
+        for info in raw_output:
+            print(_node_table(info))
+    else:
+        print(_node_table(raw_output))
+
+
+def _node_table(raw_output):
+    """Return a table of a node's information, as returned by show_node."""
+    node_table = PrettyTable()
+
     node_table.field_names = ['Field', 'Value']
 
     if 'project' in raw_output:
@@ -74,7 +104,7 @@ def node_show(node, jsonout):
             for key, val in raw_output['metadata'].items():
                 node_table.add_row([key, val.strip('""')])
 
-    print(node_table)
+    return node_table
 
 
 @node.command(name='bootdev', short_help="Set a node's boot device")
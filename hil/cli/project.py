@@ -3,7 +3,8 @@ import click
 import time
 import sys
 from hil.cli.client_setup import client
-from hil.cli.helper import print_json, make_table, HIL_TIMEOUT
+from hil.cli.helper import print_json, make_table, HIL_TIMEOUT, \
+    node_filter_options, node_rows, page_size_option
 
 
 @click.group()
@@ -26,10 +27,11 @@ def project_delete(project):
 
 
 @project.command(name='list')
+@page_size_option
 @click.option('--json', 'jsonout', is_flag=True)
-def project_list(jsonout):
+def project_list(page_size, jsonout):
     """List all projects"""
-    raw_output = client.project.list()
+    raw_output = client.project.list(page_size=page_size)
 
     if jsonout:
         print_json(raw_output)
@@ -59,16 +61,22 @@ def project_node():
 
 @project_node.command(name='list')
 @click.argument('project')
+@node_filter_options
 @click.option('--json', 'jsonout', is_flag=True)
-def project_node_list(project, jsonout):
+def project_node_list(project, metadata, switch, network, fields, page_size,
+                      jsonout):
     """List all nodes attached to a <project>"""
-    raw_output = client.project.nodes_in(project)
+    fields = list(fields) or None
+    raw_output = client.project.nodes_in(project, metadata=metadata,
+                                         switch=switch, network=network,
+                                         fields=fields, page_size=page_size)
 
     if jsonout:
         print_json(raw_output)
 
-    print(make_table(field_names=['Nodes'],
-                     rows=[[i] for i in raw_output]))
+    print(make_table(field_names=['Nodes'] + [f.title()
+                                              for f in fields or []],
+                     rows=node_rows(raw_output, fields)))
 
 
 @project_node.command(name='add')
@@ -4,7 +4,7 @@ import sys
 import ast
 from prettytable import PrettyTable
 from hil.cli.client_setup import client
-from hil.cli.helper import print_json, make_table
+from hil.cli.helper import print_json, make_table, page_size_option
 
 
 @click.group()
@@ -35,6 +35,12 @@ def switch_show(switch, jsonout):
             switch_table.add_row(
                 ['Capabilities', raw_output['capabilities'][0]])
 
+    if 'last_saved' in raw_output:
+        switch_table.add_row(['Last saved', raw_output['last_saved']])
+
+    if 'save_pending' in raw_output:
+        switch_table.add_row(['Save pending', raw_output['save_pending']])
+
     if 'ports' in raw_output:
         if not raw_output['ports']:
             switch_table.add_row(['Ports', 'None'])
@@ -47,10 +53,11 @@ def switch_show(switch, jsonout):
 
 
 @switch.command(name='list')
+@page_size_option
 @click.option('--json', 'jsonout', is_flag=True)
-def list_switches(jsonout):
+def list_switches(page_size, jsonout):
     """List all switches"""
-    raw_output = client.switch.list()
+    raw_output = client.switch.list(page_size=page_size)
 
     if jsonout:
         print_json(raw_output)
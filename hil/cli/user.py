@@ -59,3 +59,16 @@ def user_set_admin(username, is_admin):
     a user is authorized for administrative privileges.
     """
     client.user.set_admin(username, is_admin == 'admin')
+
+
+@user.command(name='token', short_help='Create an API token')
+@click.option('--project', help='Only grant access to this project')
+@click.option('--expires-in', type=int,
+              help='Seconds until the token expires')
+def user_token(project, expires_in):
+    """Create an API token for the current user, and print it.
+
+    The token can be used instead of a username and password, by setting
+    the HIL_TOKEN environment variable to it.
+    """
+    click.echo(client.user.create_token(project, expires_in)['token'])
@@ -4,6 +4,7 @@ from urlparse import urljoin
 import json
 import re
 from hil.errors import BadArgumentError
+from hil.listing import NEXT_CURSOR_HEADER
 import inspect
 
 
@@ -50,6 +51,41 @@ class ClientBase(object):
         url = urljoin(self.endpoint, rel)
         return url
 
+    def get_list(self, url, page_size=None, fields=None, **filters):
+        """Call the list api call at `url`, and return the whole list.
+
+        If `page_size` is not None, the list is fetched that many items at a
+        time. `fields` is a list of extra fields to request for each item,
+        and `filters` are the call's filtering arguments; those which are
+        None are left out. See `hil.listing` for details.
+
+        The result is a list or a dictionary, like the call's response.
+        """
+        result = None
+        for page in self.pages(url, page_size, fields, **filters):
+            if result is None:
+                result = page
+            elif isinstance(result, dict):
+                result.update(page)
+            else:
+                result.extend(page)
+        return result
+
+    def pages(self, url, page_size=None, fields=None, **filters):
+        """Like `get_list`, but yield each page of results as it arrives."""
+        params = {k: v for k, v in filters.items() if v is not None}
+        if page_size is not None:
+            params['limit'] = str(page_size)
+        if fields is not None:
+            params['fields'] = ','.join(fields)
+        while True:
+            response = self.httpClient.request('GET', url, params=params)
+            yield self.check_response(response)
+            cursor = response.headers.get(NEXT_CURSOR_HEADER)
+            if not cursor:
+                return
+            params['cursor'] = cursor
+
     def check_response(self, response):
         """
         Check the response from an API call, and do any needed error handling
@@ -86,6 +86,20 @@ class HTTPResponse(namedtuple('HTTPResponse', ['status_code',
         return self._content
 
 
+class BearerAuth(requests.auth.AuthBase):
+    """Authentication for requests, with an API token.
+
+    See ``hil.ext.auth.database.token_create``.
+    """
+
+    def __init__(self, token):
+        self.token = token
+
+    def __call__(self, req):
+        req.headers['Authorization'] = 'Bearer ' + self.token
+        return req
+
+
 class RequestsHTTPClient(requests.Session, HTTPClient):
     """An HTTPClient which uses the requests library.
 
@@ -95,20 +109,66 @@ class RequestsHTTPClient(requests.Session, HTTPClient):
     The requests library's Response object actually satisfies the
     needed interface by itself, but by wrapping it we decrease the
     odds of accidentally depending on requests-specific functionality.
+
+    If `token_url` is given, and `auth` is set to a (username, password)
+    pair, the credentials are exchanged for an API token (by a POST to
+    `token_url`) before the first request, and the token is used from then
+    on. A new token is fetched if the old one is refused. If the server
+    doesn't issue tokens, the username and password are used as usual.
+    Requests for new tokens are always made with the password.
     """
 
+    def __init__(self, token_url=None):
+        requests.Session.__init__(self)
+        self.token_url = token_url
+        # The (username, password) pair that our token was issued for, if
+        # we have one:
+        self._credentials = None
+
     # disable a pylint warning about arguments that don't match the
     # superclass's; we just pass these straight through to the super
     # class's method, so *args, **kwargs let's us ignore what they
     # are entirely.
     #
     # pylint: disable=arguments-differ
-    def request(self, *args, **kwargs):
-        resp = requests.Session.request(self, *args, stream=True, **kwargs)
+    def request(self, method, url, *args, **kwargs):
+        if method == 'POST' and url == self.token_url:
+            if self._credentials is not None:
+                kwargs['auth'] = self._credentials
+        else:
+            self._fetch_token()
+        resp = requests.Session.request(self, method, url, *args,
+                                        stream=True, **kwargs)
+        if resp.status_code == 401 and 'auth' not in kwargs and \
+                self._credentials is not None:
+            # The token has most likely expired; get a new one and retry.
+            # The response is streamed, so close it first, to release its
+            # connection back to the pool:
+            resp.close()
+            self.auth = self._credentials
+            self._credentials = None
+            self._fetch_token()
+            resp = requests.Session.request(self, method, url, *args,
+                                            stream=True, **kwargs)
         return HTTPResponse(status_code=resp.status_code,
                             headers=resp.headers,
                             body=resp.iter_content())
 
+    def _fetch_token(self):
+        """Exchange `auth` for an API token, if we are configured to.
+
+        If the server won't give us a token, `token_url` is cleared, so we
+        don't try again.
+        """
+        if self.token_url is None or not isinstance(self.auth, tuple):
+            return
+        resp = requests.Session.request(self, 'POST', self.token_url)
+        if resp.status_code != 200:
+            self.token_url = None
+            return
+        self._credentials = self.auth
+        self.auth = BearerAuth(resp.json()['token'])
+
 
 class KeystoneHTTPClient(HTTPClient):
     """An HTTPClient which authenticates with Keystone.
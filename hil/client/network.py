@@ -10,10 +10,14 @@ class Network(ClientBase):
     objects and relations.
     """
 
-    def list(self):
-        """Lists all networks under HIL """
+    def list(self, project=None, fields=None, page_size=None):
+        """Lists all networks under HIL
+
+        If `project` is given, only lists the networks it can access. See
+        `ClientBase.get_list` for the other optional arguments.
+        """
         url = self.object_url('networks')
-        return self.check_response(self.httpClient.request("GET", url))
+        return self.get_list(url, page_size, fields, project=project)
 
     @check_reserved_chars()
     def list_network_attachments(self, network, project):
@@ -10,10 +10,17 @@ class Node(ClientBase):
     objects and relations.
     """
 
-    def list(self, is_free):
-        """List all nodes that HIL manages """
+    def list(self, is_free, project=None, metadata=None, switch=None,
+             network=None, fields=None, page_size=None):
+        """List all nodes that HIL manages
+
+        The optional arguments filter the list, select extra `fields` to
+        return and fetch it in pages; see `ClientBase.get_list`.
+        """
         url = self.object_url('nodes', is_free)
-        return self.check_response(self.httpClient.request('GET', url))
+        return self.get_list(url, page_size, fields, project=project,
+                             metadata=metadata, switch=switch,
+                             network=network)
 
     @check_reserved_chars()
     def show(self, node_name):
@@ -21,6 +28,19 @@ class Node(ClientBase):
         url = self.object_url('node', node_name)
         return self.check_response(self.httpClient.request('GET', url))
 
+    def show_many(self, is_free='all', project=None, metadata=None,
+                  switch=None, network=None, page_size=None):
+        """Shows the attributes of many nodes, as a list of the results of
+        `show`.
+
+        The nodes are chosen like `list`, and are fetched `page_size` at a
+        time if that is given.
+        """
+        url = self.object_url('nodes', is_free, 'detail')
+        return self.get_list(url, page_size, project=project,
+                             metadata=metadata, switch=switch,
+                             network=network)
+
     @check_reserved_chars(dont_check=['obmd_uri'])
     def register(self, node, obmd_uri, obmd_admin_token):
         """Register a node. """
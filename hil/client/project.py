@@ -10,17 +10,26 @@ class Project(ClientBase):
     objects and relations.
     """
 
-    def list(self):
-        """Lists all projects under HIL """
+    def list(self, fields=None, page_size=None):
+        """Lists all projects under HIL
+
+        See `ClientBase.get_list` for the optional arguments.
+        """
 
         url = self.object_url('projects')
-        return self.check_response(self.httpClient.request("GET", url))
+        return self.get_list(url, page_size, fields)
 
-    @check_reserved_chars()
-    def nodes_in(self, project_name):
-        """Lists nodes allocated to project <project_name> """
+    @check_reserved_chars(dont_check=['metadata', 'switch', 'network',
+                                      'fields', 'page_size'])
+    def nodes_in(self, project_name, metadata=None, switch=None,
+                 network=None, fields=None, page_size=None):
+        """Lists nodes allocated to project <project_name>
+
+        See `ClientBase.get_list` for the optional arguments.
+        """
         url = self.object_url('project', project_name, 'nodes')
-        return self.check_response(self.httpClient.request("GET", url))
+        return self.get_list(url, page_size, fields, metadata=metadata,
+                             switch=switch, network=network)
 
     @check_reserved_chars()
     def networks_in(self, project_name):
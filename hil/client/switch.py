@@ -10,10 +10,13 @@ class Switch(ClientBase):
     objects and relations.
     """
 
-    def list(self):
-        """List all nodes that HIL manages """
+    def list(self, fields=None, page_size=None):
+        """List all switches that HIL manages
+
+        See `ClientBase.get_list` for the optional arguments.
+        """
         url = self.object_url('switches')
-        return self.check_response(self.httpClient.request("GET", url))
+        return self.get_list(url, page_size, fields)
 
     def register(self, switch, subtype, switchinfo):
         """Registers a switch with name <switch> and
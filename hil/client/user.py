@@ -13,10 +13,14 @@ class User(ClientBase):
 
     manipulate users related objects and relations.
     """
-    def list(self):
-        """List all users"""
+    def list(self, project=None, fields=None, page_size=None):
+        """List all users
+
+        If `project` is given, only lists its members. See
+        `ClientBase.get_list` for the other optional arguments.
+        """
         url = self.object_url('auth/basic/users')
-        return self.check_response(self.httpClient.request("GET", url))
+        return self.get_list(url, page_size, fields, project=project)
 
     @check_reserved_chars(dont_check=['password', 'is_admin'])
     def create(self, username, password, is_admin):
@@ -75,3 +79,29 @@ class User(ClientBase):
         return self.check_response(
                 self.httpClient.request("PATCH", url, data=payload)
                 )
+
+    def create_token(self, project=None, expires_in=None):
+        """Create an API token for the authenticated user.
+
+        If <project> is given, the token only grants access to that
+        project. <expires_in> is the number of seconds the token is valid
+        for; the server's maximum if omitted.
+
+        Returns a dictionary with the ``token`` and the time it ``expires``.
+        """
+        url = self.object_url('auth/basic/token')
+        payload = {}
+        if project is not None:
+            payload['project'] = project
+        if expires_in is not None:
+            payload['expires_in'] = expires_in
+        return self.check_response(
+                self.httpClient.request("POST", url, data=json.dumps(payload))
+                )
+
+    def delete_token(self):
+        """Revoke the API token the client is authenticated with."""
+        url = self.object_url('auth/basic/token')
+        return self.check_response(
+                self.httpClient.request("DELETE", url)
+                )
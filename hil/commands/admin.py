@@ -4,11 +4,12 @@ from hil.commands import db
 from hil.commands.migrate_ipmi_info import MigrateIpmiInfo
 from hil.commands.util import ensure_not_root
 from hil.flaskapp import app
-from time import sleep
 from flask_script import Manager, Command, Option
 
+import signal
 import sys
 import logging
+import threading
 from click import IntRange
 manager = Manager(app)
 
@@ -40,12 +41,68 @@ class ServeNetworks(Command):
         else:
             sleep_time = 2
 
-        while True:
-            # Empty the journal until it's empty; then delay so we don't tight
-            # loop.
-            while deferred.apply_networking():
-                pass
-            sleep(sleep_time)
+        workers = _network_daemon_int('workers', 1)
+        batch_size = _network_daemon_int('batch_size', 100)
+        lease_time = _network_daemon_int('lease_time',
+                                         deferred.DEFAULT_LEASE_TIME)
+        pool = deferred.SessionPool(
+            _network_daemon_int('session_idle_timeout', 60))
+        scheduler = deferred.SaveScheduler(
+            window=_network_daemon_int('save_window', 60),
+            max_changes=_network_daemon_int('save_after_changes', 100))
+
+        # When told to stop, finish the batch in progress, then save the
+        # switches' configs:
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+        # Start listening before we first look at the journal, so that we
+        # don't miss actions queued while we work:
+        listener = deferred.ActionListener()
+        try:
+            while not stop.is_set():
+                # Empty the journal until it's empty; then wait until we are
+                # told about a new action, polling every sleep_time seconds in
+                # case we miss a notification.
+                while deferred.apply_networking(workers=workers,
+                                                batch_size=batch_size,
+                                                lease_time=lease_time,
+                                                pool=pool,
+                                                scheduler=scheduler,
+                                                stop=stop):
+                    if stop.is_set():
+                        break
+                if stop.is_set():
+                    break
+                deferred.save_due(scheduler, pool)
+                pool.reap()
+                listener.wait(sleep_time)
+        finally:
+            listener.close()
+            # If we were interrupted some other way, part of a batch may
+            # have been applied; don't commit it along with the saves.
+            model.db.session.rollback()
+            try:
+                deferred.save_due(scheduler, pool, force=True)
+            finally:
+                pool.close()
+
+
+def _network_daemon_int(option, default):
+    """Read a positive integer option from the network-daemon section.
+
+    Returns `default` if the option is unset; exits if it isn't usable.
+    """
+    if not (config.cfg.has_section('network-daemon') and
+            config.cfg.has_option('network-daemon', option)):
+        return default
+    try:
+        value = config.cfg.getint('network-daemon', option)
+    except (ValueError):
+        sys.exit("Error: %s set to non-integer value" % option)
+    if value < 1:
+        sys.exit("Error: %s must be at least 1" % option)
+    return value
 
 
 class RunDevelopmentServer(Command):
@@ -47,6 +47,16 @@ def string_is_log_level(option):
                                   'critical', 'fatal')).validate(option)
 
 
+def string_is_positive_int(option):
+    """Check if a string is a positive integer"""
+    return And(str, lambda s: s.isdigit() and int(s) > 0).validate(option)
+
+
+def string_is_nonnegative_float(option):
+    """Check if a string is a non-negative number"""
+    return And(str, Use(float), lambda f: f >= 0).validate(option)
+
+
 def string_has_vlans(option):
     """Check if a string is a valid list of VLANs"""
     for r in option.split(","):
@@ -86,6 +96,13 @@ core_schema = {
     },
     Optional('network-daemon'): {
         Optional('sleep_time'): int,
+        Optional('workers'): string_is_positive_int,
+        Optional('batch_size'): string_is_positive_int,
+        Optional('lease_time'): string_is_positive_int,
+        Optional('notify_socket'): str,
+        Optional('session_idle_timeout'): string_is_positive_int,
+        Optional('save_window'): string_is_positive_int,
+        Optional('save_after_changes'): string_is_positive_int,
     },
     'extensions': {
         Optional(str): '',
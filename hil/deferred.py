@@ -1,12 +1,178 @@
 """Performs deferred networking actions."""
 
 from hil import model
+from hil.config import cfg
+from hil.flaskapp import app
 from hil.model import db
 from hil.errors import SwitchError
+from hil.ext.switches.common import should_save
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
+from sqlalchemy import event
+import errno
 import logging
+import os
+import select
+import socket
+import threading
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
+# Default number of seconds for which a daemon's claim on an action lasts.
+DEFAULT_LEASE_TIME = 300
+
+# Name of the PostgreSQL notification channel used to wake the daemon.
+NOTIFY_CHANNEL = 'hil_networking_action'
+
+_daemon_id = None
+
+
+def _is_pending(action=None):
+    """Return the filter for pending rows of `action`.
+
+    `action` is `model.NetworkingAction`, or an alias of it (the default is
+    the former). The status is compared against a literal, rather than a
+    bound parameter, so that the database can match the filter against the
+    partial index on pending actions.
+    """
+    if action is None:
+        action = model.NetworkingAction
+    return action.status == db.literal_column("'PENDING'")
+
+
+def daemon_id():
+    """Return the name under which this process claims networking actions.
+
+    The name is unique to the process; it includes the host name and pid, to
+    help when debugging.
+    """
+    global _daemon_id
+    pid = os.getpid()
+    if _daemon_id is None or _daemon_id[0] != pid:
+        _daemon_id = (pid, '%s:%d:%s' % (socket.gethostname(),
+                                         pid,
+                                         uuid.uuid4().hex[:8]))
+    return _daemon_id[1]
+
+
+def _notify_socket():
+    """Return the path of the daemon's wakeup socket, or None if unset."""
+    if cfg.has_option('network-daemon', 'notify_socket'):
+        return cfg.get('network-daemon', 'notify_socket')
+    return None
+
+
+def wake_daemon():
+    """Wake the network daemon(s) when the current transaction commits.
+
+    The API server calls this after queueing a networking action, so that
+    the daemon doesn't have to wait for its next poll to notice it.
+
+    On PostgreSQL this sends a NOTIFY, which is delivered only if and when the
+    transaction commits. On other databases, if the network-daemon section of
+    the config has a `notify_socket`, a datagram is sent to that socket after
+    the commit. Otherwise, this does nothing and the daemon will find the
+    action when it next polls the database.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute('NOTIFY ' + NOTIFY_CHANNEL)
+        return
+    path = _notify_socket()
+    if path is None:
+        return
+
+    def _send(session):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.setblocking(False)
+            sock.sendto(b'\0', path)
+        except socket.error as e:
+            # The daemon may just not be running, or already have a wakeup
+            # waiting for it; either way it will find the action by itself.
+            logger.debug('Could not wake network daemon: %s', e)
+        finally:
+            sock.close()
+    event.listen(db.session(), 'after_commit', _send, once=True)
+
+
+class ActionListener(object):
+    """Waits for `wake_daemon` to announce new networking actions.
+
+    The listener starts receiving notifications as soon as it is created, so
+    any which arrive while the daemon is busy will wake the following call to
+    `wait`.
+    """
+
+    def __init__(self):
+        self._conn = None
+        self._sock = None
+        if db.engine.dialect.name == 'postgresql':
+            conn = db.engine.raw_connection()
+            # Take the connection out of the pool, since we change its
+            # transaction behaviour and hang on to it for good:
+            conn.detach()
+            self._conn = conn.connection
+            self._conn.autocommit = True
+            cursor = self._conn.cursor()
+            cursor.execute('LISTEN ' + NOTIFY_CHANNEL)
+            cursor.close()
+        else:
+            path = _notify_socket()
+            if path is not None:
+                try:
+                    os.unlink(path)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+                self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                self._sock.bind(path)
+                self._sock.setblocking(False)
+
+    def wait(self, timeout):
+        """Wait up to `timeout` seconds for a notification.
+
+        Returns True if one arrived, and False if we timed out. All
+        notifications received so far are consumed.
+        """
+        source = self._conn or self._sock
+        try:
+            if source is None:
+                select.select([], [], [], timeout)
+                return False
+            ready, _, _ = select.select([source], [], [], timeout)
+        except select.error as e:
+            # Interrupted by a signal; let the caller see what it was for.
+            if e.args[0] != errno.EINTR:
+                raise
+            return False
+        if not ready:
+            return False
+        if self._conn is not None:
+            self._conn.poll()
+            del self._conn.notifies[:]
+        else:
+            try:
+                while self._sock.recv(4096):
+                    pass
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+        return True
+
+    def close(self):
+        """Stop listening for notifications."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._sock is not None:
+            path = self._sock.getsockname()
+            self._sock.close()
+            self._sock = None
+            os.unlink(path)
+
 
 class DaemonSession(object):
     """A daemon session tracks switch sessions during a call to
@@ -15,10 +181,22 @@ class DaemonSession(object):
     When applying a networking action, if the DaemonSession does not
     already have a switch session for the relevant switch, it will
     create one, and cache it for next time.
+
+    If `pool` is not None, it is a `SessionPool` from which switch sessions
+    are taken, and to which they are returned by `close`.
+
+    If `scheduler` is not None, it is a `SaveScheduler` which takes over
+    saving the switches' running configs from their sessions.
     """
 
-    def __init__(self):
+    def __init__(self, pool=None, scheduler=None):
         self.switch_sessions = {}
+        self.pool = pool
+        self.scheduler = scheduler
+        # Labels of the switches whose sessions were reused from the pool:
+        self.reused = set()
+        # Labels of the switches whose saves the scheduler is handling:
+        self.scheduled = set()
 
     def handle_action(self, action):
         """apply the networking action ``action``."""
@@ -31,19 +209,95 @@ class DaemonSession(object):
         else:
             getattr(self, action.type)(action)
 
+    def handle_actions(self, actions):
+        """Apply the networking actions ``actions``, in order.
+
+        Where there are several actions for the same switch, they are passed
+        to its session together, via `apply_port_changes`.
+        """
+        by_switch = OrderedDict()
+        for action in actions:
+            if action.type in model.NetworkingAction.legal_types and \
+                    action.nic.port:
+                by_switch.setdefault(action.nic.port.owner_id, []) \
+                    .append(action)
+            else:
+                self.handle_action(action)
+
+        for switch_actions in by_switch.values():
+            if len(switch_actions) == 1:
+                self.handle_action(switch_actions[0])
+                continue
+            results = self.call(
+                switch_actions[0].nic.port.owner,
+                'apply_port_changes',
+                [_port_change(action) for action in switch_actions])
+            for action, error in zip(switch_actions, results):
+                self._record_result(action, error)
+
     def modify_port(self, action):
         """Apply a modify_port action."""
-        session = self.get_session(action.nic.port.owner)
+        change = _port_change(action)
+        try:
+            self.call(action.nic.port.owner, 'modify_port', *change)
+        except SwitchError as e:
+            self._record_result(action, e)
+        else:
+            self._record_result(action, None)
 
-        if action.new_network is None:
-            network_id = None
+    def revert_port(self, action):
+        """Apply a revert_port action."""
+        try:
+            self.call(action.nic.port.owner, 'revert_port',
+                      action.nic.port.label)
+        except SwitchError as e:
+            self._record_result(action, e)
         else:
-            network_id = action.new_network.network_id
+            self._record_result(action, None)
+
+    def call(self, switch, method, *args):
+        """Call ``method`` on the session for ``switch``, with ``args``.
 
+        If a session reused from the pool fails with anything other than a
+        SwitchError, the connection has probably gone stale; in that case we
+        log in again and retry once.
+        """
+        session = self.get_session(switch)
         try:
-            session.modify_port(action.nic.port.label,
-                                action.channel,
-                                network_id)
+            return getattr(session, method)(*args)
+        except SwitchError:
+            raise
+        except Exception:
+            if switch.label not in self.reused:
+                raise
+            logger.warn('Pooled session for switch %s failed; reconnecting.',
+                        switch.label, exc_info=True)
+        self.pool.discard(self.switch_sessions.pop(switch.label))
+        self.reused.discard(switch.label)
+        session = self.get_session(switch)
+        return getattr(session, method)(*args)
+
+    def _record_result(self, action, error):
+        """Update the database once ``action`` has been applied.
+
+        ``error`` is the SwitchError the switch reported, or None if the
+        action succeeded.
+        """
+        if error is not None:
+            action.status = 'ERROR'
+            if action.type == 'modify_port':
+                logger.error('Modify port failed on port %s of switch %s',
+                             action.nic.port.label,
+                             action.nic.port.owner.label)
+            else:
+                logger.error('Revert port failed on port %s of switch %s',
+                             action.nic.port.label,
+                             action.nic.port.owner.label)
+            return
+
+        if action.nic.port.owner.label in self.scheduled:
+            self.scheduler.changed(action.nic.port.owner)
+        if action.type == 'modify_port':
             if action.new_network is None:
                 model.NetworkAttachment.query \
                     .filter_by(nic=action.nic, channel=action.channel)\
@@ -54,22 +308,9 @@ class DaemonSession(object):
                     network=action.new_network,
                     channel=action.channel))
             action.status = 'DONE'
-        except SwitchError:
-            action.status = 'ERROR'
-            logger.error('Modify port failed on port %s of switch %s',
-                         action.nic.port.label, action.nic.port.owner.label)
-
-    def revert_port(self, action):
-        """Apply a revert_port action."""
-        session = self.get_session(action.nic.port.owner)
-        try:
-            session.revert_port(action.nic.port.label)
+        else:
             model.NetworkAttachment.query.filter_by(nic=action.nic).delete()
             action.status = 'DONE'
-        except SwitchError:
-            action.status = 'ERROR'
-            logger.error('Revert port failed on port %s of switch %s',
-                         action.nic.port.label, action.nic.port.owner.label)
 
     def get_session(self, switch):
         """Get a session for the switch.
@@ -78,17 +319,241 @@ class DaemonSession(object):
         return the cached session.
         """
         if switch.label not in self.switch_sessions:
-            self.switch_sessions[switch.label] = switch.session()
+            if self.pool is None:
+                session = switch.session()
+            else:
+                session, reused = self.pool.get(switch)
+                if reused:
+                    self.reused.add(switch.label)
+            if self.scheduler is not None and self.scheduler.adopt(session):
+                self.scheduled.add(switch.label)
+            self.switch_sessions[switch.label] = session
         return self.switch_sessions[switch.label]
 
-    def close(self):
-        """Shut down all of the open switch sessions."""
-        for session in self.switch_sessions.values():
+    def drop(self, switch):
+        """Get rid of the session for ``switch``, which has failed.
+
+        The session is disconnected (as far as it can be), rather than kept
+        or returned to the pool.
+        """
+        session = self.switch_sessions.pop(switch.label, None)
+        self.reused.discard(switch.label)
+        self.scheduled.discard(switch.label)
+        if session is None:
+            return
+        try:
             session.disconnect()
+        except Exception:
+            logger.warn('Error while disconnecting session %r',
+                        session, exc_info=True)
+
+    def close(self):
+        """Shut down all of the open switch sessions.
+
+        If we have a pool, the sessions are returned to it instead.
+        """
+        for label, session in self.switch_sessions.items():
+            if self.pool is None:
+                session.disconnect()
+            else:
+                self.pool.put(label, session)
         self.switch_sessions = {}
+        self.reused = set()
+        self.scheduled = set()
 
 
-def apply_networking():
+class SessionPool(object):
+    """Keeps switch sessions open from one call to apply_networking to the
+    next, so that the daemon doesn't have to log in to a switch again for
+    each burst of actions.
+
+    Sessions which have been idle for `idle_timeout` seconds are disconnected
+    by `reap`. Since console drivers save the switch's configuration when
+    disconnecting, this also puts off saving until the switch has gone quiet.
+
+    Sessions which are the switch object itself (as with drivers that don't
+    hold a connection open) are not pooled, since the switch object belongs
+    to a database session which won't outlive the call to apply_networking.
+
+    The pool may be used from several threads at once, though each session
+    is only ever in use by one of them.
+    """
+
+    def __init__(self, idle_timeout):
+        self.idle_timeout = idle_timeout
+        # Switch label -> (session, time at which it was put back):
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, switch):
+        """Get a session for ``switch``.
+
+        Returns a pair (session, reused), where `reused` says whether the
+        session came from the pool, rather than being newly created.
+        """
+        with self._lock:
+            session, _ = self._idle.pop(switch.label, (None, None))
+        if session is not None:
+            # The switch object the session was made with belongs to a
+            # database session that has since ended:
+            session.switch = switch
+            if session.is_alive():
+                return session, True
+            logger.info('Pooled session for switch %s is dead; '
+                        'reconnecting.', switch.label)
+            self.discard(session)
+        return switch.session(), False
+
+    def put(self, label, session):
+        """Return ``session``, for the switch named ``label``, to the pool."""
+        if isinstance(session, model.Switch):
+            session.disconnect()
+            return
+        with self._lock:
+            self._idle[label] = (session, time.time())
+
+    def discard(self, session):
+        """Get rid of a session which has been taken from the pool.
+
+        Errors while disconnecting it are logged and otherwise ignored, since
+        the session may well be broken.
+        """
+        try:
+            session.disconnect()
+        except Exception:
+            logger.warn('Error while disconnecting session %r',
+                        session, exc_info=True)
+
+    def reap(self):
+        """Disconnect the sessions which have been idle for too long."""
+        now = time.time()
+        with self._lock:
+            expired = [label for label, (_, last_used) in self._idle.items()
+                       if now - last_used >= self.idle_timeout]
+            sessions = [self._idle.pop(label)[0] for label in expired]
+        for session in sessions:
+            self.discard(session)
+
+    def close(self):
+        """Disconnect all of the sessions in the pool."""
+        with self._lock:
+            sessions = [session for session, _ in self._idle.values()]
+            self._idle = {}
+        for session in sessions:
+            self.discard(session)
+
+
+class SaveScheduler(object):
+    """Decides when the network daemon saves switches' running configs.
+
+    Saving the running config can take several seconds, so rather than
+    saving after every burst of changes, switches are marked as having a save
+    pending, and saved once either `window` seconds have passed since the
+    first unsaved change, or `max_changes` changes have built up. `save_due`
+    does the saving; the daemon also calls it with ``force=True`` when
+    shutting down.
+
+    Only sessions whose drivers save on disconnect (see
+    `SwitchSession.save_on_disconnect`) are handled; `adopt` turns that off
+    for each session.
+    """
+
+    def __init__(self, window, max_changes):
+        self.window = window
+        self.max_changes = max_changes
+        # Switch label -> (time of first unsaved change, number of changes):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def adopt(self, session):
+        """Take over saving the running config for ``session``.
+
+        Returns True if the scheduler will save the switch's config, and
+        False if the session's driver doesn't save it at all.
+        """
+        if not session.save_on_disconnect:
+            # Either the driver never saves, or we've adopted this (pooled)
+            # session before; only the class knows which:
+            if not type(session).save_on_disconnect:
+                return False
+        session.save_on_disconnect = False
+        return should_save(session)
+
+    def changed(self, switch):
+        """Record a change to ``switch``, which will need saving."""
+        switch.save_pending = True
+        with self._lock:
+            since, count = self._pending.get(switch.label, (time.time(), 0))
+            self._pending[switch.label] = (since, count + 1)
+
+    def due(self, force=False):
+        """Return the labels of the switches which should be saved now.
+
+        If ``force`` is True, this is every switch with changes pending.
+        """
+        now = time.time()
+        with self._lock:
+            return [label for label, (since, count) in self._pending.items()
+                    if force or
+                    count >= self.max_changes or
+                    now - since >= self.window]
+
+    def saved(self, label):
+        """Record that the switch named ``label`` has been saved."""
+        with self._lock:
+            self._pending.pop(label, None)
+
+
+def save_due(scheduler, pool=None, force=False):
+    """Save the running configs of the switches `scheduler` says are due.
+
+    If ``force`` is True, save every switch that has changes pending.
+    Sessions are taken from ``pool`` if it is not None.
+    """
+    labels = scheduler.due(force)
+    if not labels:
+        return
+    session = DaemonSession(pool, scheduler)
+    try:
+        for switch in model.Switch.query \
+                .filter(model.Switch.label.in_(labels)).all():
+            try:
+                session.call(switch, 'save_running_config')
+            except Exception:
+                # Carry on with the other switches. This one still has its
+                # save pending, so we'll try it again next time.
+                logger.error('Saving the running config of switch %s '
+                             'failed', switch.label, exc_info=True)
+                session.drop(switch)
+                labels.remove(switch.label)
+                continue
+            switch.last_saved = datetime.utcnow()
+            switch.save_pending = False
+            db.session.commit()
+            labels.remove(switch.label)
+            scheduler.saved(switch.label)
+    finally:
+        db.session.commit()
+        session.close()
+    # Whatever is left must have been deleted in the meantime:
+    for label in labels:
+        scheduler.saved(label)
+
+
+def _port_change(action):
+    """Return the `model.PortChange` that carries out ``action``."""
+    if action.type == 'revert_port':
+        return model.PortChange(action.nic.port.label, None, None)
+    if action.new_network is None:
+        network_id = None
+    else:
+        network_id = action.new_network.network_id
+    return model.PortChange(action.nic.port.label, action.channel, network_id)
+
+
+def apply_networking(workers=1, batch_size=1,
+                     lease_time=DEFAULT_LEASE_TIME, pool=None,
+                     scheduler=None, stop=None):
     """Do each networking action in the journal, then cross them off.
 
     Returns False if the journal was empty, and True if there were journal
@@ -104,24 +569,50 @@ def apply_networking():
     returns immediately, the server should sleep, because there was no time for
     new entries to be added.  This keeps the networking server from
     tight-looping.
+
+    If `workers` is greater than 1, the pending actions are split up by the
+    switch they affect, and up to `workers` switches are worked on at the same
+    time, each by its own thread with its own `DaemonSession`. Actions on any
+    one switch are still applied in journal order.
+
+    Actions are read from the journal `batch_size` at a time; the results of
+    each batch are committed together in a single transaction.
+
+    Several daemons may call this function against the same database. Each
+    batch of actions is first claimed, for `lease_time` seconds; see
+    `_claim_actions` for details.
+
+    If `pool` is not None, it is a `SessionPool` to take switch sessions from
+    and return them to, rather than connecting to each switch afresh.
+
+    If `scheduler` is not None, it is a `SaveScheduler` which is told about
+    the changes made, and takes care of saving the switches' configs (see
+    `save_due`).
+
+    If `stop` is not None, it is a ``threading.Event``; once it is set, we
+    return after the batch in progress, rather than starting another.
     """
+    if workers > 1:
+        return _apply_networking_parallel(workers, batch_size, lease_time,
+                                          pool, scheduler, stop)
 
-    action = model.NetworkingAction.query \
-        .order_by(model.NetworkingAction.id) \
-        .filter_by(status='PENDING').first()
+    actions = _next_actions(batch_size, lease_time)
 
-    if action is None:
+    if not actions:
         db.session.commit()
         return False
 
-    session = DaemonSession()
-    while action is not None:
-        session.handle_action(action)
+    session = DaemonSession(pool, scheduler)
+    while actions:
+        # The api refuses new actions for a nic that has one pending (see
+        # `hil.api.check_pending_action`), so a batch never holds two actions
+        # for the same nic, and there is nothing to fold together here.
+        session.handle_actions(actions)
         db.session.commit()
-        # Get the next action
-        action = model.NetworkingAction.query \
-            .order_by(model.NetworkingAction.id)\
-            .filter_by(status='PENDING').first()
+        if _stopping(stop):
+            break
+        # Get the next batch
+        actions = _next_actions(batch_size, lease_time)
 
     # the last statement in the while loop opens a new db session that we must
     # close when we exit the loop.
@@ -129,3 +620,167 @@ def apply_networking():
 
     session.close()
     return True
+
+
+def _busy_switches(now):
+    """Return a query for the ids of switches on which another daemon holds
+    a live lease.
+    """
+    # This is used as a subquery of queries on the same tables, so it uses
+    # aliases to keep from being correlated with the outer query:
+    action = db.aliased(model.NetworkingAction)
+    nic = db.aliased(model.Nic)
+    port = db.aliased(model.Port)
+    return db.session.query(port.owner_id) \
+        .join(nic, nic.port_id == port.id) \
+        .join(action, action.nic_id == nic.id) \
+        .filter(_is_pending(action),
+                action.claimed_by != daemon_id(),
+                action.lease_expires > now)
+
+
+def _claim_actions(limit, lease_time, switch_id=None):
+    """Claim (up to) the `limit` oldest pending actions that we may work on.
+
+    A daemon owns a switch for as long as it holds an unexpired lease on any
+    pending action on that switch; other daemons leave the switch alone until
+    then. This keeps the actions on each switch in journal order, no matter
+    how many daemons there are. If a daemon dies, its leases run out after
+    `lease_time` seconds, and another daemon picks up its work.
+
+    To stop two daemons from claiming the same switch at once, the candidate
+    switches' rows are locked (skipping any that another daemon has locked),
+    and the leases on them are checked again before claiming. This relies on
+    ``SELECT ... FOR UPDATE SKIP LOCKED``, so running more than one daemon is
+    only supported with PostgreSQL.
+
+    If `switch_id` is not None, only actions on ports of that switch are
+    considered.
+
+    Returns the ids of the claimed actions. The claim is committed before
+    returning.
+    """
+    now = datetime.utcnow()
+
+    query = db.session \
+        .query(model.NetworkingAction.id, model.Port.owner_id) \
+        .join(model.Nic, model.NetworkingAction.nic_id == model.Nic.id) \
+        .join(model.Port, model.Nic.port_id == model.Port.id) \
+        .filter(_is_pending(),
+                ~model.Port.owner_id.in_(_busy_switches(now))) \
+        .order_by(model.NetworkingAction.id)
+    if switch_id is not None:
+        query = query.filter(model.Port.owner_id == switch_id)
+    candidates = query.limit(limit).all()
+
+    if candidates:
+        switch_ids = {owner_id for _, owner_id in candidates}
+        locked = {row[0] for row in db.session.query(model.Switch.id)
+                  .filter(model.Switch.id.in_(switch_ids))
+                  .with_for_update(skip_locked=True)}
+        # Another daemon may have claimed some of these switches between our
+        # first query and taking the locks:
+        if locked:
+            locked -= {row[0] for row in _busy_switches(now)}
+        candidates = [action_id for action_id, owner_id in candidates
+                      if owner_id in locked]
+    if candidates:
+        model.NetworkingAction.query \
+            .filter(model.NetworkingAction.id.in_(candidates),
+                    _is_pending()) \
+            .update({'claimed_by': daemon_id(),
+                     'lease_expires': now + timedelta(seconds=lease_time)},
+                    synchronize_session=False)
+    db.session.commit()
+    return candidates
+
+
+def _next_actions(limit, lease_time, switch_id=None):
+    """Claim and return (up to) the `limit` oldest pending actions.
+
+    The nic, port, switch and network that each action refers to are loaded
+    by the same query, rather than one at a time when they are first used.
+
+    If `switch_id` is not None, only actions on ports of that switch are
+    considered.
+    """
+    action_ids = _claim_actions(limit, lease_time, switch_id)
+    if not action_ids:
+        return []
+    return model.NetworkingAction.query \
+        .options(db.joinedload(model.NetworkingAction.nic)
+                 .joinedload(model.Nic.port)
+                 .joinedload(model.Port.owner),
+                 db.joinedload(model.NetworkingAction.new_network)) \
+        .filter(model.NetworkingAction.id.in_(action_ids),
+                _is_pending(),
+                model.NetworkingAction.claimed_by == daemon_id()) \
+        .order_by(model.NetworkingAction.id) \
+        .all()
+
+
+def _stopping(stop):
+    """Return whether the `stop` event passed to `apply_networking` is set.
+    """
+    return stop is not None and stop.is_set()
+
+
+def _apply_networking_parallel(workers, batch_size, lease_time, pool,
+                               scheduler, stop):
+    """Implement `apply_networking` for more than one worker.
+
+    Collects the switches which have pending actions that no other daemon
+    holds a lease on, and drains each of them with `_drain_switch` on a
+    bounded pool of threads.
+    """
+    switch_ids = [row[0] for row in db.session
+                  .query(model.Port.owner_id)
+                  .join(model.Nic, model.Nic.port_id == model.Port.id)
+                  .join(model.NetworkingAction,
+                        model.NetworkingAction.nic_id == model.Nic.id)
+                  .filter(_is_pending(),
+                          ~model.Port.owner_id.in_(
+                              _busy_switches(datetime.utcnow())))
+                  .distinct()]
+    db.session.commit()
+
+    if not switch_ids:
+        return False
+
+    threads = ThreadPool(min(workers, len(switch_ids)))
+    try:
+        done = threads.map(lambda switch_id:
+                           _drain_switch(switch_id, batch_size, lease_time,
+                                         pool, scheduler, stop),
+                           switch_ids)
+    finally:
+        threads.close()
+        threads.join()
+    return any(done)
+
+
+def _drain_switch(switch_id, batch_size, lease_time, pool, scheduler,
+                  stop):
+    """Apply all of the pending actions for the switch `switch_id`.
+
+    This runs in a worker thread; it gets its own app context (and therefore
+    its own database session), as well as its own `DaemonSession`.
+
+    Returns True if any actions were performed, False otherwise.
+    """
+    done = False
+    with app.app_context():
+        session = DaemonSession(pool, scheduler)
+        try:
+            actions = _next_actions(batch_size, lease_time, switch_id)
+            while actions:
+                done = True
+                session.handle_actions(actions)
+                db.session.commit()
+                if _stopping(stop):
+                    break
+                actions = _next_actions(batch_size, lease_time, switch_id)
+            db.session.commit()
+        finally:
+            session.close()
+    return done
@@ -1,15 +1,49 @@
 """Auth plugin using usernames & passwords in the DB, with HTTP basic auth.
 
-Includes API calls for managing users.
+Includes API calls for managing users, and for issuing API tokens (see
+`token_create`), which can be sent as ``Authorization: Bearer <token>``
+instead of a username and password.
+
+Checking a password against its sha512_crypt hash is deliberately slow, so
+credentials which have been verified are remembered for a little while (see
+`CredentialCache`). The following options in this extension's config section
+control this:
+
+    * ``credential_cache_ttl``: how many seconds verified credentials are
+      remembered for. 0 disables the cache. Default 60.
+    * ``credential_cache_size``: the maximum number of credentials
+      remembered. Default 1024.
+
+Tokens are much cheaper to check; they are stored as an HMAC-SHA256 digest,
+so the database never holds a usable token. The options for these are:
+
+    * ``token_key``: the key for the HMAC, at least 16 characters long.
+      Tokens are only enabled if this is set. All API servers sharing a
+      database must use the same key; changing it revokes all tokens.
+    * ``token_lifetime``: the maximum (and default) number of seconds a
+      token is valid for. Default 3600.
 """
 from hil import api, model, auth, errors
+from hil.config import cfg, core_schema, string_is_nonnegative_float, \
+    string_is_positive_int
 from hil.model import db
 from hil.auth import get_auth_backend
 from hil.rest import rest_call, local, ContextLogger
+from hil.listing import list_schema, paginate, parse_fields, \
+    rows_by_name
 from passlib.hash import sha512_crypt
-from schema import Schema, Optional
+from schema import Schema, Optional, And
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload
+import base64
 import flask
+import hashlib
+import hmac
 import logging
+import os
+import threading
+import time
 from os.path import join, dirname
 from hil.migrations import paths
 from hil.model import BigIntegerType
@@ -19,6 +53,13 @@ logger = ContextLogger(logging.getLogger(__name__), {})
 
 paths[__name__] = join(dirname(__file__), 'migrations', 'database')
 
+core_schema[__name__] = {
+    Optional('credential_cache_ttl'): string_is_nonnegative_float,
+    Optional('credential_cache_size'): string_is_positive_int,
+    Optional('token_lifetime'): string_is_positive_int,
+    Optional('token_key'): And(str, lambda key: len(key) >= 16),
+}
+
 
 class User(db.Model):
     """A user of the HIL.
@@ -52,6 +93,86 @@ class User(db.Model):
     def set_password(self, password):
         """Set the user's password to `password` (which must be plaintext)."""
         self.hashed_password = sha512_crypt.encrypt(password)
+        credential_cache.invalidate(self.label)
+
+
+class CredentialCache(object):
+    """A cache of recently verified usernames & passwords.
+
+    Entries are keyed by an HMAC of the username and password, under a key
+    which is generated at random for each process, so the cache never holds
+    the passwords themselves. Each entry records the user's password hash at
+    the time it was verified; a hit only counts if the hash in the database
+    is still the same, so a password changed (or a user re-created) by
+    another process can't be bypassed through a stale entry.
+
+    Entries expire after ``credential_cache_ttl`` seconds, and once there are
+    more than ``credential_cache_size`` of them the oldest are dropped.
+    """
+
+    def __init__(self):
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _option(name, default, kind):
+        """Read the option `name` from our config section."""
+        if cfg.has_option(__name__, name):
+            return kind(cfg.get(__name__, name))
+        return default
+
+    def _digest(self, username, password):
+        """Return the cache key for `username` and `password`."""
+        message = u'%s\0%s' % (username, password)
+        return hmac.new(self._key, message.encode('utf-8'),
+                        hashlib.sha256).digest()
+
+    def verify(self, user, password):
+        """Return whether `password` is `user`'s password.
+
+        This only calls ``user.verify_password`` if there is no valid entry
+        for the credentials; if that succeeds, an entry is added.
+        """
+        ttl = self._option('credential_cache_ttl', 60.0, float)
+        if ttl == 0:
+            return user.verify_password(password)
+
+        digest = self._digest(user.label, password)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+        if entry is not None:
+            _, hashed_password, expires = entry
+            if expires > now and hashed_password == user.hashed_password:
+                return True
+
+        if not user.verify_password(password):
+            return False
+
+        size = self._option('credential_cache_size', 1024, int)
+        with self._lock:
+            self._entries.pop(digest, None)
+            self._entries[digest] = (user.label, user.hashed_password,
+                                     now + ttl)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+        return True
+
+    def invalidate(self, label):
+        """Forget all entries for the user named `label`."""
+        with self._lock:
+            for digest, entry in list(self._entries.items()):
+                if entry[0] == label:
+                    del self._entries[digest]
+
+    def clear(self):
+        """Forget all entries."""
+        with self._lock:
+            self._entries.clear()
+
+
+credential_cache = CredentialCache()
 
 
 # A joining table for users and projects, which have a many to many
@@ -61,16 +182,83 @@ user_projects = db.Table('user_projects',
                          db.Column('project_id', db.ForeignKey('project.id')))
 
 
-@rest_call('GET', '/auth/basic/users', schema=Schema({}))
-def list_users():
-    """List all users with database authentication"""
+class Token(db.Model):
+    """An API token, issued to a user by `token_create`.
+
+    A token grants the same access as its user's password, unless it is
+    scoped to a project, in which case it only grants access to that
+    project (and only while the user still has access to it).
+    """
+    id = db.Column(BigIntegerType, primary_key=True)
+    # The HMAC of the token; see `token_digest`:
+    digest = db.Column(db.String, nullable=False, unique=True)
+    expires = db.Column(db.DateTime, nullable=False, index=True)
+
+    user_id = db.Column(db.ForeignKey('user.id'), nullable=False)
+    user = db.relationship('User',
+                           backref=db.backref('tokens',
+                                              cascade='all, delete-orphan'))
+
+    project_id = db.Column(db.ForeignKey('project.id'), nullable=True)
+    project = db.relationship('Project',
+                              backref=db.backref('tokens',
+                                                 cascade='all, delete-orphan'))
+
+
+def tokens_enabled():
+    """Return whether API tokens are enabled, i.e. ``token_key`` is set.
+
+    Without a key, the digest would just be a hash of the token, which
+    anyone with a copy of the database could check guesses against.
+    """
+    return cfg.has_option(__name__, 'token_key')
+
+
+def token_digest(token):
+    """Return the digest under which `token` is stored.
+
+    Only valid if `tokens_enabled`.
+    """
+    key = cfg.get(__name__, 'token_key')
+    if isinstance(token, unicode):
+        token = token.encode('utf-8')
+    return hmac.new(key, token, hashlib.sha256).hexdigest()
+
+
+@rest_call('GET', '/auth/basic/users', schema=list_schema({
+    Optional('project'): basestring,
+}))
+def list_users(project=None, limit=None, cursor=None, fields=None):
+    """List all users with database authentication
+
+    If `project` is not None, only lists that project's members.
+
+    Supports pagination, and selecting the fields (``is_admin`` and
+    ``projects``) of each user; see `hil.listing`.
+    """
     get_auth_backend().require_admin()
-    users = User.query.all()
+    fields = parse_fields(fields, ['is_admin', 'projects'])
+    if fields is None:
+        fields = ['is_admin', 'projects']
+    query = db.session.query(User.label, User.is_admin)
+    if project is not None:
+        project = api.get_or_404(model.Project, project)
+        query = query.filter(User.projects.contains(project))
+    users = paginate(query, User.label, limit, cursor)
+
+    projects = {}
+    if 'projects' in fields:
+        projects = rows_by_name(
+            db.session.query(User.label, model.Project.label)
+            .join(model.Project, User.projects)
+            .order_by(model.Project.label),
+            User.label, [u.label for u in users])
+
     result = {}
     for u in users:
         user = {'is_admin': u.is_admin,
-                'projects': sorted(p.label for p in u.projects)}
-        result[u.label] = user
+                'projects': [label for _, label in projects.get(u.label, [])]}
+        result[u.label] = {field: user[field] for field in fields}
     return json.dumps(result, sort_keys=True)
 
 
@@ -109,6 +297,7 @@ def user_delete(user):
 
     db.session.delete(user)
     db.session.commit()
+    credential_cache.invalidate(user.label)
 
 
 @rest_call('POST', '/auth/basic/user/<user>/add_project', Schema({
@@ -161,16 +350,79 @@ def user_set_admin(user, is_admin):
         raise errors.IllegalStateError("Cannot set own admin status")
     user.is_admin = is_admin
     db.session.commit()
+    credential_cache.invalidate(user.label)
+
+
+@rest_call('POST', '/auth/basic/token', Schema({
+    Optional('project'): basestring,
+    Optional('expires_in'): And(int, lambda n: n > 0),
+}))
+def token_create(project=None, expires_in=None):
+    """Issue an API token to the authenticated user.
+
+    If `project` is not None, the token only grants access to that project.
+    The token expires after `expires_in` seconds, which defaults to (and may
+    not be more than) the ``token_lifetime`` option.
+
+    Tokens can only be created by authenticating with a password, and only
+    if they are enabled (see the module docstring).
+    """
+    if not tokens_enabled():
+        raise errors.IllegalStateError("API tokens are not enabled.")
+    if local.auth is None or getattr(local, 'auth_token', None) is not None:
+        raise errors.AuthorizationError(
+            "API tokens must be requested with a username and password.")
+    lifetime = cfg.getint(__name__, 'token_lifetime') \
+        if cfg.has_option(__name__, 'token_lifetime') else 3600
+    if expires_in is None:
+        expires_in = lifetime
+    elif expires_in > lifetime:
+        raise errors.BadArgumentError(
+            "Tokens may not be valid for more than %d seconds." % lifetime)
+    if project is not None:
+        project = api.get_or_404(model.Project, project)
+        get_auth_backend().require_project_access(project)
+
+    now = datetime.utcnow()
+    # Take the chance to clear out tokens which have expired:
+    Token.query.filter(Token.expires <= now).delete()
+
+    token = base64.urlsafe_b64encode(os.urandom(32)).rstrip('=')
+    expires = now + timedelta(seconds=expires_in)
+    db.session.add(Token(digest=token_digest(token),
+                         expires=expires,
+                         user=local.auth,
+                         project=project))
+    db.session.commit()
+    return json.dumps({'token': token, 'expires': expires.isoformat()})
+
+
+@rest_call('DELETE', '/auth/basic/token', Schema({}))
+def token_delete():
+    """Revoke the API token used to make this request."""
+    token = getattr(local, 'auth_token', None)
+    if token is None:
+        raise errors.BadArgumentError("This request was not made with an "
+                                      "API token.")
+    db.session.delete(token)
+    db.session.commit()
 
 
 class DatabaseAuthBackend(auth.AuthBackend):
     """
     Auth backend using basic auth, with usernames & passwords stored in the DB.
+
+    Also accepts API tokens issued by `token_create`.
     """
 
     def authenticate(self):
         # pylint: disable=missing-docstring
+        self.invalidate_context()
         local.auth = None
+        local.auth_token = None
+        header = flask.request.headers.get('Authorization', '')
+        if header.startswith('Bearer '):
+            return self._authenticate_token(header[len('Bearer '):].strip())
         if flask.request.authorization is None:
             return False
         authorization = flask.request.authorization
@@ -178,7 +430,7 @@ class DatabaseAuthBackend(auth.AuthBackend):
             return False
 
         user = api.get_or_404(User, authorization.username)
-        if user.verify_password(authorization.password):
+        if credential_cache.verify(user, authorization.password):
             local.auth = user
             logger.info("Successful authentication for user %r", user.label)
             return True
@@ -186,13 +438,60 @@ class DatabaseAuthBackend(auth.AuthBackend):
             logger.info("Failed authentication for user %r", user.label)
             return False
 
+    @staticmethod
+    def _authenticate_token(token):
+        """Authenticate the request with the API token `token`."""
+        if not tokens_enabled():
+            logger.info("Refused an API token, since tokens are not enabled")
+            return False
+        token = Token.query \
+            .options(joinedload(Token.user)) \
+            .filter_by(digest=token_digest(token)) \
+            .filter(Token.expires > datetime.utcnow()) \
+            .first()
+        if token is None:
+            logger.info("Failed authentication with an API token")
+            return False
+        local.auth = token.user
+        local.auth_token = token
+        logger.info("Successful authentication for user %r with an API "
+                    "token", token.user.label)
+        return True
+
     def _have_admin(self):
         user = local.auth
-        return user is not None and user.is_admin
+        if user is None or not user.is_admin:
+            return False
+        token = getattr(local, 'auth_token', None)
+        return token is None or token.project_id is None
 
     def _have_project_access(self, project):
         user = local.auth
-        return user is not None and project in user.projects
+        if user is None:
+            return False
+        token = getattr(local, 'auth_token', None)
+        if token is None or token.project_id is None:
+            return project in user.projects
+        # A token scoped to a project only grants access to that project,
+        # as long as its user still has access to it:
+        return token.project_id == project.id and \
+            (user.is_admin or project in user.projects)
+
+    def _project_ids(self):
+        user = local.auth
+        if user is None:
+            return frozenset()
+        token = getattr(local, 'auth_token', None)
+        if token is not None and token.project_id is not None and \
+                user.is_admin:
+            return frozenset([token.project_id])
+        ids = frozenset(
+            project_id for project_id, in
+            db.session.query(user_projects.c.project_id)
+            .filter(user_projects.c.user_id == user.id))
+        if token is not None and token.project_id is not None:
+            return ids & frozenset([token.project_id])
+        return ids
 
 
 def setup(*args, **kwargs):
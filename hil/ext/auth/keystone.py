@@ -1,15 +1,29 @@
 """Keystone authentication backend.
 
 This is a thin wrapper around the `keystonemiddleware` library.
+
+Whether an OpenStack project is registered with HIL is remembered for
+``project_cache_ttl`` seconds (default 10; 0 disables this), set in this
+extension's config section. Projects created or deleted by this process
+are seen as soon as that transaction commits; those created or deleted by
+other API servers may take that long to be seen. Only whether the project
+exists is remembered; its id is always read from the database, since it
+changes if the project is deleted and created again.
 """
 from keystonemiddleware.auth_token import filter_factory
 from flask import request
+from schema import Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
 from hil.flaskapp import app
-from hil.config import cfg, core_schema, string_is_web_url
-from hil.model import Project
+from hil.config import cfg, core_schema, string_is_web_url, \
+    string_is_nonnegative_float
+from hil.model import db, Project
 from hil import auth, rest
 import logging
 import sys
+import threading
+import time
 
 logger = rest.ContextLogger(logging.getLogger(__name__), {})
 
@@ -21,15 +35,103 @@ core_schema[__name__] = {
     'project_name': str,
     'admin_user': str,
     'admin_password': str,
+    Optional('project_cache_ttl'): string_is_nonnegative_float,
 }
 
+# Options in our config section which are ours, rather than the
+# middleware's:
+_OWN_OPTIONS = ('project_cache_ttl',)
 
-class KeystoneAuthBackend(auth.AuthBackend):
-    """Authenticate with keystone."""
 
-    def authenticate(self):
-        # pylint: disable=missing-docstring
+class ProjectCache(object):
+    """Remembers which projects are registered with HIL, by label.
+
+    Entries expire after ``project_cache_ttl`` seconds, and are dropped as
+    soon as a transaction creating or deleting a project with the same label
+    commits in this process.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        # Bumped whenever entries are dropped. A lookup only stores its
+        # result if this hasn't changed since it started, since otherwise
+        # its query may have run before the change it would be hiding:
+        self._generation = 0
+
+    def is_registered(self, label):
+        """Return whether there is a project named `label`."""
+        ttl = cfg.getfloat(__name__, 'project_cache_ttl') \
+            if cfg.has_option(__name__, 'project_cache_ttl') else 10.0
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(label)
+            generation = self._generation
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        registered = db.session.query(
+            Project.query.filter_by(label=label).exists()).scalar()
+        if ttl > 0:
+            with self._lock:
+                if self._generation == generation:
+                    self._entries[label] = (registered, now + ttl)
+        return registered
+
+    def invalidate(self, label):
+        """Forget whether a project named `label` exists."""
+        with self._lock:
+            self._entries.pop(label, None)
+            self._generation += 1
+
+    def clear(self):
+        """Forget all entries."""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+
+project_cache = ProjectCache()
+
+# Key in ``Session.info`` under which we collect the labels of projects created
+# or deleted in the session's current transaction:
+_CHANGED_LABELS = __name__ + '.changed_labels'
+
+
+@event.listens_for(Project, 'after_insert')
+@event.listens_for(Project, 'after_delete')
+def _record_project_change(mapper, connection, project):
+    """Note that `project` was created or deleted in its session.
+
+    This happens at flush, when other requests can't see the change yet; if
+    we dropped the cache entry now, one of them could put the old answer
+    right back. So we wait for the commit (see `_invalidate_projects`).
+    """
+    # pylint: disable=unused-argument
+    object_session(project).info.setdefault(_CHANGED_LABELS, set()) \
+        .add(project.label)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_projects(session):
+    """Drop the projects `session` just created or deleted from the cache."""
+    for label in session.info.pop(_CHANGED_LABELS, ()):
+        project_cache.invalidate(label)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_project_changes(session):
+    """Forget the changes `session` recorded; they never happened."""
+    session.info.pop(_CHANGED_LABELS, None)
+
 
+class _Identity(object):
+    """The identity keystonemiddleware established for the current request.
+
+    This parses the middleware's variables in the wsgi environment once, so
+    that repeated authorization checks in a request are cheap.
+    """
+
+    def __init__(self, environ):
         # keystonemiddleware makes auth info available from two places:
         #
         # 1. Variables in the wsgi environment
@@ -41,26 +143,52 @@ class KeystoneAuthBackend(auth.AuthBackend):
         # We use the wsgi environment's variables below; it shouldn't matter,
         # but this way if something goes horribly wrong and arbitrary headers
         # aren't stripped out, the client can't just inject these.
-        if request.environ['HTTP_X_IDENTITY_STATUS'] != 'Confirmed':
+        self.confirmed = environ['HTTP_X_IDENTITY_STATUS'] == 'Confirmed'
+        self.project_id = environ.get('HTTP_X_PROJECT_ID')
+        self.is_admin = \
+            'admin' in environ.get('HTTP_X_ROLES', '').split(',')
+
+
+def _identity():
+    """Return the `_Identity` for the current request."""
+    identity = getattr(rest.local, 'keystone_identity', None)
+    if identity is None:
+        identity = _Identity(request.environ)
+        rest.local.keystone_identity = identity
+    return identity
+
+
+class KeystoneAuthBackend(auth.AuthBackend):
+    """Authenticate with keystone."""
+
+    def authenticate(self):
+        # pylint: disable=missing-docstring
+        rest.local.keystone_identity = None
+        identity = _identity()
+        if not identity.confirmed:
             return False
 
-        if self._have_admin():
+        if identity.is_admin:
             return True
 
-        project_id = request.environ['HTTP_X_PROJECT_ID']
-        if Project.query.filter_by(label=project_id).first() is None:
+        if not project_cache.is_registered(identity.project_id):
             logger.info("Successful authentication by Openstack project %r, "
                         "but this project is not registered with HIL",
-                        project_id)
+                        identity.project_id)
             return False
 
         return True
 
     def _have_project_access(self, project):
-        return project.label == request.environ['HTTP_X_PROJECT_ID']
+        return project.label == _identity().project_id
+
+    def _project_ids(self):
+        return frozenset(project_id for (project_id,)
+                         in db.session.query(Project.id)
+                         .filter_by(label=_identity().project_id))
 
     def _have_admin(self):
-        return 'admin' in request.environ['HTTP_X_ROLES'].split(',')
+        return _identity().is_admin
 
 
 def setup(*args, **kwargs):
@@ -75,7 +203,8 @@ def setup(*args, **kwargs):
         sys.exit(1)
     keystone_cfg = {}
     for key in cfg.options(__name__):
-        keystone_cfg[key] = cfg.get(__name__, key)
+        if key not in _OWN_OPTIONS:
+            keystone_cfg[key] = cfg.get(__name__, key)
 
     # Great job with the API design Openstack! </sarcasm>
     factory = filter_factory(keystone_cfg)
@@ -0,0 +1,39 @@
+"""Add API tokens
+
+Revision ID: 6c8cbb8d2c2f
+Revises: 96f1e8f87f85
+Create Date: 2026-10-18 16:41:09.218774
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c8cbb8d2c2f'
+down_revision = '96f1e8f87f85'
+branch_labels = None
+
+# pylint: disable=missing-docstring
+
+
+def upgrade():
+    op.create_table('token',
+                    sa.Column('id', sa.BigInteger(), nullable=False),
+                    sa.Column('digest', sa.String(), nullable=False),
+                    sa.Column('expires', sa.DateTime(), nullable=False),
+                    sa.Column('user_id', sa.BigInteger(), nullable=False),
+                    sa.Column('project_id', sa.BigInteger(), nullable=True),
+                    sa.ForeignKeyConstraint(['project_id'], ['project.id'], ),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('digest')
+                    )
+    op.create_index(op.f('ix_token_expires'), 'token', ['expires'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_token_expires'), table_name='token')
+    op.drop_table('token')
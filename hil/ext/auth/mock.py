@@ -27,6 +27,7 @@ class MockAuthBackend(auth.AuthBackend):
 
     def authenticate(self):
         # pylint: disable=missing-docstring
+        self.invalidate_context()
         rest.local.auth = {
             'project': None,
             'admin': False,
@@ -48,9 +49,16 @@ class MockAuthBackend(auth.AuthBackend):
     def _have_project_access(self, project):
         return project == rest.local.auth['project']
 
+    def _project_ids(self):
+        project = rest.local.auth['project']
+        if project is None:
+            return frozenset()
+        return frozenset([project.id])
+
     def set_project(self, project):
         """Change the project that the request is acting on behalf of."""
         rest.local.auth['project'] = project
+        self.invalidate_context()
 
     def set_admin(self, admin):
         """Change whether the request has admin access.
@@ -59,6 +67,7 @@ class MockAuthBackend(auth.AuthBackend):
         access.
         """
         rest.local.auth['admin'] = admin
+        self.invalidate_context()
 
     def set_user(self, user):
         """Set the user the request is running as."""
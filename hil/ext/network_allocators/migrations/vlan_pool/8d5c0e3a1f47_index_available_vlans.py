@@ -0,0 +1,28 @@
+"""index available vlans
+
+Revision ID: 8d5c0e3a1f47
+Revises: e06576b2ea9e
+Create Date: 2026-10-18 19:02:13.518264
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d5c0e3a1f47'
+down_revision = 'e06576b2ea9e'
+branch_labels = None
+
+# pylint: disable=missing-docstring
+
+
+def upgrade():
+    op.create_index('ix_vlan_available', 'vlan', ['vlan_no'],
+                    postgresql_where=sa.text('available = true'),
+                    sqlite_where=sa.text('available = 1'))
+
+
+def downgrade():
+    op.drop_index('ix_vlan_available', table_name='vlan')
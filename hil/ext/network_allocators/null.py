@@ -34,7 +34,7 @@ class NullNetworkAllocator(NetworkAllocator):
         return True
 
     def claim_network_id(self, net_id):
-        return
+        return True
 
     def is_network_id_in_pool(self, net_id):
         return True
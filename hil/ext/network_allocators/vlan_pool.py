@@ -37,31 +37,67 @@ def get_vlan_list():
 class VlanAllocator(NetworkAllocator):
     """A allocator of VLANs. The interface is as specified in
     ``NetworkAllocator``.
+
+    Each allocation, claim or release is a single conditional ``UPDATE`` of
+    the vlan table, so concurrent api servers can never hand out the same
+    vlan twice. Free vlans are found through a partial index on the
+    available ones (``ix_vlan_available``), so allocating doesn't get slower
+    as the pool fills up.
     """
 
+    # Maximum number of rows to insert with one statement in `populate`,
+    # which keeps us under SQLite's limit on the number of parameters.
+    POPULATE_CHUNK = 400
+
     def get_new_network_id(self):
-        vlan = Vlan.query.filter_by(available=True).first()
-        if not vlan:
-            return None
-        vlan.available = False
-        returnee = str(vlan.vlan_no)
-        return returnee
+        if db.engine.dialect.name == 'postgresql':
+            # Lock the lowest free vlan and take it in one statement; other
+            # transactions skip past it rather than waiting for us.
+            table = Vlan.__table__
+            candidate = db.select([table.c.id]) \
+                .where(_is_free(table.c)) \
+                .order_by(table.c.vlan_no) \
+                .limit(1) \
+                .with_for_update(skip_locked=True) \
+                .as_scalar()
+            vlan_no = db.session.execute(
+                table.update()
+                .where(table.c.id == candidate)
+                .values(available=False)
+                .returning(table.c.vlan_no)).scalar()
+            return None if vlan_no is None else str(vlan_no)
+
+        # Other databases don't support the above, so find a free vlan and
+        # take it only if it is still free, trying again if someone beat us
+        # to it:
+        while True:
+            vlan_no = db.session.query(Vlan.vlan_no) \
+                .filter(_is_free(Vlan)) \
+                .order_by(Vlan.vlan_no) \
+                .limit(1) \
+                .scalar()
+            if vlan_no is None:
+                return None
+            if _take(vlan_no):
+                return str(vlan_no)
 
     def free_network_id(self, net_id):
-        vlan = Vlan.query.filter_by(vlan_no=net_id).one_or_none()
-        if vlan is None:
+        table = Vlan.__table__
+        result = db.session.execute(table.update()
+                                    .where(table.c.vlan_no == net_id)
+                                    .values(available=True))
+        if result.rowcount == 0:
             logger = logging.getLogger(__name__)
             logger.error('vlan %s does not exist in database', net_id)
-            return
-        vlan.available = True
 
     def populate(self):
-        vlan_list = get_vlan_list()
-        for vlan in vlan_list:
-            if Vlan.query.filter_by(vlan_no=vlan).count() == 1:
-                # Already created by a previous call; leave it alone.
-                continue
-            db.session.add(Vlan(vlan))
+        existing = {row[0] for row in db.session.query(Vlan.vlan_no)}
+        missing = sorted(set(get_vlan_list()) - existing)
+        for i in range(0, len(missing), self.POPULATE_CHUNK):
+            chunk = missing[i:i + self.POPULATE_CHUNK]
+            db.session.execute(Vlan.__table__.insert().values([
+                {'vlan_no': vlan_no, 'available': True} for vlan_no in chunk
+            ]))
         db.session.commit()
 
     def legal_channels_for(self, net_id):
@@ -81,18 +117,39 @@ class VlanAllocator(NetworkAllocator):
             return False
 
     def claim_network_id(self, net_id):
-        vlan = Vlan.query.filter_by(vlan_no=net_id).one_or_none()
-        if vlan is None:
-            return
-        elif vlan.available:
-            vlan.available = False
-        else:
-            raise BlockedError("Network ID is not available."
-                               " Please choose a different ID.")
+        if _take(net_id):
+            return True
+        # Either it isn't ours to hand out, or it's taken:
+        if not self.is_network_id_in_pool(net_id):
+            return False
+        raise BlockedError("Network ID is not available."
+                           " Please choose a different ID.")
 
     def is_network_id_in_pool(self, net_id):
-        vlan = Vlan.query.filter_by(vlan_no=net_id).one_or_none()
-        return vlan is not None
+        return db.session.query(
+            Vlan.query.filter_by(vlan_no=net_id).exists()).scalar()
+
+
+def _is_free(vlan):
+    """Return the filter for available rows of `vlan`.
+
+    `vlan` is either `Vlan`, or the columns of its table. This matches the
+    predicate of ``ix_vlan_available``, so that the index can be used.
+    """
+    return vlan.available == db.true()
+
+
+def _take(vlan_no):
+    """Mark vlan `vlan_no` as in use, if it is in the pool and available.
+
+    Returns whether it was.
+    """
+    table = Vlan.__table__
+    result = db.session.execute(table.update()
+                                .where(table.c.vlan_no == vlan_no)
+                                .where(_is_free(table.c))
+                                .values(available=False))
+    return result.rowcount == 1
 
 
 class Vlan(db.Model):
@@ -109,6 +166,13 @@ class Vlan(db.Model):
     vlan_no = db.Column(db.Integer, nullable=False, unique=True)
     available = db.Column(db.Boolean, nullable=False)
 
+    __table_args__ = (
+        # The free list: see `VlanAllocator`.
+        db.Index('ix_vlan_available', 'vlan_no',
+                 postgresql_where=db.text('available = true'),
+                 sqlite_where=db.text('available = 1')),
+    )
+
     def __init__(self, vlan_no):
         self.vlan_no = vlan_no
         self.available = True
@@ -4,11 +4,20 @@ import logging
 import pexpect
 
 from abc import ABCMeta, abstractmethod
-from hil.model import Port, NetworkAttachment, SwitchSession
+from hil.errors import SwitchError
+from hil.model import db, Network, NetworkAttachment, Nic, Port, \
+    PortChange, SwitchSession
 from hil.ext.switches.common import should_save
 import re
 
 _CHANNEL_RE = re.compile(r'vlan/(\d+)')
+
+# The switches report a command they couldn't carry out with a line like
+# "% Invalid input detected at '^' marker.":
+_ERROR_RE = re.compile(r'^\s*%.*$', re.MULTILINE)
+
+# Number of seconds to wait for a prompt when checking a session is alive:
+_PROBE_TIMEOUT = 5
 logger = logging.getLogger(__name__)
 
 
@@ -17,12 +26,20 @@ class Session(SwitchSession):
 
     __metaclass__ = ABCMeta
 
+    save_on_disconnect = True
+
     @abstractmethod
     def enter_if_prompt(self, interface):
         """Navigate from the main prompt to the prompt for configuring
         ``interface``.
         """
 
+    @abstractmethod
+    def interface_range(self, interfaces):
+        """Return the argument to ``enter_if_prompt`` which selects all of
+        the (several) ``interfaces`` at once.
+        """
+
     @abstractmethod
     def exit_if_prompt(self):
         """Navigate back to the main prompt from an interface prompt."""
@@ -70,7 +87,7 @@ class Session(SwitchSession):
         where the switch only exits out of enable mode and doesn't actually
         log out"""
 
-        if should_save(self):
+        if self.save_on_disconnect and should_save(self):
             self.save_running_config()
         self._sendline('exit')
         alternatives = [pexpect.EOF, '>']
@@ -78,51 +95,124 @@ class Session(SwitchSession):
             self._sendline('exit')
         logger.debug('Logged out of switch %r', self.switch)
 
+    def is_alive(self):
+        """Check that the connection is still up, and the switch is still
+        responding at the main prompt.
+        """
+        if not self.console.isalive():
+            return False
+        try:
+            # A prompt left over from earlier would make a dead switch look
+            # alive, and throw off whatever is sent after us:
+            self._discard_output()
+            self._sendline('')
+            self.console.expect(self.main_prompt, timeout=_PROBE_TIMEOUT)
+        except (pexpect.EOF, pexpect.TIMEOUT):
+            return False
+        return True
+
+    def _discard_output(self):
+        """Throw away any output from the switch which hasn't been read."""
+        self.console.buffer = ''
+        try:
+            while True:
+                self.console.read_nonblocking(size=4096, timeout=0)
+        except pexpect.TIMEOUT:
+            pass
+
     def modify_port(self, port, channel, new_network):
-        interface = port
-        port = Port.query.filter_by(label=port,
-                                    owner_id=self.switch.id).one()
-
-        self.enter_if_prompt(interface)
-        self.console.expect(self.if_prompt)
-
-        if channel == 'vlan/native':
-            old_native = NetworkAttachment.query.filter_by(
-                channel='vlan/native',
-                nic_id=port.nic.id).one_or_none()
-            if old_native is not None:
-                old_native = old_native.network.network_id
-
-            if new_network is not None:
-                self.set_native(old_native, new_network)
+        self._apply_port_change(PortChange(port, channel, new_network))
+
+    def revert_port(self, port):
+        self._apply_port_change(PortChange(port, None, None))
+
+    def _apply_port_change(self, change):
+        """Apply the single ``change``, raising its SwitchError, if any."""
+        error = self.apply_port_changes([change])[0]
+        if error is not None:
+            raise error
+
+    def apply_port_changes(self, changes):
+        """Apply ``changes``, in as few bursts of commands as possible.
+
+        Changes which need the same commands are made together, on a range
+        of interfaces (see ``interface_range``). The commands for each such
+        group are sent in one burst, without waiting for a prompt after each
+        step; we then wait for the switch to get back to the main prompt
+        before sending the next group, so that its output never piles up
+        unread.
+
+        If the switch reports an error for a group, each of the changes in
+        it gets a SwitchError.
+        """
+        natives = self._native_vlans([change.port for change in changes
+                                      if change.channel == 'vlan/native'])
+
+        # Each group is a pair (commands, indices), where `commands` is a key
+        # for `_port_commands` and `indices` are the positions in `changes`
+        # of the changes it makes:
+        groups = []
+        latest_group = {}  # commands -> index of last group using them
+        port_group = {}  # port -> index of last group the port is in
+        for index, change in enumerate(changes):
+            commands = _change_commands(change, natives)
+            i = latest_group.get(commands)
+            # The change can only join an earlier group if that doesn't move
+            # it ahead of a later change to the same port:
+            if i is None or port_group.get(change.port, -1) >= i:
+                i = len(groups)
+                groups.append((commands, []))
+                latest_group[commands] = i
+            groups[i][1].append(index)
+            port_group[change.port] = i
+
+        results = [None] * len(changes)
+        for commands, indices in groups:
+            ports = [changes[i].port for i in indices]
+            if len(ports) == 1:
+                self.enter_if_prompt(ports[0])
+            else:
+                self.enter_if_prompt(self.interface_range(ports))
+            self._port_commands(commands)
+            self.exit_if_prompt()
+            self.console.expect(self.main_prompt)
+            error = _ERROR_RE.search(self.console.before)
+            if error is not None:
+                for i in indices:
+                    results[i] = SwitchError(error.group().strip())
+        return results
+
+    def _native_vlans(self, ports):
+        """Return a dict mapping each of the labels ``ports`` which has a
+        native network attached to that network's vlan id.
+        """
+        if not ports:
+            return {}
+        return dict(db.session.query(Port.label, Network.network_id)
+                    .join(Nic, Nic.port_id == Port.id)
+                    .join(NetworkAttachment,
+                          NetworkAttachment.nic_id == Nic.id)
+                    .join(Network, NetworkAttachment.network_id == Network.id)
+                    .filter(Port.owner_id == self.switch.id,
+                            Port.label.in_(ports),
+                            NetworkAttachment.channel == 'vlan/native'))
+
+    def _port_commands(self, commands):
+        """Send the commands described by ``commands`` for the current
+        interface(s); see ``_change_commands``.
+        """
+        if commands[0] == 'revert':
+            self.disable_port()
+        elif commands[0] == 'native':
+            _, old_native, new_native = commands
+            if new_native is not None:
+                self.set_native(old_native, new_native)
             elif old_native is not None:
                 self.disable_native(old_native)
+        elif commands[0] == 'enable':
+            self.enable_vlan(commands[1])
         else:
-            match = re.match(_CHANNEL_RE, channel)
-            # TODO: I'd be more okay with this assertion if it weren't possible
-            # to mis-configure HIL in a way that triggers this; currently the
-            # administrator needs to line up the network allocator with the
-            # switches; this is unsatisfactory. --isd
-            assert match is not None, "HIL passed an invalid channel to the" \
-                "switch!"
-            vlan_id = match.groups()[0]
-            if new_network is None:
-                self.disable_vlan(vlan_id)
-            else:
-                assert new_network == vlan_id
-                self.enable_vlan(vlan_id)
-
-        self.exit_if_prompt()
-        self.console.expect(self.config_prompt)
-
-    def revert_port(self, port):
-        self.enter_if_prompt(port)
-        self.console.expect(self.if_prompt)
-
-        self.disable_port()
-
-        self.exit_if_prompt()
-        self.console.expect(self.config_prompt)
+            self.disable_vlan(commands[1])
 
     def _set_terminal_lines(self, lines):
         """set the terminal lines to unlimited or default"""
@@ -139,6 +229,35 @@ class Session(SwitchSession):
         self.console.sendline(line)
 
 
+def _change_commands(change, natives):
+    """Return a key describing the commands which carry out ``change``.
+
+    ``natives`` maps port labels to their current native vlans; it is updated
+    to reflect ``change``. Changes with equal keys need identical commands,
+    which can be sent to several interfaces at once.
+    """
+    if change.channel is None:
+        natives[change.port] = None
+        return ('revert',)
+    if change.channel == 'vlan/native':
+        old_native = natives.get(change.port)
+        natives[change.port] = change.new_network
+        return ('native', old_native, change.new_network)
+
+    match = re.match(_CHANNEL_RE, change.channel)
+    # TODO: I'd be more okay with this assertion if it weren't possible
+    # to mis-configure HIL in a way that triggers this; currently the
+    # administrator needs to line up the network allocator with the
+    # switches; this is unsatisfactory. --isd
+    assert match is not None, "HIL passed an invalid channel to the" \
+        "switch!"
+    vlan_id = match.groups()[0]
+    if change.new_network is None:
+        return ('disable', vlan_id)
+    assert change.new_network == vlan_id
+    return ('enable', vlan_id)
+
+
 def get_prompts(console):
     """Determine the prompts used by the console.
 
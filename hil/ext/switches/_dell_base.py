@@ -2,6 +2,7 @@
 
 import re
 import logging
+from hil.errors import SwitchError
 from hil.ext.switches.common import parse_vlans
 
 from hil.ext.switches import _console
@@ -15,6 +16,9 @@ class _BaseSession(_console.Session):
         self._sendline('config')
         self._sendline('int ' + interface)
 
+    def interface_range(self, interfaces):
+        return 'range ' + ','.join(interfaces)
+
     def exit_if_prompt(self):
         self._sendline('exit')
         self._sendline('exit')
@@ -100,43 +104,39 @@ class _BaseSession(_console.Session):
         self._sendline('sw trunk allowed vlan none')
         self._sendline('sw trunk native vlan none')
 
+    # The field which starts each interface's section of the output of
+    # ``show int sw``:
+    _switchport_name_key = 'Name'
+
     def _port_configs(self, ports):
-        result = {}
-        for port in ports:
-            result[port] = self._int_config(port.label)
-        return result
+        """Collect information about the interfaces ``ports``.
 
-    def _int_config(self, interface):
-        """Collect information about the specified interface
+        This reads the output of ``show int sw`` for the whole switch in one
+        go (with paging turned off), rather than asking about each port in
+        turn.
 
-        Returns a dictionary from the output of ``show int sw <interface>``.
+        Returns a dictionary mapping each port to a dictionary of its
+        fields, as parsed by `_parse_switchport`.
         """
-
-        alternatives = [
-            r'More: .*',  # Prompt to press a key to continue
-            r'Classification rules:\r\n',  # End
-            r'[^ \t\r\n][^:]*:[^\n]*\n',   # Key:Value\r\n,
-            r' [^\n]*\n',                  # continuation line (from k:v)
-        ]
-        self._sendline('show int sw %s' % interface)
-
-        # Name is the first field:
-        self.console.expect('Name: .*')
-        k, v = self.console.after.split(':', 1)
-        result = {k: v}
-        while True:
-            index = self.console.expect(alternatives)
-            if index == 0:
-                self.console.send(' ')
-            elif index == 1:
-                break
-            elif index == 2:
-                k, v = self.console.after.split(':', 1)
-                result[k] = v
-            elif index == 3:
-                result[k] += self.console.after
-
+        self._set_terminal_lines('unlimited')
         self.console.expect(self.main_prompt)
+        self._sendline('show int sw')
+        # Skip past the switch's echo of the command, so that a prompt left
+        # in the buffer from before can't be taken for the end of its output:
+        self.console.expect(re.escape('show int sw'))
+        self.console.expect(self.main_prompt)
+        output = self.console.before
+        self._set_terminal_lines('default')
+        self.console.expect(self.main_prompt)
+
+        configs = _parse_switchport(output, self._switchport_name_key)
+        result = {}
+        for port in ports:
+            config = configs.get(port.label.lower())
+            if config is None:
+                raise SwitchError('Port %s is missing from the output of '
+                                  '"show int sw"' % port.label)
+            result[port] = config
         return result
 
     def save_running_config(self):
@@ -157,6 +157,40 @@ class _BaseSession(_console.Session):
         return config
 
 
+def _parse_switchport(output, name_key):
+    """Parse the output of ``show int sw`` for a whole switch.
+
+    Each interface's section starts with a line ``<name_key>: <interface>``,
+    followed by lines of the form ``Key: Value``; values may continue onto
+    following lines which start with a space. Anything after a
+    ``Classification rules:`` line, up to the next interface, is ignored.
+
+    Returns a dictionary mapping each (lower-cased) interface name to a
+    dictionary of its fields. Values are kept as they appear in the output,
+    including line endings.
+    """
+    result = {}
+    fields = None
+    key = None
+    for line in output.splitlines(True):
+        if line.startswith(name_key + ':'):
+            k, v = line.split(':', 1)
+            fields = {k: v}
+            result[v.strip().lower()] = fields
+            key = k
+        elif fields is None or key is None:
+            # Before the first interface, or in the classification rules.
+            continue
+        elif line.startswith('Classification rules:'):
+            key = None
+        elif line.startswith(' '):
+            fields[key] += line
+        elif ':' in line:
+            key, v = line.split(':', 1)
+            fields[key] = v
+    return result
+
+
 def _make_vlan_list(dirty_list):
     '''Create vlan list from switch config vlan ranges.'''
     ranges = dirty_list.replace(' (Inactive)', '')
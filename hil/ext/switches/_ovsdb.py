@@ -0,0 +1,218 @@
+"""A minimal OVSDB JSON-RPC client, for the OVS driver.
+
+This talks to ovsdb-server directly over its unix socket (see RFC 7047),
+rather than running `ovs-vsctl` for every operation. A `Client` keeps one
+connection open, makes changes with `transact`, and keeps a copy of the
+`Port` table up to date with a `monitor`, so that reading port state never
+has to leave the process.
+"""
+
+import errno
+import json
+import logging
+import select
+import socket
+import threading
+
+from hil.errors import SwitchError
+
+logger = logging.getLogger(__name__)
+
+DATABASE = 'Open_vSwitch'
+
+# The columns of the Port table which we keep a copy of:
+PORT_COLUMNS = ['name', 'tag', 'trunks', 'vlan_mode']
+
+# Clients are kept open for the life of the process, one per socket path:
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(path):
+    """Return the open `Client` for the ovsdb-server socket at `path`.
+
+    A new one is connected if there isn't one yet, or if the previous one
+    was closed because of an error.
+    """
+    with _clients_lock:
+        client = _clients.get(path)
+        if client is None or client.closed:
+            client = Client(path)
+            _clients[path] = client
+        return client
+
+
+class Client(object):
+    """A connection to ovsdb-server.
+
+    `ports` maps each port's uuid to its row in the Port table; it only has
+    the columns in `PORT_COLUMNS`, and is kept current by a monitor. Use
+    `port` to look a port up by name.
+
+    All methods are thread safe.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.closed = False
+        self.ports = {}
+        self._names = {}
+        self._next_id = 0
+        self._buf = ''
+        self._decoder = json.JSONDecoder()
+        self._lock = threading.RLock()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._sock.connect(path)
+        except socket.error as e:
+            self.closed = True
+            logger.error('Could not connect to ovsdb-server at %s: %s',
+                         path, e)
+            raise SwitchError('Could not connect to ovsdb-server at %s: %s'
+                              % (path, e))
+        self._update(self.call('monitor', [DATABASE, None, {
+            'Port': {'columns': PORT_COLUMNS},
+        }]))
+
+    def port(self, name):
+        """Return the cached row for the port named `name`, or None."""
+        with self._lock:
+            self.poll()
+            uuid = self._names.get(name)
+            if uuid is None:
+                return None
+            return self.ports[uuid]
+
+    def transact(self, operations):
+        """Run `operations` as a single transaction, and return its results.
+
+        Raises SwitchError if the transaction, or any of its operations,
+        failed; in that case none of the operations took effect.
+
+        Before returning, this waits for the monitor updates caused by the
+        transaction, so that `ports` reflects it.
+        """
+        with self._lock:
+            results = self.call('transact', [DATABASE] + list(operations))
+            for result in results:
+                if result is not None and 'error' in result:
+                    raise SwitchError('ovsdb transaction failed: %s: %s'
+                                      % (result['error'],
+                                         result.get('details', '')))
+            # ovsdb-server sends the updates for a transaction before it
+            # handles any request which comes after it, so once the echo
+            # is answered our copy of the Port table is current.
+            self.call('echo', [])
+            return results
+
+    def call(self, method, params):
+        """Send a request, and return the result from its reply.
+
+        Any notifications which arrive before the reply are handled.
+        """
+        with self._lock:
+            self._next_id += 1
+            request_id = self._next_id
+            self._send({'method': method, 'params': params,
+                        'id': request_id})
+            while True:
+                msg = self._recv()
+                if msg.get('id') == request_id and 'method' not in msg:
+                    if msg.get('error') is not None:
+                        raise SwitchError('ovsdb %s failed: %s'
+                                          % (method, msg['error']))
+                    return msg['result']
+                self._handle(msg)
+
+    def poll(self):
+        """Handle any notifications which have arrived, without blocking."""
+        with self._lock:
+            while True:
+                msg = self._buffered()
+                if msg is None:
+                    if not self._readable():
+                        return
+                    msg = self._recv()
+                self._handle(msg)
+
+    def close(self):
+        """Close the connection."""
+        with self._lock:
+            if not self.closed:
+                self.closed = True
+                self._sock.close()
+
+    def _handle(self, msg):
+        """Handle a message which isn't the reply we're waiting for."""
+        method = msg.get('method')
+        if method == 'update':
+            self._update(msg['params'][1])
+        elif method == 'echo':
+            self._send({'result': msg['params'], 'error': None,
+                        'id': msg['id']})
+        else:
+            logger.warn('Ignoring unexpected message from ovsdb-server: %r',
+                        msg)
+
+    def _update(self, table_updates):
+        """Apply `table_updates` from the monitor to our copy of the table."""
+        for uuid, row_update in table_updates.get('Port', {}).iteritems():
+            old = self.ports.pop(uuid, None)
+            if old is not None:
+                self._names.pop(old['name'], None)
+            new = row_update.get('new')
+            if new is not None:
+                self.ports[uuid] = new
+                self._names[new['name']] = uuid
+
+    def _send(self, msg):
+        """Send `msg` to the server."""
+        try:
+            self._sock.sendall(json.dumps(msg))
+        except socket.error as e:
+            self._fail(e)
+
+    def _recv(self):
+        """Read the next message from the server, blocking if need be."""
+        while True:
+            msg = self._buffered()
+            if msg is not None:
+                return msg
+            try:
+                data = self._sock.recv(65536)
+            except socket.error as e:
+                if e.errno == errno.EINTR:
+                    continue
+                self._fail(e)
+            if not data:
+                self._fail('connection closed by ovsdb-server')
+            self._buf += data
+
+    def _buffered(self):
+        """Return the next complete message in the buffer, or None.
+
+        If there is a message, it is removed from the buffer.
+        """
+        buf = self._buf.lstrip()
+        if not buf:
+            return None
+        try:
+            msg, end = self._decoder.raw_decode(buf)
+        except ValueError:
+            # Not all of the message has arrived yet.
+            return None
+        self._buf = buf[end:]
+        return msg
+
+    def _readable(self):
+        """Return whether there is data waiting on the socket."""
+        readable, _, _ = select.select([self._sock], [], [], 0)
+        return bool(readable)
+
+    def _fail(self, reason):
+        """Close the connection, and raise a SwitchError for `reason`."""
+        self.close()
+        logger.error('Lost connection to ovsdb-server at %s: %s',
+                     self.path, reason)
+        raise SwitchError('Lost connection to ovsdb-server at %s: %s'
+                          % (self.path, reason))
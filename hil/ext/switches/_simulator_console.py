@@ -0,0 +1,187 @@
+"""A stand-in for the console of a Dell PowerConnect switch.
+
+This is run (by ``hil.ext.switches.simulator``) as::
+
+    python -m hil.ext.switches._simulator_console --state <file> ...
+
+and speaks just enough of the PowerConnect CLI, on stdin/stdout, for the
+dell driver's code to work against it: logging in, configuring (ranges of)
+interfaces, ``show int sw`` and saving the running config. Each command
+takes as long as the costs given on the command line. The vlan configuration
+is kept in the json file given by ``--state``, so that it outlives the
+session.
+"""
+
+import argparse
+import json
+import os
+import sys
+import termios
+import time
+
+PROMPT = 'console'
+
+# Ports which ``show int sw`` always reports, in addition to any others in
+# the state file:
+DEFAULT_PORTS = ['gi1/0/%d' % i for i in range(1, 49)] + \
+    ['te1/0/%d' % i for i in range(1, 5)]
+
+
+class Console(object):
+    """The state of a console session.
+
+    `mode` is one of 'main', 'config', 'if' or 'confirm' (waiting for the
+    answer to the prompt when saving). `ports` is the state of each port, as
+    a dict with the keys 'native' (a vlan id or None), and 'trunks' (a list
+    of vlan ids).
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.mode = 'main'
+        self.interfaces = []
+        self.ports = {}
+        if os.path.exists(args.state):
+            with open(args.state) as f:
+                self.ports = json.load(f)
+
+    def prompt(self):
+        """Return the prompt for the current mode."""
+        if self.mode == 'config':
+            return PROMPT + '(config)#'
+        elif self.mode == 'if':
+            return PROMPT + '(config-if)#'
+        return PROMPT + '#'
+
+    def run(self):
+        """Read and execute commands until the session ends."""
+        time.sleep(self.args.login)
+        write(self.prompt())
+        while True:
+            line = sys.stdin.readline()
+            if not line:
+                return
+            line = line.strip()
+            # The terminal doesn't echo; like a real switch, we do.
+            write(line + '\n')
+            if not self.execute(line):
+                return
+
+    def execute(self, line):
+        """Execute the command `line`.
+
+        Returns False if the session should end.
+        """
+        if self.mode == 'confirm':
+            if line == 'y':
+                time.sleep(self.args.save)
+                write('Copy succeeded\n')
+            self.mode = 'main'
+            write(self.prompt())
+            return True
+
+        time.sleep(self.args.command)
+        words = line.split()
+        if line == 'exit':
+            if self.mode == 'main':
+                return False
+            self.mode = 'config' if self.mode == 'if' else 'main'
+        elif line == '':
+            pass
+        elif line in ('terminal datadump', 'no terminal datadump'):
+            pass
+        elif self.mode == 'main' and line == 'config':
+            self.mode = 'config'
+        elif self.mode == 'main' and line == 'show int sw':
+            time.sleep(self.args.read)
+            self.show_switchport()
+        elif self.mode == 'main' and \
+                line == 'copy running-config startup-config':
+            write('Overwrite file [startup-config] ?(y/n) ')
+            self.mode = 'confirm'
+            return True
+        elif self.mode == 'config' and words[:1] == ['int']:
+            if words[1:2] == ['range']:
+                self.interfaces = ''.join(words[2:]).split(',')
+            else:
+                self.interfaces = words[1:]
+            self.mode = 'if'
+        elif self.mode == 'if' and words[:1] == ['sw']:
+            self.switchport(words[1:])
+        else:
+            write('% Unrecognized command\n')
+        write(self.prompt())
+        return True
+
+    def switchport(self, words):
+        """Execute ``sw <words>`` on the current interfaces."""
+        for interface in self.interfaces:
+            port = self.ports.setdefault(interface,
+                                         {'native': None, 'trunks': []})
+            if words[:3] == ['trunk', 'allowed', 'vlan']:
+                action, vlan = words[3], words[4:5]
+                if action == 'add':
+                    port['trunks'] = sorted(set(port['trunks'] + vlan),
+                                            key=int)
+                elif action == 'remove':
+                    port['trunks'] = [v for v in port['trunks']
+                                      if v not in vlan]
+                elif action == 'none':
+                    port['trunks'] = []
+            elif words[:3] == ['trunk', 'native', 'vlan']:
+                port['native'] = None if words[3] == 'none' else words[3]
+        self.save_state()
+
+    def show_switchport(self):
+        """Print the output of ``show int sw``, for every port."""
+        names = DEFAULT_PORTS + sorted(set(self.ports) - set(DEFAULT_PORTS))
+        for name in names:
+            port = self.ports.get(name, {'native': None, 'trunks': []})
+            write('\n'.join([
+                'Name: ' + name,
+                'Switchport: enable',
+                'Administrative Mode: trunk',
+                'Operational Mode: down',
+                'Access Mode VLAN: 1 (default)',
+                'Trunking Native Mode VLAN: ' + (port['native'] or 'none'),
+                'Trunking VLANs Enabled: ' +
+                (','.join(port['trunks']) or 'none'),
+                '',
+                'Classification rules:',
+                '',
+                '',
+            ]))
+
+    def save_state(self):
+        """Write the port state to the state file."""
+        tmp = self.args.state + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.ports, f)
+        os.rename(tmp, self.args.state)
+
+
+def write(text):
+    """Write `text` to the terminal."""
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+def main():
+    """Run a console session."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--state', required=True,
+                        help='json file holding the port state')
+    for cost in 'login', 'command', 'read', 'save':
+        parser.add_argument('--' + cost, type=float, default=0,
+                            help='seconds each %s takes' % cost)
+    args = parser.parse_args()
+
+    if sys.stdin.isatty():
+        attrs = termios.tcgetattr(sys.stdin)
+        attrs[3] &= ~termios.ECHO
+        termios.tcsetattr(sys.stdin, termios.TCSANOW, attrs)
+    Console(args).run()
+
+
+if __name__ == '__main__':
+    main()
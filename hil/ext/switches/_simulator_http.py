@@ -0,0 +1,156 @@
+"""A stand-in for the REST API of a Brocade switch.
+
+`start` runs an http server in a background thread, which implements just
+enough of the Brocade API for the simulator's http sessions (which make the
+same requests as the brocade driver) to work against it.
+Each request takes as long as the simulator's ``request`` cost, and changes
+can fail according to its ``failure_rate``. Port state is kept in
+``hil.ext.switches.simulator.LOCAL_STATE``.
+"""
+
+import BaseHTTPServer
+import logging
+import re
+import SocketServer
+import threading
+
+from hil.ext.switches import simulator
+
+logger = logging.getLogger(__name__)
+
+INTERFACE_TYPE = 'TenGigabitEthernet'
+NS = 'urn:brocade.com:mgmt:brocade-interface'
+
+_PATH_RE = re.compile(r'^/rest/config/running/interface/[^/]+/'
+                      r'%22(?P<port>.+?)%22(?P<rest>/.*)?$')
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """The stand-in for switch `label`, with costs given by `timing` (a
+    `simulator.Timing`).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, label, timing):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.label = label
+        self.timing = timing
+
+
+def start(label, timing):
+    """Start a `Server` for switch `label`, and return it."""
+    server = Server(label, timing)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    logger.debug('Started http stand-in for switch %r on port %d',
+                 label, server.server_port)
+    return server
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Handles one request to the stand-in."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Read a port's configuration."""
+        self._handle(self._get)
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        """Change a port's configuration."""
+        self._handle(self._change)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Change a port's configuration."""
+        self._handle(self._change)
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        """Change a port's configuration."""
+        self._handle(self._change)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug('%s', format % args)
+
+    def _handle(self, handler):
+        """Read the request, and respond with what `handler` returns.
+
+        `handler` is called with the port's state, the rest of the url after
+        the port name, and the request body, and should return a pair
+        (status, body).
+        """
+        length = int(self.headers.getheader('Content-Length') or 0)
+        body = self.rfile.read(length) if length else ''
+        self.server.timing.delay('request')
+
+        match = _PATH_RE.match(self.path)
+        if match is None:
+            status, text = 404, ''
+        else:
+            with simulator.STATE_LOCK:
+                port = simulator.LOCAL_STATE[self.server.label][
+                    match.group('port')]
+                status, text = handler(port, match.group('rest') or '', body)
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    def _get(self, port, rest, _body):
+        """Return the xml for `rest` of the port's configuration."""
+        if rest == '':
+            shutdown = '<shutdown>true</shutdown>' if port.shutdown else ''
+            return 200, '<interface xmlns="%s">%s</interface>' % (NS,
+                                                                  shutdown)
+        elif rest == '/switchport/mode':
+            mode = 'trunk' if port.trunks or port.native else 'access'
+            return 200, '<mode xmlns="%s"><vlan-mode>%s</vlan-mode></mode>' \
+                % (NS, mode)
+        elif rest == '/switchport/trunk':
+            xml = ''
+            if port.trunks:
+                xml += '<allowed><vlan><add>%s</add></vlan></allowed>' % \
+                    ','.join(sorted(port.trunks, key=int))
+            if port.native is not None:
+                xml += '<native-vlan>%s</native-vlan>' % port.native
+            return 200, '<trunk xmlns="%s">%s</trunk>' % (NS, xml)
+        return 404, ''
+
+    def _change(self, port, rest, body):
+        """Make the change to the port's configuration described by the
+        request.
+        """
+        if self.server.timing.failed():
+            return 500, 'Simulated failure'
+
+        method = self.command
+        if rest == '' and method == 'POST':
+            if '<shutdown>' in body:
+                if port.shutdown:
+                    return 409, ''
+                port.shutdown = True
+        elif rest == '/shutdown' and method == 'DELETE':
+            port.shutdown = False
+        elif rest == '/switchport/trunk/allowed/vlan' and method == 'PUT':
+            # The brocade driver's payload for adding a vlan isn't well
+            # formed xml, so don't try to parse it as such.
+            add = re.search(r'<add>(\d+)<', body)
+            remove = re.search(r'<remove>(\d+)<', body)
+            if add:
+                port.trunks.add(add.group(1))
+            elif remove:
+                port.trunks.discard(remove.group(1))
+            elif '<none>true</none>' in body:
+                port.trunks.clear()
+        elif rest == '/switchport/trunk' and method == 'PUT':
+            native = re.search(r'<native-vlan>(\d+)<', body)
+            if native:
+                port.native = native.group(1)
+        elif rest == '/switchport/trunk/native-vlan' and method == 'DELETE':
+            port.native = None
+        # Anything else (enabling switchport, setting the mode, disabling
+        # native vlan tagging) doesn't affect the state we keep.
+        return 204, ''
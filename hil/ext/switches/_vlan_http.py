@@ -4,7 +4,10 @@ an API to talk to. This only works with the vlan_pool network allocator."""
 import logging
 import re
 import requests
+from requests.adapters import HTTPAdapter
+from schema import Optional
 
+from hil.config import cfg, string_is_positive_int
 from hil.errors import SwitchError
 from hil.model import SwitchSession
 from hil.network_allocator import get_network_allocator
@@ -12,6 +15,22 @@ from hil.network_allocator import get_network_allocator
 _CHANNEL_RE = re.compile(r'vlan/(\d+)')
 logger = logging.getLogger(__name__)
 
+# Defaults for the HTTP connection pool each session keeps open to its
+# switch. These can be overridden per driver; see `http_schema`.
+DEFAULT_POOL_CONNECTIONS = 1
+DEFAULT_POOL_MAXSIZE = 4
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+
+# Config options understood by every driver built on this module. Drivers
+# merge these into their own section of `core_schema`.
+http_schema = {
+    Optional('pool_connections'): string_is_positive_int,
+    Optional('pool_maxsize'): string_is_positive_int,
+    Optional('connect_timeout'): string_is_positive_int,
+    Optional('read_timeout'): string_is_positive_int,
+}
+
 
 class Session(SwitchSession):
     """Common base class for sessions in switches that are using an API"""
@@ -47,7 +66,11 @@ class Session(SwitchSession):
         self._port_shutdown(port)
 
     def disconnect(self):
-        pass
+        """Close the session's pooled HTTP connections, if any."""
+        http = getattr(self, '_http_session', None)
+        if http is not None:
+            http.close()
+            self._http_session = None
 
     def get_port_networks(self, ports):
         """Implements get_port_networks. See hil/model.py for more details
@@ -55,12 +78,12 @@ class Session(SwitchSession):
 
         response = {}
         for port in ports:
-            native = self._get_native_vlan(port.label)
+            native, vlans = self._get_port_vlans(port.label)
             if native is not None:
                 response[port] = [native]
             else:
                 response[port] = []
-            response[port] += self._get_vlans(port.label)
+            response[port] += vlans
         return response
 
     def _make_request(self, method, url, data=None,
@@ -68,7 +91,8 @@ class Session(SwitchSession):
         """This can make the http request for you.
         Also accepts a list of acceptable error codes if you need."""
 
-        r = requests.request(method, url, data=data, auth=self._auth)
+        r = self._http.request(method, url, data=data, auth=self._auth,
+                               timeout=self._timeout)
         if r.status_code >= 400 and \
            r.status_code not in acceptable_error_codes:
             logger.error('Bad Request to switch. '
@@ -79,6 +103,41 @@ class Session(SwitchSession):
                               'Reason: %s', r.text, r.reason)
         return r
 
+    @property
+    def _http(self):
+        """The `requests.Session` used to talk to the switch.
+
+        It is created on first use and kept until `disconnect`, so that every
+        request made during the session reuses the same keep-alive
+        connection(s) instead of paying for a new TCP and TLS handshake.
+        """
+        http = getattr(self, '_http_session', None)
+        if http is None:
+            adapter = HTTPAdapter(
+                pool_connections=self._http_option('pool_connections',
+                                                   DEFAULT_POOL_CONNECTIONS),
+                pool_maxsize=self._http_option('pool_maxsize',
+                                               DEFAULT_POOL_MAXSIZE),
+            )
+            http = requests.Session()
+            http.mount('http://', adapter)
+            http.mount('https://', adapter)
+            self._http_session = http
+        return http
+
+    @property
+    def _timeout(self):
+        """Tuple of (connect, read) timeouts for requests to the switch"""
+        return (self._http_option('connect_timeout', DEFAULT_CONNECT_TIMEOUT),
+                self._http_option('read_timeout', DEFAULT_READ_TIMEOUT))
+
+    def _http_option(self, option, default):
+        """Read an integer http option from the driver's config section."""
+        section = self.__class__.__module__
+        if cfg.has_option(section, option):
+            return cfg.getint(section, option)
+        return default
+
     @property
     def _auth(self):
         """Returns tuple for authentication"""
@@ -140,6 +199,20 @@ class Session(SwitchSession):
         """
         assert False, "Subclasses MUST override _get_native_vlan"
 
+    def _get_port_vlans(self, interface):
+        """ Return both the native vlan and the trunked vlans of an interface.
+
+        The default implementation just calls `_get_native_vlan` and
+        `_get_vlans`; drivers whose API returns both in one response should
+        override this so that each port is only read once.
+
+        Args:
+            interface: interface to return the vlans of
+        Returns: Tuple of the form (native, vlans), where `native` is what
+        `_get_native_vlan` returns and `vlans` is what `_get_vlans` returns.
+        """
+        return self._get_native_vlan(interface), self._get_vlans(interface)
+
     def _get_vlans(self, interface):
         """ Return the vlans of a trunk port.
 
@@ -7,7 +7,6 @@ import logging
 from lxml import etree
 from os.path import dirname, join
 import re
-import requests
 from schema import Schema, Optional
 
 from hil.migrations import paths
@@ -25,6 +24,7 @@ logger = logging.getLogger(__name__)
 core_schema[__name__] = {
     Optional('save'): string_is_bool
 }
+core_schema[__name__].update(_vlan_http.http_schema)
 
 
 class Brocade(Switch, _vlan_http.Session):
@@ -149,10 +149,44 @@ class Brocade(Switch, _vlan_http.Session):
         Returns: List containing the vlans of the form:
         [('vlan/vlan1', vlan1), ('vlan/vlan2', vlan2)]
         """
+        return self._parse_vlans(self._get_trunk(interface))
+
+    def _get_native_vlan(self, interface):
+        """ Return the native vlan of an interface.
+
+        Args:
+            interface: interface to return the native vlan of
+
+        Returns: Tuple of the form ('vlan/native', vlan) or None
+        """
+        return self._parse_native_vlan(self._get_trunk(interface))
+
+    def _get_port_vlans(self, interface):
+        """ Return the native vlan and trunked vlans of an interface.
+
+        Both live in the same trunk resource, so this needs a single GET.
+        """
+        root = self._get_trunk(interface)
+        return self._parse_native_vlan(root), self._parse_vlans(root)
+
+    def _get_trunk(self, interface):
+        """ Fetch and parse the trunk configuration of an interface.
+
+        Returns: the root element of the switch's xml response
+        """
+        url = self._construct_url(interface, suffix='trunk')
+        response = self._make_request('GET', url)
+        return etree.fromstring(response.text)
+
+    def _parse_vlans(self, root):
+        """ Return the trunked vlans in a trunk configuration.
+
+        Args:
+            root: trunk configuration, as returned by `_get_trunk`
+
+        Returns: List of the form [('vlan/vlan1', vlan1), ...]
+        """
         try:
-            url = self._construct_url(interface, suffix='trunk')
-            response = self._make_request('GET', url)
-            root = etree.fromstring(response.text)
             vlans = root. \
                 find(self._construct_tag('allowed')).\
                 find(self._construct_tag('vlan')).\
@@ -170,18 +204,15 @@ class Brocade(Switch, _vlan_http.Session):
         except AttributeError:
             return []
 
-    def _get_native_vlan(self, interface):
-        """ Return the native vlan of an interface.
+    def _parse_native_vlan(self, root):
+        """ Return the native vlan in a trunk configuration.
 
         Args:
-            interface: interface to return the native vlan of
+            root: trunk configuration, as returned by `_get_trunk`
 
         Returns: Tuple of the form ('vlan/native', vlan) or None
         """
         try:
-            url = self._construct_url(interface, suffix='trunk')
-            response = self._make_request('GET', url)
-            root = etree.fromstring(response.text)
             vlan = root.find(self._construct_tag('native-vlan')).text
             return ('vlan/native', vlan)
         except AttributeError:
@@ -220,7 +251,7 @@ class Brocade(Switch, _vlan_http.Session):
         """
         url = self._construct_url(interface, suffix='trunk/allowed/vlan')
         payload = '<vlan><none>true</none></vlan>'
-        requests.put(url, data=payload, auth=self._auth)
+        self._make_request('PUT', url, data=payload)
 
     def _set_native_vlan(self, interface, vlan):
         """ Set the native vlan of an interface.
@@ -25,6 +25,7 @@ EXEC = 'exec-command'
 core_schema[__name__] = {
     Optional('save'): string_is_bool
 }
+core_schema[__name__].update(_vlan_http.http_schema)
 
 
 class DellNOS9(Switch, _vlan_http.Session):
@@ -89,17 +90,7 @@ class DellNOS9(Switch, _vlan_http.Session):
 
         if not self._is_port_on(interface):
             return []
-        response = self._get_port_info(interface)
-
-        # finds a comma separated list of integers and/or ranges starting with
-        # T. Sample T12,14-18,23,28,80-90 or T20 or T20,22 or T20-22
-        match = re.search(r'T(\d+(-\d+)?)(,\d+(-\d+)?)*', response)
-        if match is None:
-            return []
-
-        vlan_list = parse_vlans(match.group().replace('T', ''))
-
-        return [('vlan/%s' % x, x) for x in vlan_list]
+        return self._parse_vlans(self._get_port_info(interface))
 
     def _get_native_vlan(self, interface):
         """ Return the native vlan of an interface.
@@ -113,7 +104,35 @@ class DellNOS9(Switch, _vlan_http.Session):
         """
         if not self._is_port_on(interface):
             return None
+        return self._parse_native_vlan(self._get_port_info(interface))
+
+    def _get_port_vlans(self, interface):
+        """ Return the native vlan and trunked vlans of an interface.
+
+        Checks the port state and runs the show command once, instead of once
+        each for _get_native_vlan and _get_vlans.
+        """
+        if not self._is_port_on(interface):
+            return None, []
         response = self._get_port_info(interface)
+        return self._parse_native_vlan(response), self._parse_vlans(response)
+
+    @staticmethod
+    def _parse_vlans(response):
+        """ Return the trunked vlans in the output of _get_port_info. """
+        # finds a comma separated list of integers and/or ranges starting with
+        # T. Sample T12,14-18,23,28,80-90 or T20 or T20,22 or T20-22
+        match = re.search(r'T(\d+(-\d+)?)(,\d+(-\d+)?)*', response)
+        if match is None:
+            return []
+
+        vlan_list = parse_vlans(match.group().replace('T', ''))
+
+        return [('vlan/%s' % x, x) for x in vlan_list]
+
+    @staticmethod
+    def _parse_native_vlan(response):
+        """ Return the native vlan in the output of _get_port_info. """
         match = re.search(r'NativeVlanId:(\d+)\.', response)
         if match is not None:
             vlan = match.group(1)
@@ -0,0 +1,32 @@
+"""Add simulator switch driver
+
+Revision ID: b45aacf48471
+Revises:
+Create Date: 2026-10-18 14:02:37.412563
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b45aacf48471'
+down_revision = None
+branch_labels = ('hil.ext.switches.simulator',)
+
+# pylint: disable=missing-docstring
+
+
+def upgrade():
+    op.create_table('simulated_switch',
+                    sa.Column('id', sa.BigInteger(), nullable=False),
+                    sa.Column('profile', sa.String(), nullable=False),
+                    sa.Column('frontend', sa.String(), nullable=False),
+                    sa.ForeignKeyConstraint(['id'], ['switch.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+
+
+def downgrade():
+    op.drop_table('simulated_switch')
@@ -78,6 +78,8 @@ class DellN3000(Switch):
 class _DellN3000Session(_BaseSession):
     """session object for the N3000 series"""
 
+    _switchport_name_key = 'Port'
+
     def __init__(self, config_prompt, if_prompt, main_prompt, switch, console,
                  dummy_vlan):
         self.config_prompt = config_prompt
@@ -133,25 +135,3 @@ class _DellN3000Session(_BaseSession):
         self._sendline('sw trunk allowed vlan add ' + self.dummy_vlan)
         self._sendline('sw trunk native vlan ' + self.dummy_vlan)
         self._sendline('sw trunk allowed vlan remove ' + self.dummy_vlan)
-
-    def _int_config(self, interface):
-        """Collect information about the specified interface
-
-        Returns a dictionary from the output of ``show int sw <interfaces>``.
-        """
-
-        self._sendline('show int sw %s' % interface)
-        self.console.expect('Port: .*')
-        k, v = 'key', 'value'
-        result = {k: v}
-        key_lines = self.console.after.splitlines()
-        del key_lines[-3:]
-        for line in key_lines:
-            k, v = line.split(':', 1)
-            result[k] = v
-        # expecting main_prompt here fails, because it appears that the
-        # main_prompt is a part of the interface configuration (console.after)
-        # sending a new line clears things up here.
-        self._sendline('\n')
-        self.console.expect(self.main_prompt)
-        return result
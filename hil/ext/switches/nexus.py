@@ -90,6 +90,9 @@ class _Session(_console.Session):
         self._sendline('config terminal')
         self._sendline('int %s' % interface)
 
+    def interface_range(self, interfaces):
+        return ', '.join(interfaces)
+
     def exit_if_prompt(self):
         self._sendline('exit')
         self._sendline('exit')
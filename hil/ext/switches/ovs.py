@@ -1,15 +1,26 @@
 """A switch driver for OpenVswitch."""
+import json
 import re
 import logging
 import schema
 import subprocess
 
-from hil.model import db, Switch, Port, BigIntegerType, SwitchSession
+from hil.config import cfg, core_schema
+from hil.model import db, Switch, BigIntegerType, SwitchSession, PortChange
 from hil.errors import SwitchError
-from hil.ext.switches.common import string_to_dict, string_to_list
+from hil.ext.switches import _ovsdb
 
 logger = logging.getLogger(__name__)
 
+# If `ovsdb_socket` is set, the driver talks to ovsdb-server directly over
+# that unix socket (usually /var/run/openvswitch/db.sock), instead of
+# running `sudo ovs-vsctl`.
+core_schema[__name__] = {
+    schema.Optional('ovsdb_socket'): str,
+}
+
+VSCTL = ['sudo', 'ovs-vsctl']
+
 # Class layout
 # 1. Public methods:
 # 2. Private methods
@@ -43,185 +54,244 @@ class Ovs(Switch, SwitchSession):
     def ovs_connect(self, *command_strings):
         """Interacts with the Openvswitch.
 
+        All of the commands are run as a single ovs-vsctl transaction, so
+        either all of them take effect or none do.
+
         Args:
             *command_strings (tuple) : tuple of list of arguments required
-                        to make changes to openvswitch
+                        to make changes to openvswitch, each starting with
+                        `sudo ovs-vsctl`
         Raises: SwitchError
         Returns: If successful returns None else logs error message
         """
+        args = list(VSCTL)
+        for arg_list in command_strings:
+            assert arg_list[:len(VSCTL)] == VSCTL, \
+                "Not an ovs-vsctl command: %r" % (arg_list,)
+            args += ['--'] + arg_list[len(VSCTL):]
         try:
-            for arg_list in command_strings:
-                subprocess.check_call(arg_list)
+            subprocess.check_call(args)
         except subprocess.CalledProcessError as e:
             logger.error('%s', e)
             raise SwitchError('ovs command failed: %s', e)
 
     def get_port_networks(self, ports):
 
+        ports_info = self._ports_info([port.label for port in ports])
         response = {}
         for port in ports:
-            trunk_id_list = self._interface_info(port.label)['trunks']
-            if trunk_id_list == []:
-                response[port] = []
-            else:
-                result = []
-                for trunk in trunk_id_list:
-                    name = "vlan/"+trunk
-                    result.append((name, trunk))
-                response[port] = result
-            native = self._interface_info(port.label)['tag']
+            port_info = ports_info[port.label]
+            response[port] = [("vlan/" + trunk, trunk)
+                              for trunk in port_info['trunks']]
+            native = port_info['tag']
             if native != []:
                 response[port].append(("vlan/native", native))
 
         return response
 
     def revert_port(self, port):
-
-        args_1 = ['sudo', 'ovs-vsctl', 'del-port', str(port)]
-        args_2 = [
-                'sudo', 'ovs-vsctl', 'add-port', str(self.ovs_bridge),
-                str(port), 'vlan_mode=native-untagged'
-                ]
-        self.ovs_connect(args_1, args_2)
+        self._apply([PortChange(port, None, None)])
 
     def modify_port(self, port, channel, new_network):
+        self._apply([PortChange(port, channel, new_network)])
 
-        port_obj = Port.query.filter_by(label=port).one()
-        interface = port_obj.label
+    def apply_port_changes(self, changes):
+        """Makes all of the changes in one ovs-vsctl transaction.
 
-        if channel == 'vlan/native':
-            if new_network is None:
-                return self._remove_native_vlan(interface)
-            else:
-                return self._set_native_vlan(interface, new_network)
-        else:
-            match = re.match(re.compile(r'vlan/(\d+)'), channel)
-            assert match is not None, "HIL passed an invalid channel to the" \
-                " switch!"
-            vlan_id = match.groups()[0]
-
-            if new_network is None:
-                return self._remove_vlan_from_port(interface, vlan_id)
-            else:
-                assert new_network == vlan_id
-                return self._add_vlan_to_trunk(interface, vlan_id)
+        The transaction is atomic, so if it fails, every change fails with
+        the same error.
+        """
+        try:
+            self._apply(changes)
+        except SwitchError as e:
+            return [e] * len(changes)
+        return [None] * len(changes)
+
+# 2. Private methods
 
-    def _interface_info(self, port):
-        """Gets latest configuration of port from switch.
+    def _apply(self, changes):
+        """Runs the commands for `changes` (a list of `PortChange`s) as one
+        ovs-vsctl transaction.
+        """
+        if not changes:
+            return
+        client = self._ovsdb_client()
+        if client is not None:
+            client.transact(self._transaction(changes))
+            return
+        commands = []
+        for change in changes:
+            commands += self._change_commands(change)
+        self.ovs_connect(*commands)
+
+    @staticmethod
+    def _ovsdb_client():
+        """Returns the ovsdb client to use, or None to use ovs-vsctl."""
+        if cfg.has_option(__name__, 'ovsdb_socket'):
+            return _ovsdb.get_client(cfg.get(__name__, 'ovsdb_socket'))
+        return None
+
+    @staticmethod
+    def _transaction(changes):
+        """Returns the ovsdb operations that make `changes`.
+
+        These are the equivalent of `_change_commands`, except that reverting
+        a port resets its vlan configuration in place rather than deleting
+        and re-adding it. Each port is checked to exist first, so that the
+        transaction fails as a whole if one doesn't.
+        """
+        operations = []
+        checked = set()
+        for change in changes:
+            port = str(change.port)
+            where = [['name', '==', port]]
+            if port not in checked:
+                checked.add(port)
+                operations.append({
+                    'op': 'wait', 'table': 'Port', 'where': where,
+                    'columns': ['name'], 'until': '==',
+                    'rows': [{'name': port}], 'timeout': 0,
+                })
+
+            if change.channel is None:
+                operations.append({
+                    'op': 'update', 'table': 'Port', 'where': where,
+                    'row': {'tag': ['set', []], 'trunks': ['set', []],
+                            'vlan_mode': 'native-untagged'},
+                })
+            elif change.channel == 'vlan/native':
+                if change.new_network is None:
+                    row = {'tag': ['set', []]}
+                else:
+                    row = {'tag': int(change.new_network),
+                           'vlan_mode': 'native-untagged'}
+                operations.append({
+                    'op': 'update', 'table': 'Port', 'where': where,
+                    'row': row,
+                })
+            else:
+                match = re.match(r'vlan/(\d+)', change.channel)
+                assert match is not None, "HIL passed an invalid channel to" \
+                    " the switch!"
+                vlan_id = match.groups()[0]
+                if change.new_network is None:
+                    mutator = 'delete'
+                else:
+                    assert change.new_network == vlan_id
+                    mutator = 'insert'
+                operations.append({
+                    'op': 'mutate', 'table': 'Port', 'where': where,
+                    'mutations': [
+                        ['trunks', mutator, ['set', [int(vlan_id)]]],
+                    ],
+                })
+        return operations
+
+    def _change_commands(self, change):
+        """Returns the ovs-vsctl commands that make a single `PortChange`.
+
+        None of these need to read the port's state first: vlans are added to
+        and removed from the port's `trunks` set with ovs-vsctl's `add` and
+        `remove` commands.
+        """
+        port = str(change.port)
+        if change.channel is None:
+            return [
+                VSCTL + ['del-port', port],
+                VSCTL + ['add-port', str(self.ovs_bridge), port,
+                         'vlan_mode=native-untagged'],
+            ]
+
+        if change.channel == 'vlan/native':
+            if change.new_network is None:
+                return [VSCTL + ['clear', 'port', port, 'tag']]
+            return [VSCTL + ['set', 'port', port,
+                             'tag=' + str(change.new_network),
+                             'vlan_mode=native-untagged']]
+
+        match = re.match(r'vlan/(\d+)', change.channel)
+        assert match is not None, "HIL passed an invalid channel to the" \
+            " switch!"
+        vlan_id = match.groups()[0]
+
+        if change.new_network is None:
+            return [VSCTL + ['remove', 'port', port, 'trunks', vlan_id]]
+        assert change.new_network == vlan_id
+        return [VSCTL + ['add', 'port', port, 'trunks', vlan_id]]
+
+    def _ports_info(self, ports):
+        """Gets the latest configuration of several ports from the switch.
+
+        This runs a single `ovs-vsctl --format=json list port` for all of
+        them. Its output looks like:
+
+        {"headings": ["_uuid", "name", "tag", "trunks", "vlan_mode", ...],
+         "data": [[["uuid", "ad489368-9b53-4a3e-8732-697ad5141de9"],
+                   "veth-0", 100, ["set", [200, 300, 400]],
+                   "native-untagged", ...],
+                  ...]}
+
+        If `ovsdb_socket` is configured, the ports are instead looked up in
+        the ovsdb client's copy of the Port table, which only has the columns
+        in `_ovsdb.PORT_COLUMNS`.
 
         Args:
-            port: Valid port name
-        Returns intermediate output which processed to return final output:
-        It is a string of the following format:
-        '_uuid               : ad489368-9b53-4a3e-8732-697ad5141de9\n
-        bond_downdelay      : 0\nbon    d_fake_iface     : false\n
-        external_ids        : {}\nfake_bridge         : false\n
-        interfaces              : [fc61c8ff99c5,fc61c8ff99c6]\n
-        name                : "veth-0"\n
-        statistics          : {abc:123    , def:xyz,  space  :  lot of it , \
-                2345:some number}\n
-        status              : {}\ntag                     : 100\n
-        trunks              : [200,300,400]\n
-        vlan_mode           : native-untagged\n'
-
-        Which is used as input for further processing.
-        Returns: A dictionary of configuration status of the port.
-             String, Dictionary and list are valid values of this dictionary.
+            ports: list of valid port names
+        Returns: A dictionary mapping each port's name to a dictionary of its
+             configuration. Values are strings, or lists/dictionaries of
+             strings for set and map columns. An empty optional column (such
+             as `tag` on a port without a native vlan) is an empty list, and
+             `trunks` is always a list.
              eg: Sample output.
-               {
-                '_uuid': 'ad489368-9b53-4a3e-8732-697ad5141de9',
-                'bond_downdelay': '0',
-                'bond_fake_iface': 'false',
-                'external_ids': {},
-                'fake_bridge': 'false',
-                'interfaces': ['fc61c8ff99c5', 'fc61c8ff99c6'],
-                'name': '"veth-0"',
-                'statistics': {'2345': 'some number','abc': '123','def': 'xyz'
-                                ,'space': 'lot of it'},
-                'status': {},
-                'tag': '100',
-                'trunks': ['200', '300', '400'],
-                'vlan_mode': 'native-untagged'
-              }
+               {'veth-0': {
+                    '_uuid': 'ad489368-9b53-4a3e-8732-697ad5141de9',
+                    'name': 'veth-0',
+                    'tag': '100',
+                    'trunks': ['200', '300', '400'],
+                    'vlan_mode': 'native-untagged',
+                    ...
+                }}
         """
+        if not ports:
+            return {}
+        client = self._ovsdb_client()
+        if client is not None:
+            result = {}
+            for port in ports:
+                row = client.port(str(port))
+                if row is None:
+                    logger.error("No such ovs port: %s", port)
+                    raise SwitchError('No such ovs port: %s', port)
+                result[port] = self._port_info(row)
+            return result
         # This function is differnet then `ovs_connect` as it uses
         # subprocess.check_output because it only needs read info from switch
         # and pass the output to calling funtion.
-        args = ['sudo', 'ovs-vsctl', 'list', 'port', str(port)]
+        args = VSCTL + ['--format=json', 'list', 'port'] + \
+            [str(port) for port in ports]
         try:
             output = subprocess.check_output(args)
         except subprocess.CalledProcessError as e:
             logger.error(" %s ", e)
             raise SwitchError('Ovs command failed: %s', e)
-        output = output.split('\n')
-        output.remove('')
-        i_info = dict(s.split(':', 1) for s in output)
-        i_info = {k.strip(): v.strip() for k, v in i_info.iteritems()}
-        for x in i_info.keys():
-            if i_info[x][0] == "{":
-                i_info[x] = string_to_dict(i_info[x])
-            elif i_info[x][0] == "[":
-                i_info[x] = string_to_list(i_info[x])
-        return i_info
-
-    def _remove_native_vlan(self, port):
-        """Removes native vlan from a trunked port.
-        If it is the last vlan to be removed, it disables the port and
-        reverts its state to default configuration
-        Args:
-            port: Valid switch port
-        Returns: if successful None else error message
-        """
-        port_info = self._interface_info(port)
-        vlan_id = port_info['tag']
-        args = [
-                'sudo', 'ovs-vsctl', 'remove', 'port', str(port), 'tag',
-                str(vlan_id)
-                ]
-        return self.ovs_connect(args)
-
-    def _set_native_vlan(self, port, new_network):
-        """Sets native vlan for a trunked port.
-        It enables the port, if it is the first vlan for the port.
-        Args:
-            port: valid port of switch
-            new_network: vlan_id
+        table = json.loads(output)
+        result = {}
+        for row in table['data']:
+            p_info = self._port_info(dict(zip(table['headings'], row)))
+            result[p_info['name']] = p_info
+        return result
+
+    @staticmethod
+    def _port_info(row):
+        """Converts a row of the Port table to the format `_ports_info`
+        returns.
         """
-        args = [
-                'sudo', 'ovs-vsctl', 'set', 'port', str(port),
-                'tag='+str(new_network), 'vlan_mode=native-untagged'
-                ]
-
-        return self.ovs_connect(args)
-
-    def _add_vlan_to_trunk(self, port, vlan_id):
-        """ Adds vlans to a trunk port. """
-        port_info = self._interface_info(port)
-
-        if not port_info['trunks']:
-            args = [
-                    'sudo', 'ovs-vsctl', 'set', 'port', str(port),
-                    'trunks='+str(vlan_id)
-                    ]
-        else:
-            all_trunks = ','.join(port_info['trunks'])+','+vlan_id
-            args = [
-                    'sudo', 'ovs-vsctl', 'set', 'port', str(port),
-                    'trunks='+str(all_trunks)
-                    ]
-
-        return self.ovs_connect(args)
-
-    def _remove_vlan_from_port(self, port, vlan_id):
-        """ removes a single vlan specified by `vlan_id` """
-        port_info = self._interface_info(port)
-        args = [
-                'sudo', 'ovs-vsctl', 'remove', 'port', str(port), 'trunks',
-                str(vlan_id)
-                ]
-        if port_info['trunks']:
-            return self.ovs_connect(args)
-        return None
+        p_info = {column: _ovsdb_value(value)
+                  for column, value in row.iteritems()}
+        # ovsdb shows a set with one element as just that element.
+        if not isinstance(p_info['trunks'], list):
+            p_info['trunks'] = [p_info['trunks']]
+        return p_info
 
 # 3. Other superclass methods:
 
@@ -234,3 +304,23 @@ class Ovs(Switch, SwitchSession):
 
     def disconnect(self):
         pass
+
+
+def _ovsdb_value(value):
+    """Converts a value from ovsdb's json format to strings, lists and dicts.
+
+    See RFC 7047, section 5.1 for the format.
+    """
+    if isinstance(value, list):
+        kind, data = value
+        if kind == 'set':
+            return [_ovsdb_value(x) for x in data]
+        elif kind == 'map':
+            return {_ovsdb_value(k): _ovsdb_value(v) for k, v in data}
+        # "uuid" or "named-uuid"
+        return data
+    elif isinstance(value, bool):
+        return 'true' if value else 'false'
+    elif isinstance(value, basestring):
+        return value
+    return str(value)
@@ -0,0 +1,441 @@
+"""A simulated switch, with the performance characteristics of a real one.
+
+Unlike ``hil.ext.switches.mock``, which finishes every operation instantly,
+this driver makes each operation take about as long as it does on real
+hardware, and can inject failures. It is meant for benchmarking the network
+daemon without access to lab switches.
+
+Each switch has a ``profile``, one of the keys of `PROFILES`, which sets how
+long logging in, changing a port, reading port state and saving the
+configuration take. It also has a ``frontend``, which decides how HIL talks
+to it:
+
+    * ``direct``: the session is an in-process object which just sleeps for
+      the cost of each operation.
+    * ``console``: HIL drives a local stand-in for a Dell PowerConnect
+      console (see ``_simulator_console``) through pexpect, using the real
+      code in ``_console`` and ``_dell_base``.
+    * ``http``: HIL talks to a local stand-in for the Brocade REST API (see
+      ``_simulator_http``), through the real request code in ``_vlan_http``.
+
+The driver reads the following options from its config section:
+
+    * ``latency_scale``: multiplier for every cost in the profile (default 1)
+    * ``jitter``: each delay is randomly varied by up to this fraction of
+      itself (default 0.1)
+    * ``failure_rate``: probability that a change fails with a SwitchError
+      (default 0). Not supported by the console frontend.
+    * ``state_dir``: where the console stand-in keeps switch state between
+      sessions (default: a directory under the system's temp directory)
+    * ``save``: as for the other console based drivers.
+"""
+
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from os.path import dirname, join
+
+import pexpect
+from lxml import etree
+from schema import Schema, Optional, Or
+
+from hil.config import cfg, core_schema, string_is_bool, \
+    string_is_nonnegative_float
+from hil.errors import BadArgumentError, SwitchError
+from hil.migrations import paths
+from hil.model import db, Switch, SwitchSession, BigIntegerType
+from hil.ext.switches import _console, _vlan_http
+from hil.ext.switches.common import parse_vlans, should_save
+from hil.ext.switches._dell_base import _BaseSession
+
+paths[__name__] = join(dirname(__file__), 'migrations', 'simulator')
+logger = logging.getLogger(__name__)
+
+core_schema[__name__] = {
+    Optional('save'): string_is_bool,
+    Optional('latency_scale'): string_is_nonnegative_float,
+    Optional('jitter'): string_is_nonnegative_float,
+    Optional('failure_rate'): string_is_nonnegative_float,
+    Optional('state_dir'): str,
+}
+
+# Costs, in seconds, of operations on each kind of switch. These are rough
+# figures from our own switches, and are only meant to get the shape of the
+# daemon's behaviour right:
+#
+#   * login: opening a session (ssh login, or TLS handshake for REST).
+#   * change: making one change to a port on its own.
+#   * bulk_change: each additional change made in the same burst, by
+#     `apply_port_changes`.
+#   * command: one line typed at the console stand-in.
+#   * request: one request to the HTTP stand-in.
+#   * read: reading port state, once per `get_port_networks` call...
+#   * read_port: ...plus this much per port.
+#   * save: saving the running config.
+PROFILES = {
+    'instant': {
+        'login': 0, 'change': 0, 'bulk_change': 0, 'command': 0,
+        'request': 0, 'read': 0, 'read_port': 0, 'save': 0,
+    },
+    'dell': {
+        'login': 3.0, 'change': 0.8, 'bulk_change': 0.2, 'command': 0.15,
+        'request': 0, 'read': 1.5, 'read_port': 0, 'save': 5.0,
+    },
+    'nexus': {
+        'login': 2.0, 'change': 0.6, 'bulk_change': 0.15, 'command': 0.1,
+        'request': 0, 'read': 1.0, 'read_port': 0, 'save': 8.0,
+    },
+    'brocade': {
+        'login': 0.3, 'change': 0.5, 'bulk_change': 0.5, 'command': 0,
+        'request': 0.12, 'read': 0, 'read_port': 0.12, 'save': 0,
+    },
+}
+
+FRONTENDS = ('direct', 'console', 'http')
+
+
+class PortState(object):
+    """The vlan configuration of one simulated port."""
+
+    def __init__(self, native=None, trunks=(), shutdown=True):
+        self.native = native
+        self.trunks = set(trunks)
+        self.shutdown = shutdown
+
+    def networks(self):
+        """Return the port's networks, in the format of
+        `SwitchSession.get_port_networks`.
+        """
+        result = []
+        if self.native is not None:
+            result.append(('vlan/native', self.native))
+        for vlan in sorted(self.trunks - {self.native}, key=int):
+            result.append(('vlan/' + vlan, vlan))
+        return result
+
+
+# State of the switches served in this process, by the direct and http
+# frontends: LOCAL_STATE[switch label][port] is a `PortState`.
+LOCAL_STATE = defaultdict(lambda: defaultdict(PortState))
+STATE_LOCK = threading.Lock()
+
+
+class Timing(object):
+    """Simulated costs and failures, according to a profile and the
+    config file.
+    """
+
+    def __init__(self, profile):
+        self.costs = PROFILES[profile]
+        self.scale = _option('latency_scale', 1.0)
+        self.jitter = _option('jitter', 0.1)
+        self.failure_rate = _option('failure_rate', 0.0)
+        self.random = random.Random()
+
+    def cost(self, operation, count=1):
+        """Return the (scaled and jittered) cost of `count` `operation`s."""
+        cost = self.costs[operation] * count * self.scale
+        if self.jitter:
+            cost *= 1 + self.random.uniform(-self.jitter, self.jitter)
+        return max(cost, 0)
+
+    def delay(self, operation, count=1):
+        """Sleep for the cost of `count` `operation`s."""
+        cost = self.cost(operation, count)
+        if cost:
+            time.sleep(cost)
+
+    def failed(self):
+        """Return whether an operation should fail."""
+        return self.random.random() < self.failure_rate
+
+
+def _option(name, default):
+    """Read a float option from our config section."""
+    if cfg.has_option(__name__, name):
+        return cfg.getfloat(__name__, name)
+    return default
+
+
+class SimulatedSwitch(Switch):
+    """A simulated switch; see the module docstring."""
+
+    api_name = 'http://schema.massopencloud.org/haas/v0/switches/simulator'
+
+    __mapper_args__ = {
+        'polymorphic_identity': api_name,
+    }
+
+    id = db.Column(BigIntegerType,
+                   db.ForeignKey('switch.id'), primary_key=True)
+    profile = db.Column(db.String, nullable=False)
+    frontend = db.Column(db.String, nullable=False)
+
+    @staticmethod
+    def validate(kwargs):
+        Schema({
+            'profile': Or(*PROFILES.keys()),
+            'frontend': Or(*FRONTENDS),
+        }).validate(kwargs)
+
+    @staticmethod
+    def validate_port_name(port):
+        """Valid port names are those of either the dell (gi1/0/11, te1/3)
+        or brocade (1/0/1, 1/2) drivers.
+        """
+        val = re.compile(r'^((gi|te)\d+/\d+(/\d+)?|\d+/\d+(/\d+)?)$')
+        if not val.match(port):
+            raise BadArgumentError("Invalid port name. Valid port names for "
+                                   "this switch are of the form gi1/0/11, "
+                                   "te1/3, 1/0/1 or 1/2")
+
+    def get_capabilities(self):
+        return []
+
+    def session(self):
+        if self.frontend == 'console':
+            return _ConsoleSession.connect(self)
+        elif self.frontend == 'http':
+            return _http_session(self)
+        return _DirectSession(self)
+
+
+class _DirectSession(SwitchSession):
+    """An in-process session, which sleeps for the cost of each operation.
+    """
+
+    save_on_disconnect = True
+
+    def __init__(self, switch):
+        self.switch = switch
+        self.timing = Timing(switch.profile)
+        self.closed = False
+        self.timing.delay('login')
+
+    def modify_port(self, port, channel, new_network):
+        self._check_failure()
+        self.timing.delay('change')
+        self._apply(port, channel, new_network)
+
+    def revert_port(self, port):
+        self._check_failure()
+        self.timing.delay('change')
+        self._apply(port, None, None)
+
+    def apply_port_changes(self, changes):
+        if not changes:
+            return []
+        self.timing.delay('change')
+        self.timing.delay('bulk_change', len(changes) - 1)
+        results = []
+        for change in changes:
+            if self.timing.failed():
+                results.append(SwitchError('Simulated failure'))
+                continue
+            self._apply(change.port, change.channel, change.new_network)
+            results.append(None)
+        return results
+
+    def get_port_networks(self, ports):
+        self.timing.delay('read')
+        self.timing.delay('read_port', len(ports))
+        with STATE_LOCK:
+            state = LOCAL_STATE[self.switch.label]
+            return {port: state[port.label].networks() for port in ports}
+
+    def save_running_config(self):
+        """Pretend to save the running config."""
+        self.timing.delay('save')
+
+    def disconnect(self):
+        if self.save_on_disconnect and should_save(self):
+            self.save_running_config()
+        self.closed = True
+
+    def is_alive(self):
+        return not self.closed
+
+    def _check_failure(self):
+        """Raise a SwitchError, if the timing says this operation fails."""
+        if self.timing.failed():
+            raise SwitchError('Simulated failure')
+
+    def _apply(self, port, channel, new_network):
+        """Make a change to the port's state; see `PortChange`."""
+        with STATE_LOCK:
+            state = LOCAL_STATE[self.switch.label][port]
+            if channel is None:
+                state.native = None
+                state.trunks.clear()
+                state.shutdown = True
+                return
+            state.shutdown = False
+            if channel == 'vlan/native':
+                state.native = new_network
+                return
+            vlan_id = channel.split('/', 1)[1]
+            if new_network is None:
+                state.trunks.discard(vlan_id)
+            else:
+                state.trunks.add(vlan_id)
+
+
+class _ConsoleSession(_BaseSession):
+    """Session with the console stand-in, through the dell console code."""
+
+    def __init__(self, config_prompt, if_prompt, main_prompt, switch,
+                 console):
+        self.config_prompt = config_prompt
+        self.if_prompt = if_prompt
+        self.main_prompt = main_prompt
+        self.switch = switch
+        self.console = console
+
+    @staticmethod
+    def connect(switch):
+        """Start a console stand-in for `switch`, and log in to it."""
+        timing = Timing(switch.profile)
+        state_dir = cfg.get(__name__, 'state_dir') \
+            if cfg.has_option(__name__, 'state_dir') \
+            else join(tempfile.gettempdir(), 'hil-simulator')
+        if not os.path.isdir(state_dir):
+            os.makedirs(state_dir)
+        args = ['-m', 'hil.ext.switches._simulator_console',
+                '--state', join(state_dir, switch.label + '.json'),
+                '--login', str(timing.cost('login')),
+                '--command', str(timing.cost('command')),
+                '--read', str(timing.cost('read')),
+                '--save', str(timing.cost('save'))]
+        console = pexpect.spawn(sys.executable, args)
+        console.sendline('some-unrecognized-command')
+        prompts = _console.get_prompts(console)
+        logger.debug('Logged in to switch %r', switch)
+        return _ConsoleSession(switch=switch, console=console, **prompts)
+
+    def _set_terminal_lines(self, lines):
+        if lines == 'unlimited':
+            self._sendline('terminal datadump')
+        elif lines == 'default':
+            self._sendline('no terminal datadump')
+
+
+# HTTP stand-ins running in this process, by switch label:
+_http_servers = {}
+
+
+def _http_session(switch):
+    """Return an `_HttpSession` talking to the http stand-in for `switch`,
+    which is started if it isn't running yet.
+    """
+    from hil.ext.switches import _simulator_http
+
+    with STATE_LOCK:
+        server = _http_servers.get(switch.label)
+        if server is None:
+            server = _simulator_http.start(switch.label,
+                                           Timing(switch.profile))
+            _http_servers[switch.label] = server
+    server.timing.delay('login')
+    base_url = 'http://127.0.0.1:%d/rest/config/running/interface/%s' \
+        % (server.server_port, _simulator_http.INTERFACE_TYPE)
+    return _HttpSession(switch, base_url, _simulator_http.NS)
+
+
+class _HttpSession(_vlan_http.Session):
+    """Session with an http stand-in, through the request code in
+    ``_vlan_http``.
+
+    This makes the same requests as the brocade driver, so each change
+    costs the same number of round trips, but doesn't need that driver (or
+    its model) to be loaded.
+    """
+
+    username = 'hil'
+    password = 'hil'
+
+    def __init__(self, switch, base_url, namespace):
+        self.switch = switch
+        self.base_url = base_url
+        self.namespace = namespace
+
+    def _url(self, interface, suffix=''):
+        """Return the url for ``suffix`` of ``interface``'s switchport
+        configuration (or of the interface itself, if ``suffix`` is empty).
+        """
+        # Port names contain slashes, so they are quoted (%22) in urls.
+        url = '%s/%%22%s%%22' % (self.base_url, interface)
+        if suffix:
+            url += '/switchport/' + suffix
+        return url
+
+    def _tag(self, name):
+        """Return the qualified name of the xml element ``name``."""
+        return '{%s}%s' % (self.namespace, name)
+
+    def _port_shutdown(self, interface):
+        self._make_request('POST', self._url(interface),
+                           data='<shutdown>true</shutdown>',
+                           acceptable_error_codes=(409,))
+
+    def _enable_trunk(self, interface):
+        """Turn ``interface`` on, and make it a trunk port."""
+        root = etree.fromstring(
+            self._make_request('GET', self._url(interface)).text)
+        if root.find(self._tag('shutdown')) is not None:
+            self._make_request('DELETE', self._url(interface) + '/shutdown')
+        self._make_request('POST', self._url(interface),
+                           data='<switchport></switchport>',
+                           acceptable_error_codes=(409,))
+        self._make_request('PUT', self._url(interface, 'mode'),
+                           data='<mode><vlan-mode>trunk</vlan-mode></mode>')
+
+    def _set_native_vlan(self, interface, vlan):
+        self._enable_trunk(interface)
+        self._make_request('DELETE', self._url(interface,
+                                               'trunk/tag/native-vlan'),
+                           acceptable_error_codes=(404,))
+        self._make_request('PUT', self._url(interface, 'trunk'),
+                           data='<trunk><native-vlan>%s</native-vlan></trunk>'
+                           % vlan)
+
+    def _remove_native_vlan(self, interface):
+        self._make_request('DELETE', self._url(interface, 'trunk/native-vlan'))
+
+    def _add_vlan_to_trunk(self, interface, vlan):
+        self._enable_trunk(interface)
+        self._make_request('PUT', self._url(interface, 'trunk/allowed/vlan'),
+                           data='<vlan><add>%s</add></vlan>' % vlan)
+
+    def _remove_vlan_from_trunk(self, interface, vlan):
+        self._make_request('PUT', self._url(interface, 'trunk/allowed/vlan'),
+                           data='<vlan><remove>%s</remove></vlan>' % vlan)
+
+    def _remove_all_vlans_from_trunk(self, interface):
+        self._make_request('PUT', self._url(interface, 'trunk/allowed/vlan'),
+                           data='<vlan><none>true</none></vlan>')
+
+    def _get_native_vlan(self, interface):
+        return self._get_port_vlans(interface)[0]
+
+    def _get_vlans(self, interface):
+        return self._get_port_vlans(interface)[1]
+
+    def _get_port_vlans(self, interface):
+        root = etree.fromstring(
+            self._make_request('GET', self._url(interface, 'trunk')).text)
+        native = root.find(self._tag('native-vlan'))
+        if native is not None:
+            native = ('vlan/native', native.text)
+        vlans = []
+        allowed = root.find(self._tag('allowed'))
+        if allowed is not None:
+            vlans = [('vlan/%s' % vlan, vlan) for vlan in
+                     parse_vlans(allowed.find(self._tag('vlan'))
+                                 .find(self._tag('add')).text)]
+        return native, vlans
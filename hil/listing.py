@@ -0,0 +1,137 @@
+"""Pagination and field selection for the api's list calls.
+
+List calls which support these take three extra (optional) arguments, which
+are included in their schemas via `LIST_ARGS`:
+
+* ``limit``: the maximum number of items to return. Items are returned in
+  order of name; if there are more items than ``limit``, the response
+  includes a `NEXT_CURSOR_HEADER` header, whose value can be passed as
+  ``cursor`` to get the next page. Pages are ordered by the database, so
+  names which differ in case or contain non-ascii characters may come in a
+  different order than in an unpaginated list.
+* ``cursor``: an opaque string, from the `NEXT_CURSOR_HEADER` of a previous
+  response. Only items after the last item of that response are returned.
+* ``fields``: a comma separated list of extra fields to include for each
+  item; see the call's documentation for the fields it supports.
+
+Without these arguments, list calls return everything, as they always have.
+Their schemas are built with `list_schema`.
+"""
+
+import base64
+
+import flask
+from schema import And, Optional, Schema, Use
+
+from hil.errors import BadArgumentError
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+# The most names `rows_by_name` puts in a single query:
+IN_CHUNK_SIZE = 500
+
+LIST_ARGS = {
+    Optional('limit'): And(Use(int), lambda n: n > 0),
+    Optional('cursor'): basestring,
+    Optional('fields'): basestring,
+}
+
+
+def list_schema(*args):
+    """Return the schema for a list call taking `args`, plus `LIST_ARGS`.
+
+    Each of `args` is a dictionary, as would be passed to ``schema.Schema``.
+    """
+    merged = dict(LIST_ARGS)
+    for arg in args:
+        merged.update(arg)
+    return Schema(merged)
+
+
+def encode_cursor(name):
+    """Return the cursor for the page after the item named `name`."""
+    return base64.urlsafe_b64encode(name.encode('utf-8'))
+
+
+def decode_cursor(cursor):
+    """Return the item name in `cursor`.
+
+    Raises a BadArgumentError if `cursor` is malformed.
+    """
+    try:
+        return base64.urlsafe_b64decode(str(cursor)).decode('utf-8')
+    except (TypeError, ValueError, UnicodeError):
+        raise BadArgumentError('Invalid cursor: %r' % cursor)
+
+
+def paginate(query, column, limit=None, cursor=None):
+    """Return one page of the results of `query`, ordered by `column`.
+
+    `column` is the (unique) name column of the listed items, which must be
+    among the query's results. `limit` and `cursor` are as described in the
+    module docstring.
+
+    Returns the page's rows, and sets the `NEXT_CURSOR_HEADER` of the response
+    if there are more.
+    """
+    if limit is None and cursor is None:
+        # Lists which aren't paginated are sorted by python, as they always
+        # have been; the database's collation may order names differently.
+        return sorted(query.all(), key=lambda row: getattr(row, column.key))
+    query = query.order_by(column)
+    if cursor is not None:
+        query = query.filter(column > decode_cursor(cursor))
+    if limit is None:
+        return query.all()
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        _set_next_cursor(encode_cursor(getattr(rows[-1], column.key)))
+    return rows
+
+
+def _set_next_cursor(cursor):
+    """Set the `NEXT_CURSOR_HEADER` of the current response to `cursor`."""
+    if not flask.has_request_context():
+        return
+
+    @flask.after_this_request
+    def _add_header(response):
+        """Add the header to `response`."""
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+        return response
+
+
+def rows_by_name(query, column, names):
+    """Run `query`, restricted to rows whose `column` is in `names`.
+
+    `names` are the names of the rows returned by `paginate`. `column` must
+    be the first column of `query`'s results. Returns a dictionary mapping
+    each name to the list of its rows.
+
+    The names are passed to the database in chunks of `IN_CHUNK_SIZE`, since
+    unpaginated lists can be longer than the number of parameters a
+    statement may have (999, for older versions of SQLite).
+    """
+    rows = {name: [] for name in names}
+    for start in range(0, len(names), IN_CHUNK_SIZE):
+        chunk = names[start:start + IN_CHUNK_SIZE]
+        for row in query.filter(column.in_(chunk)):
+            rows[row[0]].append(row)
+    return rows
+
+
+def parse_fields(fields, allowed):
+    """Parse the ``fields`` argument of a list call.
+
+    Returns the list of field names in `fields`, or None if it is None.
+    Raises a BadArgumentError if any of them are not in `allowed`.
+    """
+    if fields is None:
+        return None
+    names = [name for name in fields.split(',') if name]
+    unknown = sorted(set(names) - set(allowed))
+    if unknown:
+        raise BadArgumentError('Unknown fields: %s. Valid fields are: %s'
+                               % (', '.join(unknown), ', '.join(allowed)))
+    return names
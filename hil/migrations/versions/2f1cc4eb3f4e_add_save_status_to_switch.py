@@ -0,0 +1,32 @@
+"""add save status to switch
+
+Revision ID: 2f1cc4eb3f4e
+Revises: 956616f8a64b
+Create Date: 2026-10-18 11:02:17.402986
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f1cc4eb3f4e'
+down_revision = '956616f8a64b'
+branch_labels = None
+
+# pylint: disable=missing-docstring
+
+
+def upgrade():
+    op.add_column('switch', sa.Column('last_saved', sa.DateTime(),
+                                      nullable=True))
+    op.add_column('switch', sa.Column('save_pending', sa.Boolean(),
+                                      nullable=True))
+    op.execute('UPDATE switch SET save_pending = false')
+    op.alter_column('switch', 'save_pending', nullable=False)
+
+
+def downgrade():
+    op.drop_column('switch', 'save_pending')
+    op.drop_column('switch', 'last_saved')
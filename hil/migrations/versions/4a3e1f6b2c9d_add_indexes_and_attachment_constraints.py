@@ -0,0 +1,66 @@
+"""add indexes and network attachment constraints
+
+Revision ID: 4a3e1f6b2c9d
+Revises: 2f1cc4eb3f4e
+Create Date: 2026-10-18 17:26:51.093127
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a3e1f6b2c9d'
+down_revision = '2f1cc4eb3f4e'
+branch_labels = None
+
+# pylint: disable=missing-docstring
+
+
+def upgrade():
+    op.create_index('ix_nic_owner_id_label', 'nic', ['owner_id', 'label'])
+    op.create_index('ix_nic_port_id', 'nic', ['port_id'])
+    op.create_index(op.f('ix_node_project_id'), 'node', ['project_id'])
+    op.create_index('ix_metadata_owner_id_label', 'metadata',
+                    ['owner_id', 'label'])
+    op.create_index('ix_port_owner_id_label', 'port', ['owner_id', 'label'])
+    op.create_index('ix_network_projects_network_id_project_id',
+                    'network_projects', ['network_id', 'project_id'])
+    op.create_index('ix_network_projects_project_id', 'network_projects',
+                    ['project_id'])
+    op.create_index('ix_networking_action_pending', 'networking_action',
+                    ['id'],
+                    postgresql_where=sa.text("status = 'PENDING'"),
+                    sqlite_where=sa.text("status = 'PENDING'"))
+    op.create_index('ix_networking_action_nic_id_status', 'networking_action',
+                    ['nic_id', 'status'])
+    op.create_unique_constraint('uq_network_attachment_nic_id_network_id',
+                                'network_attachment',
+                                ['nic_id', 'network_id'])
+    op.create_unique_constraint('uq_network_attachment_nic_id_channel',
+                                'network_attachment', ['nic_id', 'channel'])
+    op.create_index('ix_network_attachment_network_id_id',
+                    'network_attachment', ['network_id', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_network_attachment_network_id_id',
+                  table_name='network_attachment')
+    op.drop_constraint('uq_network_attachment_nic_id_channel',
+                       'network_attachment', type_='unique')
+    op.drop_constraint('uq_network_attachment_nic_id_network_id',
+                       'network_attachment', type_='unique')
+    op.drop_index('ix_networking_action_nic_id_status',
+                  table_name='networking_action')
+    op.drop_index('ix_networking_action_pending',
+                  table_name='networking_action')
+    op.drop_index('ix_network_projects_project_id',
+                  table_name='network_projects')
+    op.drop_index('ix_network_projects_network_id_project_id',
+                  table_name='network_projects')
+    op.drop_index('ix_port_owner_id_label', table_name='port')
+    op.drop_index('ix_metadata_owner_id_label', table_name='metadata')
+    op.drop_index(op.f('ix_node_project_id'), table_name='node')
+    op.drop_index('ix_nic_port_id', table_name='nic')
+    op.drop_index('ix_nic_owner_id_label', table_name='nic')
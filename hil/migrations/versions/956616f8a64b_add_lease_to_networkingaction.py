@@ -0,0 +1,31 @@
+"""add lease to networkingaction
+
+Revision ID: 956616f8a64b
+Revises: d65a9dc873d7
+Create Date: 2026-10-18 10:12:41.118305
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '956616f8a64b'
+down_revision = 'd65a9dc873d7'
+branch_labels = None
+
+# pylint: disable=missing-docstring
+
+
+def upgrade():
+    op.add_column('networking_action', sa.Column('claimed_by', sa.String(),
+                  nullable=True))
+    op.add_column('networking_action', sa.Column('lease_expires',
+                                                 sa.DateTime(),
+                                                 nullable=True))
+
+
+def downgrade():
+    op.drop_column('networking_action', 'lease_expires')
+    op.drop_column('networking_action', 'claimed_by')
@@ -11,6 +11,7 @@ Extensions are permitted to create new database objects by subclassing from
 # from sqlalchemy import *
 # from sqlalchemy.ext.declarative import declarative_base, declared_attr
 # from sqlalchemy.orm import relationship, sessionmaker,backref
+from collections import namedtuple
 from flask_sqlalchemy import SQLAlchemy
 from subprocess import call, check_call, Popen, PIPE
 from hil.flaskapp import app
@@ -46,6 +47,10 @@ def init_db(uri=None):
     if uri is None:
         uri = cfg.get('database', 'uri')
     app.config.update(SQLALCHEMY_DATABASE_URI=uri)
+    # Extensions have defined their models by now, so set up the mappers'
+    # relationships. Otherwise backrefs (e.g. ``Node.nics``) only exist as
+    # class attributes once something has happened to query the database.
+    db.configure_mappers()
 
 
 # A joining table for project's access to networks, which have a many to many
@@ -53,12 +58,21 @@ def init_db(uri=None):
 network_projects = db.Table(
     'network_projects',
     db.Column('project_id', db.ForeignKey('project.id')),
-    db.Column('network_id', db.ForeignKey('network.id')))
+    db.Column('network_id', db.ForeignKey('network.id')),
+    db.Index('ix_network_projects_network_id_project_id',
+             'network_id', 'project_id'),
+    db.Index('ix_network_projects_project_id', 'project_id'))
 
 
 class Nic(db.Model):
     """a nic belonging to a Node"""
 
+    __table_args__ = (
+        # For looking up a node's nics, by label or not:
+        db.Index('ix_nic_owner_id_label', 'owner_id', 'label'),
+        db.Index('ix_nic_port_id', 'port_id'),
+    )
+
     id = db.Column(BigIntegerType, primary_key=True)
     label = db.Column(db.String, nullable=False)
 
@@ -87,7 +101,7 @@ class Node(db.Model):
 
     # The project to which this node is allocated. If the project is null, the
     # node is unallocated:
-    project_id = db.Column(db.ForeignKey('project.id'))
+    project_id = db.Column(db.ForeignKey('project.id'), index=True)
     project = db.relationship("Project", backref=db.backref('nodes'))
 
     obmd_uri = db.Column(db.String, nullable=False)
@@ -147,6 +161,10 @@ class Metadata(db.Model):
 
     Metadata may a key, a hash, or otherwise
     """
+    __table_args__ = (
+        db.Index('ix_metadata_owner_id_label', 'owner_id', 'label'),
+    )
+
     id = db.Column(BigIntegerType, primary_key=True)
     label = db.Column(db.String, nullable=False)
     value = db.Column(db.String)
@@ -208,10 +226,15 @@ class Port(db.Model):
     The port's label is an identifier that is meaningful only to the
     corresponding switch's driver.
     """
+    __table_args__ = (
+        db.Index('ix_port_owner_id_label', 'owner_id', 'label'),
+    )
+
     id = db.Column(BigIntegerType, primary_key=True)
     label = db.Column(db.String, nullable=False)
     owner_id = db.Column(db.ForeignKey('switch.id'), nullable=False)
-    owner = db.relationship('Switch', backref=db.backref('ports'))
+    owner = db.relationship('Switch',
+                            backref=db.backref('ports', order_by=id))
 
     def __init__(self, label, switch):
         """Register a port on a switch."""
@@ -232,6 +255,12 @@ class Switch(db.Model):
 
     type = db.Column(db.String, nullable=False)
 
+    # When the network daemon last saved the switch's running config (UTC),
+    # and whether it has made changes since then which are yet to be saved.
+    # See `hil.deferred.SaveScheduler`.
+    last_saved = db.Column(db.DateTime, nullable=True)
+    save_pending = db.Column(db.Boolean, nullable=False, default=False)
+
     __mapper_args__ = {
         'polymorphic_identity': 'switch',
         'polymorphic_on': type,
@@ -282,6 +311,15 @@ class Switch(db.Model):
         assert False, "Subclasses MUST override get_capabilities"
 
 
+class PortChange(namedtuple('PortChange', 'port channel new_network')):
+    """A change to a port, for `SwitchSession.apply_port_changes`.
+
+    `port`, `channel` and `new_network` are as for
+    `SwitchSession.modify_port`. If `channel` is None, the change is a
+    `revert_port` instead, and `new_network` is ignored.
+    """
+
+
 class SwitchSession(object):
     """A session object for a switch.
 
@@ -289,6 +327,12 @@ class SwitchSession(object):
     HIL avoid connecting and disconnecting for each change.
     """
 
+    # Whether `disconnect` saves the running config (if the driver's `save`
+    # option allows it). Drivers which do so set this to True at the class
+    # level; the network daemon sets it to False on individual sessions when
+    # it schedules saves itself.
+    save_on_disconnect = False
+
     def modify_port(self, port, channel, new_network):
         """Move the specified (port, channel) pair to new_network.
 
@@ -309,6 +353,32 @@ class SwitchSession(object):
         """
         assert False, "Subclasses MUST override revert_port"
 
+    def apply_port_changes(self, changes):
+        """Apply several changes to the switch's ports.
+
+        `changes` is a list of `PortChange`s, which are made in order.
+
+        Returns a list with one entry per change, which is either None if the
+        change succeeded, or the `SwitchError` it failed with.
+
+        This implementation just calls `modify_port` or `revert_port` for each
+        change in turn; drivers which can make changes faster in bulk should
+        override it.
+        """
+        results = []
+        for change in changes:
+            try:
+                if change.channel is None:
+                    self.revert_port(change.port)
+                else:
+                    self.modify_port(change.port,
+                                     change.channel,
+                                     change.new_network)
+                results.append(None)
+            except errors.SwitchError as e:
+                results.append(e)
+        return results
+
     def disconnect(self):
         """Disconnect from the switch.
 
@@ -316,6 +386,17 @@ class SwitchSession(object):
         """
         assert False, "Subclasses MUST override disconnect"
 
+    def is_alive(self):
+        """Check whether the session can still be used.
+
+        The network daemon keeps sessions open between uses, and calls this
+        before reusing one. If it returns False, the session is disconnected
+        and replaced with a new one.
+
+        The default implementation just returns True.
+        """
+        return True
+
     def get_port_networks(self, ports):
         """Return a mapping from port objects to (channel, network ID)
             pairs.
@@ -527,6 +608,17 @@ class NetworkingAction(db.Model):
     # Legal values for `type`
     legal_types = ('modify_port', 'revert_port')
 
+    # Almost all of the journal is finished actions, but the network daemon
+    # only ever looks for pending ones, oldest first; this index only covers
+    # those. The nic index is for the joins from nics (and so ports and
+    # switches) to their actions.
+    __table_args__ = (
+        db.Index('ix_networking_action_pending', 'id',
+                 postgresql_where=db.text("status = 'PENDING'"),
+                 sqlite_where=db.text("status = 'PENDING'")),
+        db.Index('ix_networking_action_nic_id_status', 'nic_id', 'status'),
+    )
+
     id = db.Column(BigIntegerType, primary_key=True)
 
     # UUID of a networking action. Useful for querying the status of a
@@ -551,6 +643,13 @@ class NetworkingAction(db.Model):
     # is ignored.
     channel = db.Column(db.String, nullable=False)
 
+    # The network daemon which has claimed this action, and the (UTC) time at
+    # which its claim lapses. Both are None if no daemon has claimed the
+    # action yet. Once the lease has expired, another daemon may claim the
+    # action; see `hil.deferred`.
+    claimed_by = db.Column(db.String, nullable=True)
+    lease_expires = db.Column(db.DateTime, nullable=True)
+
     # The nic affected by the action. for 'revert_port', this is the nic
     # attached to the specified port.
     nic = db.relationship("Nic",
@@ -566,13 +665,19 @@ class NetworkingAction(db.Model):
 
 class NetworkAttachment(db.Model):
     """An attachment of a network to a particular nic on a channel"""
+    __table_args__ = (
+        # A nic can be attached to a network only once, and to only one
+        # network on each channel:
+        db.UniqueConstraint('nic_id', 'network_id',
+                            name='uq_network_attachment_nic_id_network_id'),
+        db.UniqueConstraint('nic_id', 'channel',
+                            name='uq_network_attachment_nic_id_channel'),
+        # For listing a network's attachments, in order:
+        db.Index('ix_network_attachment_network_id_id', 'network_id', 'id'),
+    )
+
     id = db.Column(BigIntegerType, primary_key=True)
 
-    # TODO: it would be nice to place explicit unique constraints on some
-    # things:
-    #
-    # * (nic_id, network_id)
-    # * (nic_id, channel)
     nic_id = db.Column(db.ForeignKey('nic.id'), nullable=False)
     network_id = db.Column(db.ForeignKey('network.id'), nullable=False)
     channel = db.Column(db.String, nullable=False)
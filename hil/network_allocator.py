@@ -83,7 +83,12 @@ class NetworkAllocator(object):
 
     @abstractmethod
     def claim_network_id(self, net_id):
-        """Claim a network id when an admin creates a network"""
+        """Claim a network id when an admin creates a network
+
+        Returns True if ``net_id`` is part of the allocation pool (and has
+        now been claimed), False if not. Raises a ``BlockedError`` if it is
+        part of the pool, but already in use.
+        """
 
     @abstractmethod
     def is_network_id_in_pool(self, net_id):
@@ -300,7 +300,9 @@ def init_auth():
     authentication, and authentication fails, it raises an
     AuthorizationError.
     """
-    ok = auth.get_auth_backend().authenticate()
+    backend = auth.get_auth_backend()
+    backend.invalidate_context()
+    ok = backend.authenticate()
     if cfg.has_option('auth', 'require_authentication'):
         require_auth = cfg.getboolean('auth', 'require_authentication')
     else:
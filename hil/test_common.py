@@ -12,6 +12,7 @@ from hil.model import db, init_db, Node, Nic, Network, Project, Headnode, \
     Hnic, Switch, Port, Metadata
 from hil import api, config, server
 from abc import ABCMeta, abstractmethod
+from sqlalchemy import event
 import json
 import subprocess
 import sys
@@ -287,6 +288,43 @@ class _FailOnLogWarnings(logging.Handler):
             raise LoggedWarningError(record)
 
 
+class QueryCounter(object):
+    """Context manager which counts the SQL statements executed within it.
+
+    Must be used inside an application context. Usage::
+
+        with QueryCounter() as counter:
+            api.show_node('node-99')
+        assert counter.count <= 4
+
+    `statements` holds the text of each statement, which is handy when an
+    assertion on `count` fails, and `parameters` the parameters each was
+    executed with.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+        self.parameters = []
+        self._engine = None
+
+    def __enter__(self):
+        self._engine = db.engine
+        event.listen(self._engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self._engine, 'before_cursor_execute', self._record)
+
+    # pylint: disable=too-many-arguments,unused-argument
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        """Event listener; see `__enter__`."""
+        self.count += 1
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+
+
 class LoggedWarningError(Exception):
     """Error indicating that a message was logged at warning level or higher.
 
@@ -0,0 +1,493 @@
+"""Benchmarks for the REST API and the network daemon.
+
+This generates a synthetic site directly in the database, then measures how
+long the read-only API calls take against it, how many SQL statements each
+one runs, and how quickly the network daemon drains a queue of networking
+actions against simulated switches (see ``hil.ext.switches.simulator``).
+
+Run it directly to produce a json baseline, and to compare against an
+earlier one::
+
+    python tests/benchmark.py --scale datacenter --output new.json \\
+        --compare old.json
+
+It uses the database configured in ``testsuite.cfg``, which it wipes first,
+just like the test suite. With ``--compare``, it exits non-zero if any
+endpoint got slower, or runs more queries, by more than ``--tolerance``, or
+if the daemon's throughput fell by as much.
+
+The database's plan for each distinct query is recorded too, along with the
+number of full table scans in them; ``--plans`` prints them.
+
+When collected by pytest, only the `test_benchmark` smoke test runs, at the
+``tiny`` scale.
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import json
+import random
+import subprocess
+import sys
+import uuid
+from timeit import default_timer as timer
+
+from hil import config, deferred, model, rest, server
+from hil.flaskapp import app
+from hil.model import db
+from hil.test_common import config_testsuite, config_merge, newDB, \
+    releaseDB, QueryCounter
+
+# Sizes of the generated sites:
+SCALES = {
+    'tiny': {
+        'nodes': 40, 'nics_per_node': 4, 'vlans': 40, 'projects': 5,
+        'switches': 2,
+    },
+    'small': {
+        'nodes': 1000, 'nics_per_node': 4, 'vlans': 400, 'projects': 50,
+        'switches': 20,
+    },
+    'datacenter': {
+        'nodes': 10000, 'nics_per_node': 4, 'vlans': 4000, 'projects': 500,
+        'switches': 200,
+    },
+}
+
+# The fraction of nodes which are allocated to a project:
+ALLOCATED = 0.75
+
+# The endpoints we measure. Each maps a name to a url, which is formatted
+# with a random node, project, network, switch and port from the site:
+ENDPOINTS = {
+    'list_projects': '/v0/projects',
+    'list_nodes': '/v0/nodes/all',
+    'list_free_nodes': '/v0/nodes/free',
+    'show_node': '/v0/node/{node}',
+    'show_nodes_page': '/v0/nodes/all/detail?limit=500',
+    'list_nodes_page': '/v0/nodes/all?limit=500&fields=project,metadata',
+    'list_project_nodes': '/v0/project/{project}/nodes',
+    'list_project_networks': '/v0/project/{project}/networks',
+    'list_networks': '/v0/networks',
+    'show_network': '/v0/network/{network}',
+    'list_network_attachments': '/v0/network/{network}/attachments',
+    'list_switches': '/v0/switches',
+    'show_switch': '/v0/switch/{switch}',
+    'show_port': '/v0/switch/{switch}/port/{port}',
+}
+
+
+def configure(sizes, profile_scale):
+    """Configure HIL for the benchmark, and set up a fresh database.
+
+    `profile_scale` is the simulator's ``latency_scale``.
+    """
+    config_testsuite()
+    config_merge({
+        'extensions': {
+            'hil.ext.switches.simulator': '',
+            'hil.ext.network_allocators.null': None,
+            'hil.ext.network_allocators.vlan_pool': '',
+        },
+        'hil.ext.network_allocators.vlan_pool': {
+            'vlans': '1-%d' % sizes['vlans'],
+        },
+        'hil.ext.switches.simulator': {
+            'latency_scale': str(profile_scale),
+            'jitter': '0.1',
+        },
+    })
+    config.load_extensions()
+    server.register_drivers()
+    server.validate_state()
+    releaseDB()
+    newDB()
+
+
+def populate(sizes, profile, rand):
+    """Generate a site of the given `sizes` in the database.
+
+    Switches are simulated, using `profile`. Returns a dictionary of lists of
+    the labels of the objects created, for picking request targets.
+    """
+    from hil.ext.switches.simulator import SimulatedSwitch
+    from hil.ext.network_allocators.vlan_pool import Vlan
+
+    projects = [model.Project('project-%d' % i)
+                for i in range(sizes['projects'])]
+    db.session.add_all(projects)
+
+    switches = [SimulatedSwitch(label='switch-%d' % i,
+                                profile=profile,
+                                frontend='direct')
+                for i in range(sizes['switches'])]
+    db.session.add_all(switches)
+
+    networks = []
+    for i in range(sizes['vlans']):
+        project = projects[i % len(projects)]
+        networks.append(model.Network(owner=project,
+                                      access=[project],
+                                      allocated=True,
+                                      network_id=str(i + 1),
+                                      label='net-%d' % i))
+    db.session.add_all(networks)
+    Vlan.query.filter(Vlan.vlan_no <= sizes['vlans']) \
+        .update({'available': False}, synchronize_session=False)
+
+    ports = []
+    nic_count = 0
+    for i in range(sizes['nodes']):
+        node = model.Node(label='node-%05d' % i,
+                          obmd_uri='http://obmd.example.com/node-%d' % i,
+                          obmd_admin_token='secret')
+        if i < sizes['nodes'] * ALLOCATED:
+            node.project = projects[i % len(projects)]
+        db.session.add(node)
+        for j in range(sizes['nics_per_node']):
+            nic = model.Nic(node, 'eth%d' % j,
+                            '02:00:%02x:%02x:%02x:%02x' % (
+                                (nic_count >> 24) & 0xff,
+                                (nic_count >> 16) & 0xff,
+                                (nic_count >> 8) & 0xff,
+                                nic_count & 0xff))
+            switch = switches[nic_count % len(switches)]
+            k = nic_count // len(switches)
+            nic.port = model.Port('1/%d/%d' % (k // 48, k % 48 + 1), switch)
+            ports.append((switch.label, nic.port.label))
+            nic_count += 1
+            # Each allocated node has its first nic on one of its project's
+            # networks:
+            project_networks = networks[i % len(projects)::len(projects)]
+            if j == 0 and node.project is not None and project_networks:
+                db.session.add(model.NetworkAttachment(
+                    nic=nic,
+                    network=rand.choice(project_networks),
+                    channel='vlan/native'))
+        if i % 1000 == 999:
+            db.session.flush()
+    db.session.commit()
+
+    return {
+        'node': [node.label for node in model.Node.query],
+        'project': [project.label for project in projects],
+        'network': [network.label for network in networks],
+        'port': ports,
+    }
+
+
+def queue_actions(count, rand):
+    """Queue up to `count` networking actions, on nics of free nodes.
+
+    Returns the number of actions queued.
+    """
+    nics = model.Nic.query \
+        .join(model.Node, model.Nic.owner_id == model.Node.id) \
+        .filter(model.Node.project_id.is_(None),
+                model.Nic.port_id.isnot(None)) \
+        .order_by(model.Nic.id) \
+        .limit(count).all()
+    networks = model.Network.query.all()
+    for nic in nics:
+        db.session.add(model.NetworkingAction(
+            type='modify_port',
+            nic=nic,
+            new_network=rand.choice(networks),
+            channel='vlan/native',
+            status='PENDING',
+            uuid=str(uuid.uuid4())))
+    db.session.commit()
+    return len(nics)
+
+
+def percentile(values, p):
+    """Return the `p`th percentile of the (non-empty) list `values`, by the
+    nearest-rank method.
+    """
+    values = sorted(values)
+    rank = max(int(round(p / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def query_plans(counter):
+    """Return the database's plans for the queries `counter` recorded.
+
+    `counter` is a `QueryCounter`. Returns a list with an entry for each
+    distinct SELECT statement, giving its ``sql``, the lines of its
+    ``plan``, and the number of full table ``scans`` (that is, of tables
+    read without an index) in it.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        explain = 'EXPLAIN QUERY PLAN '
+
+        def is_scan(line):
+            """Return whether `line` of the plan is a table scan."""
+            return line.startswith('SCAN') and 'INDEX' not in line
+    else:
+        explain = 'EXPLAIN '
+
+        def is_scan(line):
+            """Return whether `line` of the plan is a table scan."""
+            return 'Seq Scan' in line
+    cursor = db.session.connection().connection.cursor()
+    plans = []
+    seen = set()
+    for statement, parameters in zip(counter.statements, counter.parameters):
+        if not statement.lstrip().upper().startswith('SELECT') or \
+                statement in seen:
+            continue
+        seen.add(statement)
+        cursor.execute(explain + statement, parameters)
+        # sqlite's plans have the text in the last column, postgres's in
+        # the only one:
+        plan = [str(row[-1]) for row in cursor.fetchall()]
+        plans.append({
+            'sql': statement,
+            'plan': plan,
+            'scans': sum(1 for line in plan if is_scan(line)),
+        })
+    cursor.close()
+    return plans
+
+
+def measure_endpoints(site, samples, rand):
+    """Make `samples` requests to each of `ENDPOINTS`.
+
+    Returns a dictionary mapping each endpoint's name to its statistics.
+    """
+    client = rest.app.test_client()
+    results = {}
+    for name, url in sorted(ENDPOINTS.items()):
+        latencies = []
+        queries = []
+        plans = None
+        for _ in range(samples):
+            switch, port = rand.choice(site['port'])
+            path = url.format(node=rand.choice(site['node']),
+                              project=rand.choice(site['project']),
+                              network=rand.choice(site['network']),
+                              switch=switch,
+                              port=port)
+            with QueryCounter() as counter:
+                start = timer()
+                resp = client.get(path)
+                latencies.append(timer() - start)
+            assert resp.status_code == 200, (path, resp.get_data())
+            queries.append(counter.count)
+            if plans is None:
+                plans = query_plans(counter)
+        results[name] = {
+            'requests': samples,
+            'mean_ms': 1000 * sum(latencies) / samples,
+            'p50_ms': 1000 * percentile(latencies, 50),
+            'p90_ms': 1000 * percentile(latencies, 90),
+            'p99_ms': 1000 * percentile(latencies, 99),
+            'max_ms': 1000 * max(latencies),
+            'requests_per_sec': samples / sum(latencies),
+            'queries_mean': float(sum(queries)) / samples,
+            'queries_max': max(queries),
+            'scans': sum(plan['scans'] for plan in plans),
+            'plans': plans,
+        }
+    return results
+
+
+def measure_daemon(actions, workers, batch_size, rand):
+    """Queue `actions` networking actions, and time the daemon draining them.
+
+    The daemon is set up the way ``hil-admin serve-networks`` does it, with
+    a session pool and a save scheduler.
+    """
+    count = queue_actions(actions, rand)
+    pool = deferred.SessionPool(60)
+    scheduler = deferred.SaveScheduler(60, 100)
+    with QueryCounter() as counter:
+        start = timer()
+        while deferred.apply_networking(workers=workers,
+                                        batch_size=batch_size,
+                                        pool=pool,
+                                        scheduler=scheduler):
+            pass
+        deferred.save_due(scheduler, pool, force=True)
+        pool.close()
+        elapsed = timer() - start
+    pending = model.NetworkingAction.query \
+        .filter_by(status='PENDING').count()
+    return {
+        'actions': count,
+        'pending_after': pending,
+        'seconds': elapsed,
+        'actions_per_sec': count / elapsed if elapsed else None,
+        'queries': counter.count,
+        'queries_per_action': float(counter.count) / count if count else None,
+        'plans': query_plans(counter),
+    }
+
+
+def run(scale='tiny', samples=20, actions=None, workers=1, batch_size=100,
+        profile='instant', latency_scale=1.0, seed=0):
+    """Run the benchmark, and return its results as a json-able dict."""
+    sizes = SCALES[scale]
+    if actions is None:
+        actions = sizes['nodes'] // 10
+    rand = random.Random(seed)
+    configure(sizes, latency_scale)
+    with app.app_context():
+        start = timer()
+        site = populate(sizes, profile, rand)
+        populate_seconds = timer() - start
+        endpoints = measure_endpoints(site, samples, rand)
+        daemon = measure_daemon(actions, workers, batch_size, rand)
+        database = db.engine.dialect.name
+    return {
+        'meta': {
+            'scale': scale,
+            'sizes': sizes,
+            'samples': samples,
+            'workers': workers,
+            'batch_size': batch_size,
+            'profile': profile,
+            'latency_scale': latency_scale,
+            'seed': seed,
+            'database': database,
+            'revision': _revision(),
+            'created': datetime.datetime.utcnow().isoformat(),
+        },
+        'populate_seconds': populate_seconds,
+        'endpoints': endpoints,
+        'daemon': daemon,
+    }
+
+
+def compare(baseline, current, tolerance):
+    """Compare the results `current` to `baseline`.
+
+    Returns a list of descriptions of regressions: endpoints whose median
+    latency or mean query count grew by more than a factor of `tolerance`,
+    and a drop in the daemon's throughput by the same factor.
+    """
+    regressions = []
+    for name, new in sorted(current['endpoints'].items()):
+        old = baseline['endpoints'].get(name)
+        if old is None:
+            continue
+        for key in 'p50_ms', 'queries_mean':
+            if new[key] > old[key] * tolerance and new[key] > old[key] + 1:
+                regressions.append('%s: %s went from %.1f to %.1f'
+                                   % (name, key, old[key], new[key]))
+    old_rate = baseline['daemon'].get('actions_per_sec')
+    new_rate = current['daemon'].get('actions_per_sec')
+    if old_rate and new_rate and new_rate * tolerance < old_rate:
+        regressions.append('daemon: actions_per_sec went from %.1f to %.1f'
+                           % (old_rate, new_rate))
+    return regressions
+
+
+def report(results, baseline=None, plans=False):
+    """Print a table of `results`, next to `baseline` if given.
+
+    If `plans` is true, the query plans are printed as well.
+    """
+    print('%-26s %10s %10s %10s %8s %6s'
+          % ('endpoint', 'p50 ms', 'p99 ms', 'req/s', 'queries', 'scans'))
+    for name, stats in sorted(results['endpoints'].items()):
+        line = '%-26s %10.1f %10.1f %10.1f %8.1f %6d' % (
+            name, stats['p50_ms'], stats['p99_ms'],
+            stats['requests_per_sec'], stats['queries_mean'],
+            stats.get('scans', 0))
+        if baseline and name in baseline['endpoints']:
+            old = baseline['endpoints'][name]
+            line += '   (was %.1f ms, %.1f queries)' % (old['p50_ms'],
+                                                        old['queries_mean'])
+        print(line)
+    daemon = results['daemon']
+    print('daemon: %d actions in %.2fs (%.1f actions/s, %.1f queries/action)'
+          % (daemon['actions'], daemon['seconds'],
+             daemon['actions_per_sec'] or 0,
+             daemon['queries_per_action'] or 0))
+    if not plans:
+        return
+    sections = sorted(results['endpoints'].items())
+    sections.append(('daemon', daemon))
+    for name, stats in sections:
+        for plan in stats.get('plans', []):
+            print('\n%s: %s' % (name, ' '.join(plan['sql'].split())))
+            for line in plan['plan']:
+                print('    ' + line)
+
+
+def _revision():
+    """Return the git revision of the source tree, or None."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short',
+                                        'HEAD']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(
+        description='Benchmark the HIL api and network daemon.')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--samples', type=int, default=50,
+                        help='requests per endpoint')
+    parser.add_argument('--actions', type=int,
+                        help='networking actions for the daemon to drain '
+                        '(default: a tenth of the nodes)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='daemon worker threads; more than one needs '
+                        'a database other than in-memory sqlite')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--profile', default='instant',
+                        help='simulated switch profile')
+    parser.add_argument('--latency-scale', type=float, default=1.0,
+                        help='multiplier for the simulated switch latencies')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare', help='compare to this earlier output')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='allowed slowdown factor for --compare')
+    parser.add_argument('--plans', action='store_true',
+                        help='print the query plans')
+    args = parser.parse_args()
+
+    results = run(scale=args.scale,
+                  samples=args.samples,
+                  actions=args.actions,
+                  workers=args.workers,
+                  batch_size=args.batch_size,
+                  profile=args.profile,
+                  latency_scale=args.latency_scale,
+                  seed=args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline, args.plans)
+    if baseline is not None:
+        regressions = compare(baseline, results, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION: ' + regression)
+        if regressions:
+            sys.exit(1)
+
+
+def test_benchmark():
+    """Run the benchmark at the smallest scale, as a smoke test."""
+    results = run(scale='tiny', samples=3)
+    assert set(results['endpoints']) == set(ENDPOINTS)
+    assert results['daemon']['actions'] > 0
+    assert results['daemon']['pending_after'] == 0
+    assert all(stats['plans'] for stats in results['endpoints'].values())
+    assert compare(results, results, 1.0) == []
+
+
+if __name__ == '__main__':
+    main()
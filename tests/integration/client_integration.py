@@ -8,6 +8,7 @@ from hil.test_common import config_testsuite, config_merge, \
     obmd_cfg, HybridHTTPClient, initial_db
 from hil.model import db
 from hil import config, deferred
+from hil.ext.switches.mock import MockSwitch
 
 import json
 import pytest
@@ -102,6 +103,9 @@ def database_authentication():
             'hil.ext.auth.null': None,
             'hil.ext.auth.database': '',
         },
+        'hil.ext.auth.database': {
+            'token_key': 'not a secret, just for the tests',
+        },
     })
     config.load_extensions()
 
@@ -180,6 +184,36 @@ class Test_node:
                 u'runway_node_1'
                 ]
 
+    def test_list_nodes_paged(self):
+        """Listing nodes a page at a time gets the same list."""
+        assert C.node.list('all', page_size=2) == C.node.list('all')
+        url = C.node.object_url('nodes', 'all')
+        pages = list(C.node.pages(url, page_size=3))
+        assert [len(page) for page in pages] == [3, 3, 1]
+
+    def test_list_nodes_filtered(self):
+        """Filter the list of nodes, and include extra fields."""
+        C.node.metadata_set('free_node_1', 'rack', 'R12')
+        assert C.node.list('all', metadata='rack=R12') == [u'free_node_1']
+        assert C.node.list('all', metadata='rack=R13') == []
+        assert C.node.list('all', project='runway') == [
+            u'runway_node_0', u'runway_node_1',
+        ]
+        assert u'no_nic_node' not in C.node.list('all',
+                                                 switch='stock_switch_0')
+        assert C.node.list('free', fields=['project', 'metadata'],
+                           page_size=2) == [
+            {u'name': u'free_node_0', u'project': None, u'metadata': {}},
+            {u'name': u'free_node_1', u'project': None,
+             u'metadata': {u'rack': u'"R12"'}},
+            {u'name': u'no_nic_node', u'project': None, u'metadata': {}},
+        ]
+
+    def test_list_nodes_bad_field(self):
+        """Asking for an unknown field is an error."""
+        with pytest.raises(FailedAPICallException):
+            C.node.list('all', fields=['nics'])
+
     def test_node_register(self):
         """Test node_register"""
         assert C.node.register("dummy-node-01",
@@ -209,6 +243,15 @@ class Test_node:
                 u'name': u'free_node_0'
                 }
 
+    def test_show_many(self):
+        """show_many shows each node, as show does."""
+        C.node.metadata_set('runway_node_0', 'rack', 'R12')
+        expected = [C.node.show(node) for node in C.node.list('all')]
+        assert C.node.show_many(page_size=3) == expected
+        assert C.node.show_many(metadata='rack') == [expected[5]]
+        assert [node['name'] for node in C.node.show_many('free')] == \
+            C.node.list('free')
+
     def test_show_node_reserved_chars(self):
         """ test for catching illegal argument characters"""
         with pytest.raises(BadArgumentError):
@@ -432,6 +475,25 @@ class Test_project:
         assert C.project.nodes_in('runway') == [
             u'runway_node_0', u'runway_node_1']
 
+    def test_list_projects_fields(self):
+        """List projects with their nodes and networks."""
+        assert C.project.list(fields=['nodes', 'networks'], page_size=1) == [
+            {u'name': u'empty-project', u'nodes': [], u'networks': []},
+            {u'name': u'manhattan',
+             u'nodes': [u'manhattan_node_0', u'manhattan_node_1'],
+             u'networks': [u'manhattan_provider', u'manhattan_pxe']},
+            {u'name': u'runway',
+             u'nodes': [u'runway_node_0', u'runway_node_1'],
+             u'networks': [u'runway_provider', u'runway_pxe']},
+        ]
+
+    def test_list_nodes_inproject_fields(self):
+        """List a project's nodes with their project."""
+        assert C.project.nodes_in('manhattan', fields=['project']) == [
+            {u'name': u'manhattan_node_0', u'project': u'manhattan'},
+            {u'name': u'manhattan_node_1', u'project': u'manhattan'},
+        ]
+
     def test_list_nodes_inproject_reserved_chars(self):
         """ test for catching illegal argument characters"""
         with pytest.raises(BadArgumentError):
@@ -522,11 +584,19 @@ class Test_switch:
         """(successful) call to list_switches"""
         assert C.switch.list() == [u'empty-switch', u'stock_switch_0']
 
+    def test_list_switches_paged(self):
+        """List switches a page at a time, with their types."""
+        assert C.switch.list(fields=['type'], page_size=1) == [
+            {u'name': u'empty-switch', u'type': MockSwitch.api_name},
+            {u'name': u'stock_switch_0', u'type': MockSwitch.api_name},
+        ]
+
     def test_show_switch(self):
         """(successful) call to show_switch"""
         assert C.switch.show('empty-switch') == {
             u'name': u'empty-switch', u'ports': [],
-            u'capabilities': ['nativeless-trunk-mode']}
+            u'capabilities': ['nativeless-trunk-mode'],
+            u'last_saved': None, u'save_pending': False}
 
     def test_show_switch_reserved_chars(self):
         """ test for catching illegal argument characters"""
@@ -698,6 +768,20 @@ class Test_user:
             u'hil_user': {u'is_admin': True, u'projects': []}
         }
 
+    def test_list_users_filtered(self):
+        """List a project's members, a page at a time."""
+        C.user.create('billy', 'pass1234', is_admin=False)
+        C.user.create('bobby', 'pass1234', is_admin=False)
+        C.user.create('sally', 'pass1234', is_admin=False)
+        C.project.create('manhattan')
+        C.user.add('billy', 'manhattan')
+        C.user.add('sally', 'manhattan')
+        assert C.user.list(project='manhattan', fields=['projects'],
+                           page_size=1) == {
+            u'billy': {u'projects': [u'manhattan']},
+            u'sally': {u'projects': [u'manhattan']},
+        }
+
     def test_user_create(self):
         """ Test user creation. """
         assert C.user.create('billy', 'pass1234', is_admin=True) is None
@@ -714,6 +798,18 @@ class Test_user:
         with pytest.raises(BadArgumentError):
             C.user.create('b/%]ill', 'pass1234', is_admin=True)
 
+    def test_create_token(self):
+        """Test creating an API token."""
+        C.project.create('manhattan')
+        token = C.user.create_token(project='manhattan', expires_in=60)
+        assert sorted(token.keys()) == ['expires', 'token']
+        with pytest.raises(FailedAPICallException):
+            C.user.create_token(expires_in=10 ** 9)
+        # We're authenticated with a password, so there's no token to
+        # delete:
+        with pytest.raises(FailedAPICallException):
+            C.user.delete_token()
+
     def test_user_delete(self):
         """ Test user deletion. """
         C.user.create('jack', 'pass1234', is_admin=True)
@@ -843,6 +939,14 @@ class Test_network:
                     u'projects': [u'runway']}
                 }
 
+    def test_network_list_filtered(self):
+        """List the networks a project can access, a page at a time."""
+        assert C.network.list(project='runway', fields=['projects'],
+                              page_size=1) == {
+            u'runway_provider': {u'projects': [u'runway']},
+            u'runway_pxe': {u'projects': [u'runway']},
+        }
+
     def test_list_network_attachments(self):
         """ Test list of network attachments """
         assert C.network.list_network_attachments(
@@ -134,6 +134,10 @@ def keystone_projects(keystone_project_uuids):
     keystone_project_uuids is the return value from the fixture of the same
     name.
     """
+    # Projects from earlier tests were dropped along with their database,
+    # so the backend can't have noticed them go:
+    from hil.ext.auth.keystone import project_cache
+    project_cache.clear()
     with app.test_request_context():
         for name in ('admin', 'service'):
             model.db.session.add(model.Project(keystone_project_uuids[name]))
@@ -316,6 +320,20 @@ def test_anyone_call_unknown_project(keystone_projects):
     )
 
 
+def test_deleted_project(keystone_projects, keystone_project_uuids):
+    """Calls by a project fail as soon as the project is deleted."""
+    sess = _get_keystone_session(username='nova',
+                                 password='nova',
+                                 project_name='service')
+    assert 200 <= _do_get(sess, 'v0/anyone').status_code < 300
+    with app.test_request_context():
+        project = model.Project.query \
+            .filter_by(label=keystone_project_uuids['service']).one()
+        model.db.session.delete(project)
+        model.db.session.commit()
+    assert 400 <= _do_get(sess, 'v0/anyone').status_code < 500
+
+
 def test_unregistered_admin():
     """Test a call by an admin with an unknown project.
 
@@ -11,7 +11,7 @@ the mix. They are still tested here, since they are important for security.
 import pytest
 import unittest
 import json
-from hil import api, config, model, deferred
+from hil import api, config, model, deferred, listing
 from hil.auth import get_auth_backend
 from hil.errors import AuthorizationError, BadArgumentError, \
     ProjectMismatchError, BlockedError
@@ -544,6 +544,15 @@ auth_call_params += [
          project='runway',
          args=['runway']),
 
+    # Project lists a page of its own nodes.
+    dict(fn=api.list_project_nodes,
+         error=None,
+         admin=False,
+         project='runway',
+         args=['runway'],
+         kwargs={'limit': 1,
+                 'cursor': listing.encode_cursor('runway_node_0')}),
+
     # Illegal Cases
     # Project lists another project's nodes.
     dict(fn=api.list_project_nodes,
@@ -552,6 +561,48 @@ auth_call_params += [
          project='runway',
          args=['manhattan']),
 
+    # Project lists a page of another project's nodes.
+    dict(fn=api.list_project_nodes,
+         error=AuthorizationError,
+         admin=False,
+         project='runway',
+         args=['manhattan'],
+         kwargs={'limit': 1}),
+
+    #
+    # list_nodes
+    #
+
+    # Legal Cases
+    # Project lists a page of all the nodes, or the free ones; these don't
+    # reveal anything without filters or fields.
+    dict(fn=api.list_nodes,
+         error=None,
+         admin=False,
+         project='runway',
+         args=['all'],
+         kwargs={'limit': 2,
+                 'cursor': listing.encode_cursor('free_node_0')}),
+    dict(fn=api.list_nodes,
+         error=None,
+         admin=False,
+         project='runway',
+         args=['free'],
+         kwargs={'limit': 1}),
+
+    #
+    # list_networks
+    #
+
+    # Legal Cases
+    # Project lists a page of the networks, filtered by project.
+    dict(fn=api.list_networks,
+         error=None,
+         admin=False,
+         project='runway',
+         args=[],
+         kwargs={'project': 'runway', 'limit': 1, 'fields': 'projects'}),
+
     #
     # show_node
     #
@@ -664,6 +715,19 @@ admin_calls = [
     (api.node_delete_metadata, ['runway_node_0', 'EK'], {}),
     (api.port_revert, ['stock_switch_0', 'free_node_0_port'], {}),
     (api.list_active_extensions, [], {}),
+
+    # Filtering the list of all nodes, or asking for details, reveals how
+    # they are allocated:
+    (api.list_nodes, ['all'], {'project': 'runway'}),
+    (api.list_nodes, ['free'], {'metadata': 'EK'}),
+    (api.list_nodes, ['all'], {'fields': 'project'}),
+    (api.list_project_nodes, ['runway'], {'switch': 'stock_switch_0'}),
+    (api.list_nodes, ['all'], {'switch': 'stock_switch_0', 'limit': 1}),
+    (api.list_nodes, ['free'], {'network': 'stock_int_pub'}),
+
+    (api.list_projects, [], {'limit': 1, 'fields': 'nodes,networks'}),
+    (api.list_switches, [], {}),
+    (api.list_switches, [], {'limit': 1, 'fields': 'type'}),
 ]
 
 
@@ -698,6 +762,13 @@ project_calls = [
 
     (api.list_project_headnodes, ['runway'], {}),
     (api.show_headnode, ['runway_headnode_on'], {}),
+    (api.list_project_nodes, ['runway'], {'fields': 'project,metadata'}),
+    (api.list_project_nodes, ['runway'], {'network': 'stock_int_pub'}),
+    (api.list_project_nodes, ['runway'], {'metadata': 'EK=pk', 'limit': 1}),
+    (api.list_project_nodes, ['runway'], {
+        'limit': 1,
+        'cursor': listing.encode_cursor('runway_node_0'),
+    }),
 ]
 
 
@@ -41,10 +41,13 @@ General advice on working with this module:
   readability and maintainability.
 * make sure it is easy to see what a new test is trying to verify.
 """
-from hil import model, deferred, errors, config, api
+from hil import model, deferred, errors, config, api, listing
+from hil.flaskapp import app
+from hil.model import db
 from hil.test_common import config_testsuite, config_merge, fresh_database, \
     fail_on_log_warnings, additional_db, with_request_context, \
-    network_create_simple, server_init, uuid_pattern, spoof_enable_obm
+    network_create_simple, server_init, uuid_pattern, spoof_enable_obm, \
+    QueryCounter
 from hil.network_allocator import get_network_allocator
 from hil.auth import get_auth_backend
 import pytest
@@ -118,6 +121,25 @@ def new_node(name):
     )
 
 
+def list_pages(call, *args, **kwargs):
+    """Return the pages of a paginated list call.
+
+    `call` is called with `args` and `kwargs` (which should include
+    ``limit``), and then again with the cursor from each response's
+    `listing.NEXT_CURSOR_HEADER`, until a response has none. Each call is made
+    in a request context of its own, so that its header can be read.
+    """
+    pages = []
+    cursor = None
+    while True:
+        with app.test_request_context():
+            pages.append(json.loads(call(*args, cursor=cursor, **kwargs)))
+            response = app.process_response(app.response_class())
+        cursor = response.headers.get(listing.NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return pages
+
+
 default_fixtures = ['fail_on_log_warnings',
                     'configure',
                     'fresh_database',
@@ -1602,6 +1624,8 @@ class Test_list_show_switch:
             'name': 'sw0',
             'ports': [{'label': PORTS[2]}],
             'capabilities': ['nativeless-trunk-mode'],
+            'last_saved': None,
+            'save_pending': False,
         }
 
         api.switch_register_port('sw0', PORTS[1])
@@ -1612,6 +1636,8 @@ class Test_list_show_switch:
             'ports': [{'label': PORTS[2]},
                       {'label': PORTS[1]}],
             'capabilities': ['nativeless-trunk-mode'],
+            'last_saved': None,
+            'save_pending': False,
         }
 
 
@@ -1858,6 +1884,139 @@ class TestQuery_populated_db:
             }
         assert actual == expected
 
+    @pytest.mark.parametrize('call,args', [
+        (api.list_projects, []),
+        (api.list_switches, []),
+        (api.list_networks, []),
+        (api.list_nodes, ['all']),
+        (api.list_nodes, ['free']),
+        (api.list_project_nodes, ['runway']),
+    ])
+    def test_list_paginated(self, call, args):
+        """Listing a page at a time gets the same items as listing them all,
+        with no empty pages.
+        """
+        expected = json.loads(call(*args))
+        pages = list_pages(call, *args, limit=2)
+        assert len(pages) == (len(expected) + 1) // 2
+        if isinstance(expected, list):
+            assert sum(pages, []) == expected
+        else:
+            merged = {}
+            for page in pages:
+                merged.update(page)
+            assert merged == expected
+
+    def test_list_cursor(self):
+        """A cursor continues after the name it was made from, and a bad one
+        is an error.
+        """
+        cursor = listing.encode_cursor('manhattan_node_1')
+        assert json.loads(api.list_nodes('all', cursor=cursor)) == [
+            'no_nic_node', 'runway_node_0', 'runway_node_1',
+        ]
+        assert json.loads(api.list_nodes('all', limit=1, cursor=cursor)) == [
+            'no_nic_node',
+        ]
+        with pytest.raises(errors.BadArgumentError):
+            api.list_nodes('all', cursor='not a cursor')
+
+    def test_list_fields(self):
+        """Ask the list calls for extra fields."""
+        assert json.loads(api.list_projects(fields='nodes,networks')) == [
+            {'name': 'empty-project', 'nodes': [], 'networks': []},
+            {'name': 'manhattan',
+             'nodes': ['manhattan_node_0', 'manhattan_node_1'],
+             'networks': ['manhattan_provider', 'manhattan_pxe',
+                          'manhattan_runway_provider',
+                          'manhattan_runway_pxe']},
+            {'name': 'runway',
+             'nodes': ['runway_node_0', 'runway_node_1'],
+             'networks': ['manhattan_runway_provider', 'manhattan_runway_pxe',
+                          'runway_provider', 'runway_pxe']},
+        ]
+        assert json.loads(api.list_switches(fields='type', limit=1)) == [
+            {'name': 'empty-switch', 'type': MOCK_SWITCH_TYPE},
+        ]
+        assert json.loads(api.list_networks(project='runway',
+                                            fields='projects')) == {
+            'manhattan_runway_provider': {'projects': ['manhattan', 'runway']},
+            'manhattan_runway_pxe': {'projects': ['manhattan', 'runway']},
+            'runway_provider': {'projects': ['runway']},
+            'runway_pxe': {'projects': ['runway']},
+        }
+        assert json.loads(api.list_nodes('all', fields='project',
+                                         limit=1)) == [
+            {'name': 'free_node_0', 'project': None},
+        ]
+        result = json.loads(api.list_project_nodes('runway',
+                                                   fields='project,metadata'))
+        assert [node['name'] for node in result] == \
+            ['runway_node_0', 'runway_node_1']
+        assert result[0]['project'] == 'runway'
+        assert sorted(result[0]['metadata']) == ['EK', 'SHA256']
+        assert result[1]['metadata'] == {}
+
+        for call, args in [(api.list_projects, []),
+                           (api.list_switches, []),
+                           (api.list_networks, []),
+                           (api.list_nodes, ['all'])]:
+            with pytest.raises(errors.BadArgumentError):
+                call(*args, fields='nics')
+
+    def test_list_nodes_filters(self):
+        """Filter the list of nodes by project, metadata, switch and
+        network.
+        """
+        def _list(*args, **kwargs):
+            return json.loads(api.list_nodes(*args, **kwargs))
+
+        api.node_connect_network('manhattan_node_0', 'boot-nic',
+                                 'manhattan_runway_pxe')
+        deferred.apply_networking()
+
+        assert _list('all', project='runway') == \
+            ['runway_node_0', 'runway_node_1']
+        assert _list('free', project='runway') == []
+        assert _list('all', metadata='EK') == ['runway_node_0']
+        assert _list('all', metadata='rack') == []
+        assert _list('all', switch='empty-switch') == []
+        assert 'no_nic_node' not in _list('all', switch='stock_switch_0')
+        assert len(_list('all', switch='stock_switch_0')) == 6
+        assert _list('all', network='manhattan_runway_pxe') == \
+            ['manhattan_node_0']
+        assert _list('all', network='manhattan_runway_pxe',
+                     project='runway') == []
+        assert json.loads(api.list_project_nodes(
+            'manhattan', network='manhattan_runway_pxe')) == \
+            ['manhattan_node_0']
+
+        for kwargs in [{'project': 'anvil-nextgen'},
+                       {'switch': 'sw0'},
+                       {'network': 'spiderwebs'}]:
+            with pytest.raises(errors.NotFoundError):
+                _list('all', **kwargs)
+
+    def test_list_nodes_metadata_value(self):
+        """Metadata filters match values stored as JSON, as well as strings.
+        """
+        api.node_set_metadata('free_node_0', 'rack', 12)
+        api.node_set_metadata('free_node_1', 'rack', '12')
+        api.node_set_metadata('manhattan_node_0', 'rack', 'R12')
+        api.node_set_metadata('manhattan_node_1', 'rack', {'row': 3})
+        api.node_set_metadata('runway_node_1', 'up', True)
+
+        def _list(metadata):
+            return json.loads(api.list_nodes('all', metadata=metadata))
+
+        assert _list('rack=12') == ['free_node_0', 'free_node_1']
+        assert _list('rack="12"') == ['free_node_1']
+        assert _list('rack=R12') == ['manhattan_node_0']
+        assert _list('rack={"row": 3}') == ['manhattan_node_1']
+        assert _list('rack={"row":3}') == ['manhattan_node_1']
+        assert _list('up=true') == ['runway_node_1']
+        assert _list('up=false') == []
+
 
 class TestQuery_unpopulated_db:
     """test portions of the query api with a fresh database"""
@@ -2068,6 +2227,109 @@ class TestQuery_unpopulated_db:
         }
         self._compare_node_dumps(actual, expected)
 
+    def test_show_node_query_count(self):
+        """The number of queries show_node makes doesn't depend on the
+        number of nics, attachments or metadata.
+        """
+        def _show_node_queries():
+            """Return the number of queries a fresh show_node makes."""
+            db.session.expire_all()
+            with QueryCounter() as counter:
+                api.show_node('robocop')
+            return counter.count
+
+        api.switch_register('sw0',
+                            type=MOCK_SWITCH_TYPE,
+                            username="switch_user",
+                            password="switch_pass",
+                            hostname="switchname")
+        new_node('robocop')
+        api.project_create('anvil-nextgen')
+        api.project_connect_node('anvil-nextgen', 'robocop')
+        api.node_register_nic('robocop', 'eth0', 'DE:AD:BE:EF:20:14')
+        api.switch_register_port('sw0', PORTS[0])
+        api.port_connect_nic('sw0', PORTS[0], 'robocop', 'eth0')
+        network_create_simple('net-0', 'anvil-nextgen')
+        api.node_connect_network('robocop', 'eth0', 'net-0')
+        deferred.apply_networking()
+        queries = _show_node_queries()
+
+        for i in range(1, len(PORTS)):
+            nic = 'eth%d' % i
+            api.node_register_nic('robocop', nic, 'DE:AD:BE:EF:20:%02d' % i)
+            api.switch_register_port('sw0', PORTS[i])
+            api.port_connect_nic('sw0', PORTS[i], 'robocop', nic)
+            api.node_set_metadata('robocop', 'key%d' % i, 'value')
+            for j in range(3):
+                network = 'net-%d-%d' % (i, j)
+                network_create_simple(network, 'anvil-nextgen')
+                vlan = model.Network.query.filter_by(label=network).one() \
+                    .network_id
+                api.node_connect_network('robocop', nic, network,
+                                         channel='vlan/' + vlan)
+                deferred.apply_networking()
+
+        assert _show_node_queries() == queries
+        assert queries <= 5
+
+    def test_show_nodes(self):
+        """show_nodes shows the same as show_node, for many nodes, with a
+        fixed number of queries.
+        """
+        def _queries():
+            """Return the result of show_nodes, and the number of queries it
+            makes.
+            """
+            db.session.expire_all()
+            with QueryCounter() as counter:
+                result = json.loads(api.show_nodes('all'))
+            return result, counter.count
+
+        api.switch_register('sw0',
+                            type=MOCK_SWITCH_TYPE,
+                            username="switch_user",
+                            password="switch_pass",
+                            hostname="switchname")
+        api.project_create('anvil-nextgen')
+        network_create_simple('pxe', 'anvil-nextgen')
+        new_node('node-free')
+        _, queries = _queries()
+
+        for i, port in enumerate(PORTS):
+            node = 'node-%d' % i
+            new_node(node)
+            api.node_register_nic(node, 'eth0', 'DE:AD:BE:EF:20:%02d' % i)
+            api.node_register_nic(node, 'eth1', 'DE:AD:BE:EF:21:%02d' % i)
+            api.node_set_metadata(node, 'rack', 'R%d' % i)
+            api.switch_register_port('sw0', port)
+            api.port_connect_nic('sw0', port, node, 'eth0')
+            api.project_connect_node('anvil-nextgen', node)
+            api.node_connect_network(node, 'eth0', 'pxe')
+            deferred.apply_networking()
+
+        result, new_queries = _queries()
+        assert new_queries == queries
+        assert [node['name'] for node in result] == \
+            ['node-%d' % i for i in range(len(PORTS))] + ['node-free']
+        for node in result:
+            assert node == json.loads(api.show_node(node['name']))
+
+        # Non-admins only see free nodes, and those in their projects:
+        api.project_create('empty-project')
+        auth = get_auth_backend()
+        auth.set_admin(False)
+        auth.set_project(api.get_or_404(model.Project, 'empty-project'))
+        assert json.loads(api.show_nodes('all')) == [{
+            'name': 'node-free',
+            'project': None,
+            'nics': [],
+            'metadata': {},
+        }]
+        auth.set_project(api.get_or_404(model.Project, 'anvil-nextgen'))
+        result = json.loads(api.show_nodes('all', metadata='rack=R1'))
+        assert result == [json.loads(api.show_node('node-1'))]
+        assert 'port' not in result[0]['nics'][0]
+
     def test_show_nonexistent_node(self):
         """Showing a node that does not exist should raise not found."""
         with pytest.raises(errors.NotFoundError):
@@ -2325,6 +2587,60 @@ class TestShowNetwork:
                                 'node-anvil': ['eth0']},
         }
 
+    def test_network_query_count(self):
+        """Showing a network, its attachments or the list of networks takes
+        the same number of queries however many nodes are attached.
+        """
+        def _queries(call, *args):
+            """Return the number of queries `call(*args)` makes."""
+            db.session.expire_all()
+            with QueryCounter() as counter:
+                call(*args)
+            return counter.count
+
+        def _counts():
+            """Return the query counts of each call, as a non-admin member
+            of 'pineapple'.
+            """
+            auth = get_auth_backend()
+            auth.set_admin(False)
+            auth.set_project(api.get_or_404(model.Project, 'pineapple'))
+            counts = [_queries(api.show_network, 'pxe')]
+            auth.set_admin(True)
+            counts += [
+                _queries(api.list_networks),
+                _queries(api.list_network_attachments, 'pxe'),
+                _queries(api.list_network_attachments, 'pxe', 'pineapple'),
+            ]
+            return counts
+
+        def _attach(node, project):
+            """Register `node` in `project`, and attach it to 'pxe'."""
+            new_node(node)
+            api.node_register_nic(node, 'eth0', 'DE:AD:BE:EF:20:14')
+            api.switch_register_port('sw0', node)
+            api.port_connect_nic('sw0', node, node, 'eth0')
+            api.project_connect_node(project, node)
+            api.node_connect_network(node, 'eth0', 'pxe')
+            deferred.apply_networking()
+
+        api.switch_register('sw0',
+                            type=MOCK_SWITCH_TYPE,
+                            username="switch_user",
+                            password="switch_pass",
+                            hostname="switchname")
+        api.project_create('anvil-nextgen')
+        api.project_create('pineapple')
+        api.network_create('pxe', owner='admin', access='', net_id='432')
+        _attach('gi1/0/1', 'anvil-nextgen')
+        _attach('gi1/0/2', 'pineapple')
+        counts = _counts()
+
+        for i in range(3, 9):
+            _attach('gi1/0/%d' % i, ['anvil-nextgen', 'pineapple'][i % 2])
+            network_create_simple('net-%d' % i, 'pineapple')
+        assert _counts() == counts
+
 
 class TestFancyNetworkCreate:
     """Test creating network with advanced parameters.
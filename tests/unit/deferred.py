@@ -2,10 +2,13 @@
 
 import pytest
 import tempfile
+import threading
 import uuid
 
+from datetime import datetime, timedelta
+
 from hil import config, deferred, model, api
-from hil.model import db, Switch
+from hil.model import db, Switch, SwitchSession
 from hil.errors import SwitchError
 from hil.test_common import config_testsuite, config_merge, \
                              fresh_database
@@ -15,6 +18,16 @@ from flask_sqlalchemy import SQLAlchemy
 fresh_database = pytest.fixture(fresh_database)
 
 DeferredTestSwitch = None
+RecordingTestSwitch = None
+
+# Calls made to RecordingTestSwitch, as (switch label, port label) pairs:
+recorded_calls = []
+
+# Calls made to RecordingTestSwitch.apply_port_changes, as lists of changes:
+recorded_bulk_calls = []
+
+# Every RecordingSession created, in order:
+recorded_sessions = []
 
 
 class RevertPortError(SwitchError):
@@ -24,6 +37,66 @@ class RevertPortError(SwitchError):
     """
 
 
+class RecordingSession(SwitchSession):
+    """The session for a RecordingTestSwitch.
+
+    Calls to modify_port and revert_port are recorded in `recorded_calls`,
+    and calls to apply_port_changes in `recorded_bulk_calls`.
+
+    Tests can set `alive` to False to make the session look broken, and
+    `failures` to the number of following calls which should raise IOError.
+
+    Like the console drivers, the session saves the running config when it
+    is disconnected, unless told otherwise; `saves` counts the saves.
+    """
+
+    save_on_disconnect = True
+
+    def __init__(self, switch):
+        self.switch = switch
+        self.alive = True
+        self.disconnected = False
+        self.failures = 0
+        self.saves = 0
+        recorded_sessions.append(self)
+
+    def disconnect(self):
+        """Record that the session was disconnected."""
+        assert not self.disconnected
+        if self.save_on_disconnect:
+            self.save_running_config()
+        self.disconnected = True
+
+    def save_running_config(self):
+        """Count the save."""
+        self.saves += 1
+
+    def is_alive(self):
+        """Return self.alive."""
+        return self.alive
+
+    def _maybe_fail(self):
+        """Raise IOError if we've been told to fail."""
+        if self.failures:
+            self.failures -= 1
+            raise IOError("Connection reset by peer")
+
+    def modify_port(self, port, channel, new_network):
+        """Implement SwitchSession.modify_port, by recording the call."""
+        self._maybe_fail()
+        recorded_calls.append((self.switch.label, port))
+
+    def revert_port(self, port):
+        """Implement SwitchSession.revert_port, by recording the call."""
+        self._maybe_fail()
+        recorded_calls.append((self.switch.label, port))
+
+    def apply_port_changes(self, changes):
+        """Record the call, then apply the changes one at a time."""
+        recorded_bulk_calls.append(changes)
+        return SwitchSession.apply_port_changes(self, changes)
+
+
 def new_db():
     """ returns a new database connection"""
     local_app = Flask(__name__.split('.')[0])
@@ -152,6 +225,43 @@ def _deferred_test_switch_class():
     DeferredTestSwitch = DeferredTestSwitch_
 
 
+@pytest.fixture()
+def _recording_test_switch_class():
+    global RecordingTestSwitch
+
+    class RecordingTestSwitch_(Switch):
+        '''RecordingTestSwitch
+
+        This is a switch whose sessions (see `RecordingSession`) record the
+        calls made to them, so that tests can check the order in which
+        apply_networking() applied actions.
+
+        Like DeferredTestSwitch, it is defined inside a fixture so that the
+        migration tests don't pick it up.
+        '''
+
+        api_name = 'http://schema.massopencloud.org/haas/v0/switches/recording'
+
+        __mapper_args__ = {
+            'polymorphic_identity': api_name,
+        }
+
+        id = db.Column(db.Integer,
+                       db.ForeignKey('switch.id'),
+                       primary_key=True)
+
+        @staticmethod
+        def validate(kwargs):
+            """Implement Switch.validate; this doesn't check anything."""
+
+        def session(self):
+            """Return a new RecordingSession."""
+            return RecordingSession(self)
+
+    RecordingTestSwitch_.__name__ = 'RecordingTestSwitch'
+    RecordingTestSwitch = RecordingTestSwitch_
+
+
 @pytest.fixture()
 def switch(_deferred_test_switch_class):
     """Get an instance of DeferredTestSwitch."""
@@ -188,6 +298,27 @@ def network():
     return model.Network(project, [], True, '102', 'hammernet')
 
 
+def _queue_action(switch, port, network, commit=True):
+    """Queue a modify_port action connecting a new nic on ``port`` of
+    ``switch`` to ``network``, and return it.
+
+    If ``commit`` is False, the action is only added to the session, so that
+    several can be queued in one transaction.
+    """
+    nic = new_nic(port)
+    nic.port = model.Port(label=port, switch=switch)
+    action = model.NetworkingAction(nic=nic,
+                                    new_network=network,
+                                    channel='vlan/native',
+                                    type='modify_port',
+                                    uuid=str(uuid.uuid4()),
+                                    status='PENDING')
+    db.session.add(action)
+    if commit:
+        db.session.commit()
+    return action
+
+
 pytestmark = pytest.mark.usefixtures('configure')
 
 
@@ -298,3 +429,316 @@ def test_apply_networking(switch, network, fresh_database):
 
     local_db.session.commit()
     local_db.session.close()
+
+
+def test_apply_networking_parallel(_recording_test_switch_class, network,
+                                   fresh_database):
+    """apply_networking with several workers should apply every action, in
+    journal order for each switch.
+    """
+    switches = [RecordingTestSwitch(label='switch-%d' % i) for i in range(3)]
+    expected = {sw.label: [] for sw in switches}
+    for i in range(12):
+        sw = switches[i % len(switches)]
+        port = 'gi1/0/%d' % i
+        _queue_action(sw, port, network, commit=False)
+        expected[sw.label].append(port)
+    db.session.commit()
+
+    assert deferred.apply_networking(workers=2) is True
+    assert deferred.apply_networking(workers=2) is False
+
+    for sw_label, ports in expected.items():
+        assert [port for label, port in recorded_calls
+                if label == sw_label] == ports
+
+    local_db = new_db()
+    statuses = local_db.session.query(model.NetworkingAction.status).all()
+    assert [status for (status,) in statuses] == ['DONE'] * 12
+    local_db.session.commit()
+    local_db.session.close()
+
+
+def test_apply_networking_batched(_recording_test_switch_class, network,
+                                  fresh_database, monkeypatch):
+    """apply_networking should commit the results of each batch of actions
+    together, and apply every action in journal order.
+    """
+    sw = RecordingTestSwitch(label='switch')
+    for i in range(10):
+        _queue_action(sw, 'gi1/0/%d' % i, network, commit=False)
+    db.session.commit()
+
+    pending_counts = []
+    modify_port = RecordingSession.modify_port
+
+    def counting_modify_port(self, port, channel, new_network):
+        """Record the committed number of pending actions, then call the
+        real modify_port.
+        """
+        local_db = new_db()
+        pending_counts.append(local_db.session
+                              .query(model.NetworkingAction)
+                              .filter_by(status='PENDING')
+                              .count())
+        local_db.session.commit()
+        local_db.session.close()
+        modify_port(self, port, channel, new_network)
+
+    monkeypatch.setattr(RecordingSession, 'modify_port',
+                        counting_modify_port)
+
+    assert deferred.apply_networking(batch_size=4) is True
+    assert deferred.apply_networking(batch_size=4) is False
+
+    assert pending_counts == [10] * 4 + [6] * 4 + [2] * 2
+    assert [port for _, port in recorded_calls] == \
+        ['gi1/0/%d' % i for i in range(10)]
+
+
+def test_apply_networking_stop(_recording_test_switch_class, network,
+                               fresh_database, monkeypatch):
+    """Once the stop event is set, apply_networking should finish the batch
+    in progress, and not start another.
+    """
+    sw = RecordingTestSwitch(label='switch')
+    for i in range(10):
+        _queue_action(sw, 'gi1/0/%d' % i, network)
+
+    stop = threading.Event()
+    modify_port = RecordingSession.modify_port
+
+    def stopping_modify_port(self, port, channel, new_network):
+        """Set the stop event, then call the real modify_port."""
+        stop.set()
+        modify_port(self, port, channel, new_network)
+
+    monkeypatch.setattr(RecordingSession, 'modify_port',
+                        stopping_modify_port)
+
+    assert deferred.apply_networking(batch_size=4, stop=stop) is True
+    assert len(recorded_calls) == 4
+    assert model.NetworkingAction.query \
+        .filter_by(status='PENDING').count() == 6
+
+
+def test_apply_networking_leases(_recording_test_switch_class, network,
+                                 fresh_database):
+    """apply_networking should leave alone switches on which another daemon
+    holds a lease, and take over that daemon's actions once it expires.
+    """
+    switches = [RecordingTestSwitch(label='switch-%d' % i) for i in range(2)]
+    actions = [_queue_action(switches[min(i, 1)], 'gi1/0/%d' % i, network,
+                             commit=False)
+               for i in range(3)]
+    # Another daemon is working on switch-1:
+    actions[1].claimed_by = 'other-daemon'
+    actions[1].lease_expires = datetime.utcnow() + timedelta(hours=1)
+    db.session.commit()
+    action_ids = [action.id for action in actions]
+
+    def statuses():
+        """Return the statuses of the actions, in order."""
+        return [model.NetworkingAction.query.get(action_id).status
+                for action_id in action_ids]
+
+    assert deferred.apply_networking() is True
+    assert deferred.apply_networking() is False
+    assert recorded_calls == [('switch-0', 'gi1/0/0')]
+    assert statuses() == ['DONE', 'PENDING', 'PENDING']
+
+    # The other daemon dies, and its lease runs out:
+    actions[1].lease_expires = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert deferred.apply_networking() is True
+    assert recorded_calls == [('switch-0', 'gi1/0/0'),
+                              ('switch-1', 'gi1/0/1'),
+                              ('switch-1', 'gi1/0/2')]
+    assert statuses() == ['DONE', 'DONE', 'DONE']
+    assert model.NetworkingAction.query.get(action_ids[1]).claimed_by == \
+        deferred.daemon_id()
+
+
+def test_wake_daemon_socket(fresh_database, tmpdir):
+    """ActionListener should be woken by wake_daemon via the notify socket,
+    but only once the transaction commits.
+    """
+    config_merge({
+        'network-daemon': {
+            'notify_socket': str(tmpdir.join('daemon.sock')),
+        },
+    })
+    listener = deferred.ActionListener()
+    try:
+        assert listener.wait(0.01) is False
+        deferred.wake_daemon()
+        assert listener.wait(0.01) is False
+        db.session.commit()
+        assert listener.wait(5) is True
+        # The notification has been consumed:
+        assert listener.wait(0.01) is False
+    finally:
+        listener.close()
+    assert not tmpdir.join('daemon.sock').exists()
+
+
+def test_apply_networking_bulk(_recording_test_switch_class, network,
+                               fresh_database):
+    """apply_networking should hand all of the actions in a batch for the
+    same switch to its session at once.
+    """
+    switches = [RecordingTestSwitch(label='switch-%d' % i) for i in range(2)]
+    for i in range(5):
+        _queue_action(switches[min(i, 1)], 'gi1/0/%d' % i, network,
+                      commit=False)
+    db.session.commit()
+
+    assert deferred.apply_networking(batch_size=100) is True
+
+    # switch-0 only has one action, so it is applied on its own:
+    assert recorded_bulk_calls == [[
+        model.PortChange('gi1/0/%d' % i, 'vlan/native', '102')
+        for i in range(1, 5)
+    ]]
+    assert len(recorded_calls) == 5
+    assert [a.status for a in model.NetworkingAction.query] == ['DONE'] * 5
+    assert model.NetworkAttachment.query.count() == 5
+
+
+def test_session_pool(_recording_test_switch_class, network,
+                      fresh_database):
+    """With a SessionPool, sessions should be kept open between calls to
+    apply_networking, until they have been idle for too long.
+    """
+    sw = RecordingTestSwitch(label='switch')
+    pool = deferred.SessionPool(idle_timeout=3600)
+
+    _queue_action(sw, 'gi1/0/1', network)
+    assert deferred.apply_networking(pool=pool) is True
+    _queue_action(sw, 'gi1/0/2', network)
+    assert deferred.apply_networking(pool=pool) is True
+    assert len(recorded_sessions) == 1
+    assert not recorded_sessions[0].disconnected
+
+    # Not idle for long enough yet:
+    pool.reap()
+    assert not recorded_sessions[0].disconnected
+
+    pool.idle_timeout = 0
+    pool.reap()
+    assert recorded_sessions[0].disconnected
+
+    _queue_action(sw, 'gi1/0/3', network)
+    assert deferred.apply_networking(pool=pool) is True
+    assert len(recorded_sessions) == 2
+    pool.close()
+    assert recorded_sessions[1].disconnected
+    assert len(recorded_calls) == 3
+
+
+def test_session_pool_reconnect(_recording_test_switch_class, network,
+                                fresh_database):
+    """Pooled sessions which are dead, or which fail, should be replaced."""
+    sw = RecordingTestSwitch(label='switch')
+    pool = deferred.SessionPool(idle_timeout=3600)
+
+    _queue_action(sw, 'gi1/0/1', network)
+    assert deferred.apply_networking(pool=pool) is True
+
+    # The session fails its liveness check:
+    recorded_sessions[0].alive = False
+    _queue_action(sw, 'gi1/0/2', network)
+    assert deferred.apply_networking(pool=pool) is True
+    assert recorded_sessions[0].disconnected
+    assert len(recorded_sessions) == 2
+
+    # The session looks alive, but the connection has gone away:
+    recorded_sessions[1].failures = 1
+    _queue_action(sw, 'gi1/0/3', network)
+    assert deferred.apply_networking(pool=pool) is True
+    assert recorded_sessions[1].disconnected
+    assert len(recorded_sessions) == 3
+
+    assert [port for _, port in recorded_calls] == \
+        ['gi1/0/1', 'gi1/0/2', 'gi1/0/3']
+    assert [a.status for a in model.NetworkingAction.query] == ['DONE'] * 3
+    pool.close()
+
+
+def test_save_scheduler(_recording_test_switch_class, network,
+                        fresh_database):
+    """With a SaveScheduler, switches should only be saved once enough
+    changes have built up, or when forced.
+    """
+    sw = RecordingTestSwitch(label='switch')
+    db.session.commit()
+    pool = deferred.SessionPool(idle_timeout=3600)
+    scheduler = deferred.SaveScheduler(window=3600, max_changes=3)
+
+    def apply_networking():
+        """Call apply_networking with the pool and scheduler."""
+        assert deferred.apply_networking(pool=pool, scheduler=scheduler)
+
+    _queue_action(sw, 'gi1/0/1', network)
+    _queue_action(sw, 'gi1/0/2', network)
+    apply_networking()
+    deferred.save_due(scheduler, pool)
+    assert recorded_sessions[0].saves == 0
+    assert model.Switch.query.one().save_pending is True
+
+    _queue_action(sw, 'gi1/0/3', network)
+    apply_networking()
+    deferred.save_due(scheduler, pool)
+    assert recorded_sessions[0].saves == 1
+    assert model.Switch.query.one().save_pending is False
+    assert model.Switch.query.one().last_saved is not None
+
+    _queue_action(sw, 'gi1/0/4', network)
+    apply_networking()
+    deferred.save_due(scheduler, pool)
+    assert recorded_sessions[0].saves == 1
+    deferred.save_due(scheduler, pool, force=True)
+    assert recorded_sessions[0].saves == 2
+
+    # Disconnecting doesn't save again:
+    pool.close()
+    assert recorded_sessions[0].saves == 2
+    assert len(recorded_sessions) == 1
+
+
+def test_save_due_failure(_recording_test_switch_class, network,
+                          fresh_database, monkeypatch):
+    """If saving one switch fails, save_due should still save the others,
+    and leave the failed one pending.
+    """
+    switches = [RecordingTestSwitch(label='sw0'),
+                RecordingTestSwitch(label='sw1')]
+    db.session.commit()
+    pool = deferred.SessionPool(idle_timeout=3600)
+    scheduler = deferred.SaveScheduler(window=3600, max_changes=100)
+    for sw in switches:
+        _queue_action(sw, 'gi1/0/1', network)
+    assert deferred.apply_networking(pool=pool, scheduler=scheduler)
+
+    save_running_config = RecordingSession.save_running_config
+
+    def failing_save_running_config(self):
+        """Fail to save sw0."""
+        if self.switch.label == 'sw0':
+            raise IOError("Connection reset by peer")
+        save_running_config(self)
+
+    monkeypatch.setattr(RecordingSession, 'save_running_config',
+                        failing_save_running_config)
+    deferred.save_due(scheduler, pool, force=True)
+
+    pending = {sw.label: sw.save_pending for sw in model.Switch.query}
+    assert pending == {'sw0': True, 'sw1': False}
+    assert scheduler.due(force=True) == ['sw0']
+    # sw0's pooled session was retried on a fresh one, and neither was
+    # returned to the pool:
+    assert [(session.switch.label, session.disconnected)
+            for session in recorded_sessions] == \
+        [('sw0', True), ('sw1', False), ('sw0', True)]
+    pool.close()
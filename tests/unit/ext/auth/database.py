@@ -1,7 +1,7 @@
 """Test the database auth backend."""
-from hil import api, model, config, errors
+from hil import api, model, config, errors, listing
 from hil.test_common import config_testsuite, config_merge, fresh_database, \
-    ModelTest, fail_on_log_warnings, server_init
+    ModelTest, QueryCounter, fail_on_log_warnings, server_init
 from hil.flaskapp import app
 from hil.model import db
 from hil.rest import init_auth, local
@@ -9,6 +9,8 @@ import flask
 import pytest
 import unittest
 import json
+import time
+from datetime import datetime, timedelta
 
 fail_on_log_warnings = pytest.fixture(autouse=True)(fail_on_log_warnings)
 server_init = pytest.fixture(server_init)
@@ -52,6 +54,9 @@ def configure():
             'hil.ext.auth.database': '',
             'hil.ext.auth.null': None,
         },
+        'hil.ext.auth.database': {
+            'token_key': 'not a secret, just for the tests',
+        },
     })
     config.load_extensions()
 
@@ -95,6 +100,8 @@ class FakeAuthRequest(object):
     database auth plugin to work.
     """
 
+    headers = {}
+
     def __init__(self, username, password):
         self.username = username
         self.password = password
@@ -116,6 +123,16 @@ class FakeNoAuthRequest(object):
     unauthenticated.
     """
     authorization = None
+    headers = {}
+
+
+class FakeTokenRequest(object):
+    """Fake request object, authenticated with an API token."""
+
+    authorization = None
+
+    def __init__(self, token):
+        self.headers = {'Authorization': 'Bearer ' + token}
 
 
 @pytest.fixture
@@ -170,6 +187,23 @@ class TestListUsers(DBAuthTestCase):
             u'bob': {u'is_admin': False, u'projects': []},
             }
 
+    def test_list_users_paginated(self):
+        """List users a page at a time, filtered and with some fields."""
+        assert json.loads(self.dbauth.list_users(limit=1)) == {
+            u'alice': {u'is_admin': True, u'projects': [u'runway']},
+        }
+        cursor = listing.encode_cursor('alice')
+        assert json.loads(self.dbauth.list_users(limit=1, cursor=cursor,
+                                                 fields='is_admin')) == {
+            u'bob': {u'is_admin': False},
+        }
+        assert json.loads(self.dbauth.list_users(project='runway',
+                                                 fields='projects')) == {
+            u'alice': {u'projects': [u'runway']},
+        }
+        with pytest.raises(errors.BadArgumentError):
+            self.dbauth.list_users(fields='password')
+
 
 @use_fixtures('admin_auth')
 class TestUserCreateDelete(DBAuthTestCase):
@@ -367,6 +401,7 @@ admin_calls = [
     ('user_delete', ['bob']),
     ('user_add_project', ['bob', 'runway']),
     ('user_remove_project', ['alice', 'runway']),
+    ('list_users', []),
 ]
 
 
@@ -401,3 +436,286 @@ def test_admin_noauth_fail(fn, args):
     fn = getattr(dbauth, fn)
     with pytest.raises(errors.AuthorizationError):
         fn(*args)
+
+
+@pytest.fixture
+def verify_calls(dbauth, monkeypatch):
+    """Count calls to User.verify_password, starting with an empty cache.
+
+    Returns a list, to which the label of the user is appended on each call.
+    """
+    calls = []
+    verify_password = dbauth.User.verify_password
+
+    def _verify_password(user, password):
+        calls.append(user.label)
+        return verify_password(user, password)
+
+    monkeypatch.setattr(dbauth.User, 'verify_password', _verify_password)
+    dbauth.credential_cache.clear()
+    return calls
+
+
+@use_fixtures('admin_auth')
+class TestCredentialCache(DBAuthTestCase):
+    """Tests for the verified-credential cache."""
+
+    # pylint: disable=unused-argument
+    @pytest.fixture(autouse=True)
+    def _verify_calls(self, configure, initial_db, server_init, admin_auth,
+                      auth_context, verify_calls):
+        """Make the verify_calls fixture available as self.calls.
+
+        This takes the other fixtures explicitly so that it runs after them;
+        otherwise the authentication done by auth_context would be counted.
+        """
+        self.calls = verify_calls
+
+    def _authenticate(self, username, password):
+        """Authenticate a request with the given credentials."""
+        flask.request = FakeAuthRequest(username, password)
+        return self.dbauth.DatabaseAuthBackend().authenticate()
+
+    def test_cached(self):
+        """Verified credentials are only checked once."""
+        assert self._authenticate('bob', 'password')
+        assert self._authenticate('bob', 'password')
+        assert local.auth.label == 'bob'
+        assert self.calls == ['bob']
+
+    def test_wrong_password_not_cached(self):
+        """A wrong password is checked every time, and never accepted."""
+        assert self._authenticate('bob', 'password')
+        assert not self._authenticate('bob', 'wrong')
+        assert not self._authenticate('bob', 'wrong')
+        assert self.calls == ['bob', 'bob', 'bob']
+
+    def test_password_change(self):
+        """A changed password invalidates the old credentials."""
+        assert self._authenticate('bob', 'password')
+        bob = api.get_or_404(self.dbauth.User, 'bob')
+        bob.set_password('hunter2')
+        db.session.commit()
+        assert not self._authenticate('bob', 'password')
+        assert self._authenticate('bob', 'hunter2')
+
+    def test_stale_entry(self):
+        """An entry is ignored if the password hash has changed under it.
+
+        This is what happens if another process changes the password.
+        """
+        assert self._authenticate('bob', 'password')
+        bob = api.get_or_404(self.dbauth.User, 'bob')
+        bob.hashed_password = self.dbauth.sha512_crypt.encrypt('password')
+        db.session.commit()
+        assert self._authenticate('bob', 'password')
+        assert self.calls == ['bob', 'bob']
+
+    def test_user_delete(self):
+        """Deleting a user invalidates their credentials."""
+        self.dbauth.user_create('charlie', 'foo')
+        assert self._authenticate('charlie', 'foo')
+        self._authenticate('alice', 'secret')
+        self.dbauth.user_delete('charlie')
+        self.dbauth.user_create('charlie', 'foo')
+        assert self._authenticate('charlie', 'foo')
+        assert self.calls == ['charlie', 'alice', 'charlie']
+
+    def test_user_set_admin(self):
+        """Changing a user's admin status invalidates their credentials."""
+        assert self._authenticate('bob', 'password')
+        self._authenticate('alice', 'secret')
+        self.dbauth.user_set_admin('bob', True)
+        assert self._authenticate('bob', 'password')
+        assert self.calls == ['bob', 'alice', 'bob']
+
+    def test_disabled(self):
+        """Setting credential_cache_ttl to 0 disables the cache."""
+        config_merge({'hil.ext.auth.database': {
+            'credential_cache_ttl': '0',
+        }})
+        assert self._authenticate('bob', 'password')
+        assert self._authenticate('bob', 'password')
+        assert self.calls == ['bob', 'bob']
+
+    def test_expiry(self):
+        """Entries expire after credential_cache_ttl seconds."""
+        config_merge({'hil.ext.auth.database': {
+            'credential_cache_ttl': '0.01',
+        }})
+        assert self._authenticate('bob', 'password')
+        time.sleep(0.02)
+        assert self._authenticate('bob', 'password')
+        assert self.calls == ['bob', 'bob']
+
+    def test_size(self):
+        """The oldest entries are dropped once the cache is full."""
+        config_merge({'hil.ext.auth.database': {
+            'credential_cache_size': '1',
+        }})
+        assert self._authenticate('bob', 'password')
+        assert self._authenticate('alice', 'secret')
+        assert self._authenticate('alice', 'secret')
+        assert self._authenticate('bob', 'password')
+        assert self.calls == ['bob', 'alice', 'bob']
+
+
+@use_fixtures('admin_auth')
+class TestTokens(DBAuthTestCase):
+    """Tests for API tokens."""
+
+    def _auth(self, username, password):
+        """Authenticate the request with a username and password."""
+        flask.request = FakeAuthRequest(username, password)
+        assert self.dbauth.DatabaseAuthBackend().authenticate()
+
+    def _token_auth(self, token):
+        """Authenticate the request with `token`, and return the result."""
+        flask.request = FakeTokenRequest(token)
+        return self.dbauth.DatabaseAuthBackend().authenticate()
+
+    def _create(self, *args, **kwargs):
+        """Call token_create, and return the token."""
+        return json.loads(self.dbauth.token_create(*args, **kwargs))['token']
+
+    def test_token(self):
+        """A token authenticates as the user it was issued to."""
+        token = self._create()
+        assert self._token_auth(token)
+        assert local.auth.label == 'alice'
+        assert self.dbauth.DatabaseAuthBackend().have_admin()
+
+    def test_disabled(self):
+        """Without a token_key, tokens are neither issued nor accepted."""
+        token = self._create()
+        config_merge({'hil.ext.auth.database': {'token_key': None}})
+        assert not self._token_auth(token)
+        self._auth('alice', 'secret')
+        with pytest.raises(errors.IllegalStateError):
+            self._create()
+
+    def test_bad_token(self):
+        """A token which was never issued is refused."""
+        self._create()
+        assert not self._token_auth('not-a-token')
+        assert local.auth is None
+
+    def test_digest(self):
+        """Tokens are not stored in the clear."""
+        token = self._create()
+        stored = self.dbauth.Token.query.one()
+        assert stored.digest != token
+        assert stored.digest == self.dbauth.token_digest(token)
+
+    def test_expired(self):
+        """Expired tokens are refused."""
+        token = self._create(expires_in=60)
+        stored = self.dbauth.Token.query.one()
+        stored.expires = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        assert not self._token_auth(token)
+
+    def test_expires_in(self):
+        """Tokens may not outlive token_lifetime."""
+        config_merge({'hil.ext.auth.database': {'token_lifetime': '60'}})
+        self._create(expires_in=60)
+        with pytest.raises(errors.BadArgumentError):
+            self._create(expires_in=61)
+
+    def test_no_token_from_token(self):
+        """A token can't be used to create another token."""
+        assert self._token_auth(self._create())
+        with pytest.raises(errors.AuthorizationError):
+            self._create()
+
+    def test_delete(self):
+        """token_delete revokes the request's token."""
+        token = self._create()
+        assert self._token_auth(token)
+        self.dbauth.token_delete()
+        assert not self._token_auth(token)
+
+    def test_project_scope(self):
+        """A token scoped to a project only grants access to it.
+
+        In particular, it doesn't grant admin access.
+        """
+        api.project_create('manhattan')
+        token = self._create(project='runway')
+        assert self._token_auth(token)
+        backend = self.dbauth.DatabaseAuthBackend()
+        assert not backend.have_admin()
+        assert backend.have_project_access(
+            api.get_or_404(model.Project, 'runway'))
+        assert not backend.have_project_access(
+            api.get_or_404(model.Project, 'manhattan'))
+
+    def test_project_scope_no_access(self):
+        """A token can't be scoped to a project the user can't access."""
+        self._auth('bob', 'password')
+        with pytest.raises(errors.AuthorizationError):
+            self._create(project='runway')
+
+    def test_user_delete(self):
+        """Deleting a user deletes their tokens."""
+        self._auth('bob', 'password')
+        self._create()
+        self._auth('alice', 'secret')
+        self.dbauth.user_delete('bob')
+        assert self.dbauth.Token.query.count() == 0
+
+    def test_project_delete(self):
+        """Deleting a project deletes the tokens scoped to it."""
+        api.project_create('manhattan')
+        self._create(project='manhattan')
+        api.project_delete('manhattan')
+        assert self.dbauth.Token.query.count() == 0
+
+
+@use_fixtures('admin_auth')
+class TestAuthContext(DBAuthTestCase):
+    """Tests for the backend's AuthContext."""
+
+    def _auth(self, request):
+        """Authenticate `request`, and return the backend."""
+        flask.request = request
+        backend = self.dbauth.DatabaseAuthBackend()
+        assert backend.authenticate()
+        return backend
+
+    def _project_ids(self, *labels):
+        """Return the ids of the projects named `labels`."""
+        return frozenset(api.get_or_404(model.Project, label).id
+                         for label in labels)
+
+    def test_admin(self):
+        """An admin's context says so."""
+        backend = self._auth(FakeAuthRequest('alice', 'secret'))
+        assert backend.context().admin
+        assert backend.project_ids() == frozenset()
+
+    def test_user(self):
+        """A user's context lists their projects, with one query."""
+        for label in 'manhattan', 'manhattan-2', 'manhattan-3':
+            api.project_create(label)
+        self.dbauth.user_add_project('bob', 'manhattan')
+        self.dbauth.user_add_project('bob', 'manhattan-2')
+        db.session.expire_all()
+        with QueryCounter() as queries:
+            backend = self._auth(FakeAuthRequest('bob', 'password'))
+            for project in model.Project.query:
+                backend.have_project_access(project)
+            project_ids = backend.project_ids()
+        assert not backend.context().admin
+        assert project_ids == self._project_ids('manhattan', 'manhattan-2')
+        # Loading bob, his projects, and the projects we check:
+        assert queries.count == 3
+
+    def test_scoped_token(self):
+        """A token scoped to a project only lists that project."""
+        api.project_create('manhattan')
+        self.dbauth.user_add_project('alice', 'manhattan')
+        token = json.loads(self.dbauth.token_create(project='runway'))
+        backend = self._auth(FakeTokenRequest(token['token']))
+        assert not backend.context().admin
+        assert backend.project_ids() == self._project_ids('runway')
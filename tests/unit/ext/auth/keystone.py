@@ -0,0 +1,108 @@
+"""Test the keystone auth backend's project cache."""
+from hil import config
+from hil.flaskapp import app
+from hil.model import db, Project
+from hil.test_common import config_testsuite, config_merge, fresh_database, \
+    fail_on_log_warnings
+import pytest
+import tempfile
+import threading
+
+pytest.importorskip('keystonemiddleware')
+
+# pylint: disable=wrong-import-position
+from hil.ext.auth import keystone  # noqa
+
+
+@pytest.fixture
+def configure():
+    """Configure HIL.
+
+    These tests need a second session which can't see the first one's
+    uncommitted changes, so if the configuration specifies an in-memory
+    sqlite database, we use a temporary file instead.
+    """
+    config_testsuite()
+    uri = config.cfg.get('database', 'uri')
+    if uri == 'sqlite:///:memory:':
+        with tempfile.NamedTemporaryFile() as temp_db:
+            config_merge({
+                'database': {
+                    'uri': 'sqlite:///' + temp_db.name,
+                },
+            })
+            config.load_extensions()
+            yield
+    else:
+        config.load_extensions()
+        yield
+
+
+@pytest.fixture
+def project_cache():
+    """Return an empty ``keystone.project_cache``."""
+    keystone.project_cache.clear()
+    yield keystone.project_cache
+    keystone.project_cache.clear()
+
+
+fail_on_log_warnings = pytest.fixture(autouse=True)(fail_on_log_warnings)
+fresh_database = pytest.fixture(fresh_database)
+
+pytestmark = pytest.mark.usefixtures('configure', 'fresh_database')
+
+
+def _is_registered_elsewhere(project_cache, label):
+    """Call ``project_cache.is_registered(label)`` from another thread.
+
+    The call is made in its own app context, and therefore its own session,
+    as it would be by a concurrent request.
+    """
+    result = []
+
+    def _check():
+        with app.app_context():
+            result.append(project_cache.is_registered(label))
+    thread = threading.Thread(target=_check)
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_create_project_between_flush_and_commit(project_cache):
+    """A lookup made before a new project commits doesn't outlive it."""
+    with app.app_context():
+        db.session.add(Project('acme'))
+        db.session.flush()
+        # The project isn't visible to other sessions yet, so this caches
+        # that it doesn't exist:
+        assert not _is_registered_elsewhere(project_cache, 'acme')
+        db.session.commit()
+        assert _is_registered_elsewhere(project_cache, 'acme')
+
+
+def test_delete_project_between_flush_and_commit(project_cache):
+    """A lookup made before a project's deletion commits doesn't outlive it."""
+    with app.app_context():
+        db.session.add(Project('acme'))
+        db.session.commit()
+        db.session.delete(Project.query.filter_by(label='acme').one())
+        db.session.flush()
+        assert _is_registered_elsewhere(project_cache, 'acme')
+        db.session.commit()
+        assert not _is_registered_elsewhere(project_cache, 'acme')
+
+
+def test_rollback_keeps_cache(project_cache):
+    """Creating a project and rolling back leaves the cache alone."""
+    with app.app_context():
+        assert not project_cache.is_registered('acme')
+        db.session.add(Project('acme'))
+        db.session.flush()
+        db.session.rollback()
+        assert keystone._CHANGED_LABELS not in db.session.info
+        # An unrelated commit mustn't drop the entry either:
+        db.session.add(Project('other'))
+        db.session.commit()
+        assert 'acme' in project_cache._entries
+        assert not project_cache.is_registered('acme')
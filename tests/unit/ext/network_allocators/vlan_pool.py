@@ -4,8 +4,9 @@ from hil.flaskapp import app
 from hil.model import db
 from hil.migrations import create_db
 from hil import api, errors
+from hil.network_allocator import get_network_allocator
 from hil.test_common import fail_on_log_warnings, with_request_context, \
-    fresh_database, config_testsuite, config_merge, server_init
+    fresh_database, config_testsuite, config_merge, server_init, QueryCounter
 from hil import model
 import pytest
 
@@ -134,3 +135,76 @@ class TestAdminCreatedNetworks():
         net_id = int(network.network_id)
         assert network.allocated is False
         assert net_id == 1511
+
+
+class TestAllocation(object):
+    """Tests for how the allocator hands out and takes back vlans."""
+
+    def test_allocate_in_order_until_exhausted(self):
+        """Vlans are handed out lowest first, each only once."""
+        allocator = get_network_allocator()
+        vlans = [allocator.get_new_network_id() for _ in range(7)]
+        assert vlans == ['100', '101', '102', '103', '104', '300', '702']
+        assert allocator.get_new_network_id() is None
+
+        allocator.free_network_id('102')
+        assert allocator.get_new_network_id() == '102'
+
+    def test_allocate_one_statement(self):
+        """Taking a vlan is a single statement on PostgreSQL, and a lookup
+        plus a conditional update elsewhere.
+        """
+        with QueryCounter() as counter:
+            get_network_allocator().get_new_network_id()
+        if db.engine.dialect.name == 'postgresql':
+            assert counter.count == 1
+        else:
+            assert counter.count == 2
+
+    def test_allocate_skips_taken(self, monkeypatch):
+        """A vlan claimed after it was looked up isn't handed out twice."""
+        if db.engine.dialect.name == 'postgresql':
+            pytest.skip('PostgreSQL takes the vlan in one statement')
+        from hil.ext.network_allocators import vlan_pool
+        real_take = vlan_pool._take
+
+        def _take_after_someone_else(vlan_no):
+            """Claim `vlan_no` (as another server might), then try to take
+            it ourselves.
+            """
+            assert real_take(vlan_no)
+            monkeypatch.setattr(vlan_pool, '_take', real_take)
+            return real_take(vlan_no)
+
+        monkeypatch.setattr(vlan_pool, '_take', _take_after_someone_else)
+        assert get_network_allocator().get_new_network_id() == '101'
+
+    def test_claim(self):
+        """Claiming returns whether the vlan is in the pool, and fails if it
+        is taken, in at most two statements.
+        """
+        allocator = get_network_allocator()
+        with QueryCounter() as counter:
+            assert allocator.claim_network_id('103') is True
+        assert counter.count == 1
+        with QueryCounter() as counter:
+            assert allocator.claim_network_id('1511') is False
+        assert counter.count == 2
+        with pytest.raises(errors.BlockedError):
+            allocator.claim_network_id('103')
+
+    def test_populate(self):
+        """populate inserts only the missing vlans, without a query per vlan.
+        """
+        from hil.ext.network_allocators.vlan_pool import Vlan
+        config_merge({
+            'hil.ext.network_allocators.vlan_pool': {'vlans': '100-1000'},
+        })
+        Vlan.query.filter_by(vlan_no=100).one().available = False
+        db.session.commit()
+
+        with QueryCounter() as counter:
+            get_network_allocator().populate()
+        assert counter.count < 10
+        assert Vlan.query.count() == 901
+        assert Vlan.query.filter_by(vlan_no=100).one().available is False
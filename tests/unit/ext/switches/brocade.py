@@ -201,6 +201,8 @@ class TestBrocade(object):
                         ('vlan/4025', '4025'),
                         ('vlan/4050', '4050')]
             }
+            # one request per port: native and trunked vlans share a GET.
+            assert mock.call_count == 3
 
     def test_get_mode(self, switch):
         """Test the _get_mode helper method"""
@@ -320,3 +322,26 @@ class TestBrocade(object):
             'http://example.com/rest/config/running/interface/'
             'TenGigabitEthernet/%221/0/4%22/switchport/mode'
         )
+
+    def test_http_session_reused(self, switch):
+        """Requests in one session share a pooled, keep-alive connection."""
+        config_merge({
+            'hil.ext.switches.brocade': {
+                'pool_maxsize': '2',
+                'read_timeout': '5',
+            },
+        })
+        with requests_mock.mock() as mock:
+            mock.get(switch._construct_url(INTERFACE1, suffix='mode'),
+                     text=MODE_RESPONSE_ACCESS)
+            http = switch._http
+            switch._get_mode(INTERFACE1)
+            switch._get_mode(INTERFACE1)
+            assert switch._http is http
+            assert [req.timeout for req in mock.request_history] == \
+                [(10, 5), (10, 5)]
+
+        assert http.get_adapter('https://example.com')._pool_maxsize == 2
+
+        switch.disconnect()
+        assert switch._http is not http
@@ -0,0 +1,159 @@
+"""Unit tests for hil.ext.switches._console"""
+
+import time
+
+import pexpect
+import pytest
+
+from hil import config
+from hil.errors import SwitchError
+from hil.model import PortChange
+from hil.test_common import config_testsuite, config_merge
+
+
+@pytest.fixture
+def configure():
+    """Configure HIL"""
+    config_testsuite()
+    config_merge({
+        'extensions': {
+            'hil.ext.switches.dell': '',
+        },
+    })
+    config.load_extensions()
+
+
+class FakeConsole(object):
+    """A stand-in for a pexpect console, which records what is sent to it.
+
+    `lines` is the list of lines sent, and `expected` the number of calls to
+    expect(). `events` records both, in order: each line sent, and 'EXPECT'
+    for each call to expect().
+
+    `outputs` is a list of the output (``before``) to report for each call
+    to expect(); once it runs out, there is no output.
+    """
+
+    def __init__(self, outputs=()):
+        self.lines = []
+        self.events = []
+        self.expected = 0
+        self.outputs = list(outputs)
+        self.before = ''
+
+    def sendline(self, line):
+        """Record ``line``."""
+        self.lines.append(line)
+        self.events.append(line)
+
+    def expect(self, pattern):
+        """Count the call; the pattern always matches."""
+        self.expected += 1
+        self.events.append('EXPECT')
+        self.before = self.outputs.pop(0) if self.outputs else ''
+        return 0
+
+
+@pytest.fixture
+def session(configure):
+    """Return a powerconnect session attached to a FakeConsole."""
+    from hil.ext.switches.dell import _PowerConnect55xxSession
+    return _PowerConnect55xxSession(config_prompt='console(config)#',
+                                    if_prompt='console(config-if)#',
+                                    main_prompt='console#',
+                                    switch=None,
+                                    console=FakeConsole())
+
+
+def test_apply_port_changes_range(session):
+    """Changes needing the same commands should be made on an interface
+    range, in a single burst.
+    """
+    results = session.apply_port_changes([
+        PortChange('gi1/0/1', 'vlan/100', '100'),
+        PortChange('gi1/0/2', 'vlan/100', '100'),
+        PortChange('gi1/0/1', None, None),
+        PortChange('gi1/0/3', 'vlan/100', '100'),
+    ])
+    assert results == [None] * 4
+    assert session.console.lines == [
+        'config',
+        'int range gi1/0/1,gi1/0/2,gi1/0/3',
+        'sw mode trunk',
+        'sw trunk allowed vlan add 100',
+        'exit',
+        'exit',
+        'config',
+        'int gi1/0/1',
+        'sw trunk allowed vlan none',
+        'sw trunk native vlan none',
+        'exit',
+        'exit',
+    ]
+    # Each block is sent in one burst, followed by waiting for the prompt:
+    assert session.console.events == \
+        session.console.lines[:6] + ['EXPECT'] + \
+        session.console.lines[6:] + ['EXPECT']
+
+
+def test_apply_port_changes_order(session):
+    """Changes to the same port must not be reordered."""
+    session.apply_port_changes([
+        PortChange('gi1/0/1', 'vlan/100', '100'),
+        PortChange('gi1/0/1', None, None),
+        PortChange('gi1/0/1', 'vlan/100', '100'),
+    ])
+    assert [line for line in session.console.lines
+            if line.startswith('int ')] == ['int gi1/0/1'] * 3
+    assert session.console.lines[-4:] == [
+        'sw mode trunk',
+        'sw trunk allowed vlan add 100',
+        'exit',
+        'exit',
+    ]
+
+
+def test_apply_port_changes_errors(session):
+    """Changes in a block which the switch rejects should get SwitchErrors;
+    the rest should still be made.
+    """
+    session.console.outputs = [
+        'config\r\nint gi1/0/1\r\nsw mode trunk\r\n'
+        'sw trunk allowed vlan add 100\r\n'
+        "% Invalid input detected at '^' marker.\r\nexit\r\nexit\r\n",
+        'config\r\nint gi1/0/2\r\n...',
+    ]
+    results = session.apply_port_changes([
+        PortChange('gi1/0/1', 'vlan/100', '100'),
+        PortChange('gi1/0/2', None, None),
+    ])
+    assert isinstance(results[0], SwitchError)
+    assert results[1] is None
+    assert 'gi1/0/2' in ' '.join(session.console.lines)
+
+    session.console.outputs = ['% Unrecognized command\r\n']
+    with pytest.raises(SwitchError):
+        session.modify_port('gi1/0/1', 'vlan/100', '100')
+
+
+def test_is_alive_stale_prompt(configure, monkeypatch):
+    """A prompt left in the console's output shouldn't make a switch which
+    has stopped responding look alive.
+    """
+    from hil.ext.switches import _console
+    from hil.ext.switches.dell import _PowerConnect55xxSession
+    monkeypatch.setattr(_console, '_PROBE_TIMEOUT', 0.5)
+    # Prints two prompts, then ignores everything:
+    console = pexpect.spawn('sh', ['-c', 'echo console#; echo console#; '
+                                         'exec sleep 30'])
+    try:
+        console.expect('console#')
+        time.sleep(0.2)
+        session = _PowerConnect55xxSession(config_prompt='console(config)#',
+                                           if_prompt='console(config-if)#',
+                                           main_prompt='console#',
+                                           switch=None,
+                                           console=console)
+        assert not session.is_alive()
+    finally:
+        console.close(force=True)
@@ -0,0 +1,147 @@
+"""Unit tests for hil.ext.switches._dell_base"""
+
+import pytest
+
+from hil import config
+from hil.errors import SwitchError
+from hil.test_common import config_testsuite, config_merge
+
+
+@pytest.fixture
+def configure():
+    """Configure HIL"""
+    config_testsuite()
+    config_merge({
+        'extensions': {
+            'hil.ext.switches.dell': '',
+            'hil.ext.switches.n3000': '',
+        },
+    })
+    config.load_extensions()
+
+
+POWERCONNECT_OUTPUT = '\r\n'.join([
+    'show int sw',
+    'Name: gi1/0/1',
+    'Switchport: enable',
+    'Administrative Mode: trunk',
+    'Trunking Native Mode VLAN: 3 (Inactive)',
+    'Trunking VLANs Enabled: none',
+    'Classification rules:',
+    '',
+    'Name: gi1/0/2',
+    'Switchport: enable',
+    'Trunking Native Mode VLAN: none',
+    'Trunking VLANs Enabled: 10,20-22',
+    '                        2000',
+    'Classification rules:',
+    ' Protocol: none',
+    '',
+    '',
+])
+
+N3000_OUTPUT = '\r\n'.join([
+    'show int sw',
+    '',
+    'Port: Gi1/0/1',
+    'VLAN Membership Mode: Trunk Mode',
+    'Trunking Mode Native VLAN: 1001',
+    'Trunking Mode VLANs Enabled: 1001',
+    '',
+    'Port: Gi1/0/2',
+    'VLAN Membership Mode: Trunk Mode',
+    'Trunking Mode Native VLAN: 1',
+    'Trunking Mode VLANs Enabled: 1,300-301',
+    '',
+])
+
+
+def test_parse_switchport_powerconnect():
+    """The bulk output of ``show int sw`` on a PowerConnect should be split
+    up by interface, including continuation lines.
+    """
+    from hil.ext.switches._dell_base import _parse_switchport
+    result = _parse_switchport(POWERCONNECT_OUTPUT, 'Name')
+    assert sorted(result.keys()) == ['gi1/0/1', 'gi1/0/2']
+    assert result['gi1/0/1']['Trunking Native Mode VLAN'].strip() == \
+        '3 (Inactive)'
+    assert result['gi1/0/2']['Trunking VLANs Enabled'] == \
+        ' 10,20-22\r\n                        2000\r\n'
+    # Classification rules are skipped:
+    assert 'Protocol' not in result['gi1/0/2']
+
+
+def test_parse_switchport_n3000():
+    """Interfaces in N3000 output start with ``Port:``, and the names should
+    match our (lower case) port labels.
+    """
+    from hil.ext.switches._dell_base import _parse_switchport
+    result = _parse_switchport(N3000_OUTPUT, 'Port')
+    assert sorted(result.keys()) == ['gi1/0/1', 'gi1/0/2']
+    assert result['gi1/0/2']['Trunking Mode VLANs Enabled'].strip() == \
+        '1,300-301'
+
+
+class FakeConsole(object):
+    """Answers ``show int sw`` with POWERCONNECT_OUTPUT."""
+
+    def __init__(self):
+        self.lines = []
+        self.before = ''
+
+    def sendline(self, line):
+        """Record ``line``, and prepare the reply to it."""
+        self.lines.append(line)
+        if line == 'show int sw':
+            self.before = POWERCONNECT_OUTPUT
+
+    def expect(self, pattern):
+        """The pattern always matches."""
+        return 0
+
+
+def _session():
+    """Return a powerconnect session attached to a FakeConsole, and its
+    switch.
+    """
+    from hil.ext.switches.dell import PowerConnect55xx, \
+        _PowerConnect55xxSession
+    switch = PowerConnect55xx(label='sw0',
+                              hostname='switch.example.com',
+                              username='admin',
+                              password='secret')
+    session = _PowerConnect55xxSession(config_prompt='console(config)#',
+                                       if_prompt='console(config-if)#',
+                                       main_prompt='console#',
+                                       switch=switch,
+                                       console=FakeConsole())
+    return session, switch
+
+
+def test_get_port_networks(configure):
+    """get_port_networks should read every port with one command."""
+    from hil.model import Port
+    session, switch = _session()
+    ports = [Port('gi1/0/1', switch), Port('gi1/0/2', switch)]
+    result = session.get_port_networks(ports)
+    assert result == {
+        ports[0]: [('vlan/native', 3)],
+        ports[1]: [('vlan/10', 10), ('vlan/20', 20), ('vlan/21', 21),
+                   ('vlan/22', 22), ('vlan/2000', 2000)],
+    }
+    assert session.console.lines == [
+        'terminal datadump',
+        'show int sw',
+        'no terminal datadump',
+    ]
+
+
+def test_get_port_networks_missing_port(configure):
+    """A port which isn't in the output of ``show int sw`` should cause a
+    SwitchError.
+    """
+    from hil.model import Port
+    session, switch = _session()
+    with pytest.raises(SwitchError):
+        session.get_port_networks([Port('gi1/0/1', switch),
+                                   Port('gi1/0/48', switch)])
@@ -173,3 +173,34 @@ def test_get_vlans():
         ('vlan/12', '12'), ('vlan/13', '13')]
     # just in case if the switch returns a 2 vlan range.
     assert switch._get_vlans('10-11') == [('vlan/10', '10'), ('vlan/11', '11')]
+
+
+def test_get_port_networks_reads_port_once():
+    """get_port_networks should query each port's state only once."""
+    from hil.ext.switches.dellnos9 import DellNOS9
+
+    calls = []
+
+    class MockDellNOS9(DellNOS9):
+        """Records the calls made to the switch for each port"""
+
+        def _get_port_info(self, interface):
+            calls.append(('info', interface))
+            return "Vlanmembership:\r\nQVlans\r\nU1512\r\nT1600,1601\r\n" \
+                "\r\nNativeVlanId:1512.\r\n"
+
+        def _is_port_on(self, port):
+            calls.append(('state', port))
+            return port != '1/2'
+
+    switch = MockDellNOS9()
+    port_on = model.Port(label='1/1', switch=switch)
+    port_off = model.Port(label='1/2', switch=switch)
+    assert switch.get_port_networks([port_on, port_off]) == {
+        port_on: [('vlan/native', '1512'),
+                  ('vlan/1600', '1600'),
+                  ('vlan/1601', '1601')],
+        port_off: [],
+    }
+    assert sorted(calls) == [('info', '1/1'), ('state', '1/1'),
+                             ('state', '1/2')]
@@ -0,0 +1,271 @@
+"""Unit tests for hil.ext.switches.ovs"""
+
+import json
+import socket
+import subprocess
+import threading
+
+import pytest
+
+from hil import config, model
+from hil.errors import SwitchError
+from hil.model import PortChange
+from hil.test_common import config_testsuite, config_merge
+
+
+@pytest.fixture
+def configure():
+    """Configure HIL"""
+    config_testsuite()
+    config_merge({
+        'extensions': {
+            'hil.ext.switches.ovs': '',
+        },
+    })
+    config.load_extensions()
+
+
+pytestmark = pytest.mark.usefixtures('configure')
+
+LIST_PORT_OUTPUT = json.dumps({
+    'headings': ['_uuid', 'name', 'tag', 'trunks', 'vlan_mode',
+                 'other_config'],
+    'data': [
+        [['uuid', 'ad489368-9b53-4a3e-8732-697ad5141de9'], 'veth-0', 100,
+         ['set', [200, 300]], 'native-untagged', ['map', []]],
+        [['uuid', 'fc61c8ff-99c5-4a3e-8732-697ad5141de9'], 'veth-1',
+         ['set', []], 400, ['set', []], ['map', [['a', 'b']]]],
+        [['uuid', '0c6a1e0d-99c5-4a3e-8732-697ad5141de9'], 'veth-2',
+         ['set', []], ['set', []], ['set', []], ['map', []]],
+    ],
+})
+
+
+@pytest.fixture
+def vsctl(monkeypatch):
+    """Record the ovs-vsctl commands the driver runs.
+
+    Returns the list of argument lists passed to subprocess; reads return
+    LIST_PORT_OUTPUT.
+    """
+    calls = []
+
+    def check_call(args):
+        """Record a write."""
+        calls.append(args)
+        return 0
+
+    def check_output(args):
+        """Record a read."""
+        calls.append(args)
+        return LIST_PORT_OUTPUT
+
+    monkeypatch.setattr(subprocess, 'check_call', check_call)
+    monkeypatch.setattr(subprocess, 'check_output', check_output)
+    return calls
+
+
+@pytest.fixture
+def switch():
+    """Create an Ovs switch object to work with."""
+    from hil.ext.switches.ovs import Ovs
+    return Ovs(label='ovs', ovs_bridge='br0')
+
+
+def test_get_port_networks_one_call(switch, vsctl):
+    """All ports are read with a single `ovs-vsctl list port`."""
+    ports = [model.Port(label, switch)
+             for label in ('veth-0', 'veth-1', 'veth-2')]
+    assert switch.get_port_networks(ports) == {
+        ports[0]: [('vlan/200', '200'), ('vlan/300', '300'),
+                   ('vlan/native', '100')],
+        ports[1]: [('vlan/400', '400')],
+        ports[2]: [],
+    }
+    assert vsctl == [['sudo', 'ovs-vsctl', '--format=json', 'list', 'port',
+                      'veth-0', 'veth-1', 'veth-2']]
+
+
+def test_port_info(switch, vsctl):
+    """_ports_info converts ovsdb values to plain python values."""
+    info = switch._ports_info(['veth-1'])['veth-1']
+    assert info['tag'] == []
+    assert info['trunks'] == ['400']
+    assert info['other_config'] == {'a': 'b'}
+    assert info['_uuid'] == 'fc61c8ff-99c5-4a3e-8732-697ad5141de9'
+
+
+def test_apply_port_changes_one_transaction(switch, vsctl):
+    """A batch of changes is made with a single ovs-vsctl transaction."""
+    results = switch.apply_port_changes([
+        PortChange('veth-0', None, None),
+        PortChange('veth-0', 'vlan/native', '100'),
+        PortChange('veth-0', 'vlan/200', '200'),
+        PortChange('veth-1', 'vlan/300', None),
+        PortChange('veth-1', 'vlan/native', None),
+    ])
+    assert results == [None] * 5
+    assert vsctl == [[
+        'sudo', 'ovs-vsctl',
+        '--', 'del-port', 'veth-0',
+        '--', 'add-port', 'br0', 'veth-0', 'vlan_mode=native-untagged',
+        '--', 'set', 'port', 'veth-0', 'tag=100', 'vlan_mode=native-untagged',
+        '--', 'add', 'port', 'veth-0', 'trunks', '200',
+        '--', 'remove', 'port', 'veth-1', 'trunks', '300',
+        '--', 'clear', 'port', 'veth-1', 'tag',
+    ]]
+
+
+def test_apply_port_changes_failure(switch, monkeypatch):
+    """If the transaction fails, every change in it fails."""
+    def check_call(args):
+        """Fail like ovs-vsctl would."""
+        raise subprocess.CalledProcessError(1, args)
+    monkeypatch.setattr(subprocess, 'check_call', check_call)
+
+    results = switch.apply_port_changes([
+        PortChange('veth-0', 'vlan/native', '100'),
+        PortChange('veth-1', 'vlan/native', '101'),
+    ])
+    assert len(results) == 2
+    assert all(isinstance(result, SwitchError) for result in results)
+
+
+class FakeOvsdbServer(object):
+    """Just enough of ovsdb-server to test the ovsdb client against.
+
+    Serves one connection on a unix socket at `path`, with a Port table
+    holding `ports` (a dict mapping names to rows). It understands the
+    monitor, transact and echo methods, and the wait, update and mutate
+    operations.
+    """
+
+    def __init__(self, path, ports):
+        self.path = path
+        self.ports = ports
+        self.requests = []
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen(1)
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        """Handle requests until the client disconnects."""
+        conn, _ = self.listener.accept()
+        decoder = json.JSONDecoder()
+        buf = ''
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                return
+            buf += data
+            while buf:
+                try:
+                    msg, end = decoder.raw_decode(buf)
+                except ValueError:
+                    break
+                buf = buf[end:].lstrip()
+                self.requests.append(msg)
+                for reply in self.handle(msg):
+                    conn.sendall(json.dumps(reply))
+
+    def handle(self, msg):
+        """Return the messages to send in response to `msg`."""
+        method, params = msg['method'], msg['params']
+        if method == 'monitor':
+            result = self.updates(self.ports.keys())
+        elif method == 'transact':
+            result = []
+            changed = set()
+            for op in params[1:]:
+                name = op['where'][0][2]
+                if name not in self.ports:
+                    result.append({'error': 'timed out'})
+                    return [{'id': msg['id'], 'error': None,
+                             'result': result}]
+                row = self.ports[name]
+                if op['op'] == 'update':
+                    row.update(op['row'])
+                elif op['op'] == 'mutate':
+                    _, mutator, (_, values) = op['mutations'][0]
+                    trunks = set(row['trunks'][1])
+                    if mutator == 'insert':
+                        trunks.update(values)
+                    else:
+                        trunks.difference_update(values)
+                    row['trunks'] = ['set', sorted(trunks)]
+                if op['op'] != 'wait':
+                    changed.add(name)
+                result.append({'count': 1})
+            if changed:
+                return [{'id': None, 'method': 'update',
+                         'params': [None, self.updates(changed)]},
+                        {'id': msg['id'], 'error': None, 'result': result}]
+        else:
+            result = params
+        return [{'id': msg['id'], 'error': None, 'result': result}]
+
+    def updates(self, names):
+        """Return the table-updates for the ports in `names`."""
+        return {'Port': {
+            'uuid-' + name: {'new': dict(self.ports[name], name=name)}
+            for name in names
+        }}
+
+
+@pytest.fixture
+def ovsdb_server(tmpdir):
+    """Start a FakeOvsdbServer, and configure the driver to use it."""
+    path = str(tmpdir.join('db.sock'))
+    server = FakeOvsdbServer(path, {
+        'veth-0': {'tag': 100, 'trunks': ['set', [200, 300]],
+                   'vlan_mode': 'native-untagged'},
+        'veth-1': {'tag': ['set', []], 'trunks': ['set', []],
+                   'vlan_mode': ['set', []]},
+    })
+    config_merge({
+        'hil.ext.switches.ovs': {
+            'ovsdb_socket': path,
+        },
+    })
+    return server
+
+
+def test_ovsdb_reads_from_monitor(switch, ovsdb_server, vsctl):
+    """With ovsdb_socket set, reads are served from the monitored copy."""
+    ports = [model.Port(label, switch) for label in ('veth-0', 'veth-1')]
+    assert switch.get_port_networks(ports) == {
+        ports[0]: [('vlan/200', '200'), ('vlan/300', '300'),
+                   ('vlan/native', '100')],
+        ports[1]: [],
+    }
+    switch.get_port_networks(ports)
+    assert [req['method'] for req in ovsdb_server.requests] == ['monitor']
+    assert vsctl == []
+
+
+def test_ovsdb_transaction(switch, ovsdb_server, vsctl):
+    """Changes are made in one transaction, and are visible to reads."""
+    assert switch.apply_port_changes([
+        PortChange('veth-0', None, None),
+        PortChange('veth-1', 'vlan/native', '101'),
+        PortChange('veth-1', 'vlan/102', '102'),
+    ]) == [None] * 3
+    transactions = [req for req in ovsdb_server.requests
+                    if req['method'] == 'transact']
+    assert len(transactions) == 1
+    assert vsctl == []
+
+    ports = [model.Port(label, switch) for label in ('veth-0', 'veth-1')]
+    assert switch.get_port_networks(ports) == {
+        ports[0]: [],
+        ports[1]: [('vlan/102', '102'), ('vlan/native', '101')],
+    }
+
+    results = switch.apply_port_changes([
+        PortChange('veth-1', 'vlan/native', None),
+        PortChange('no-such-port', 'vlan/native', '101'),
+    ])
+    assert all(isinstance(result, SwitchError) for result in results)
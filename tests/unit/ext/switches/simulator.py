@@ -0,0 +1,138 @@
+"""Unit tests for hil.ext.switches.simulator"""
+
+import pytest
+
+from hil import api, config, model
+from hil.errors import SwitchError
+from hil.model import PortChange
+from hil.test_common import config_testsuite, config_merge, fresh_database, \
+    fail_on_log_warnings, with_request_context, server_init
+
+fail_on_log_warnings = pytest.fixture(autouse=True)(fail_on_log_warnings)
+fresh_database = pytest.fixture(fresh_database)
+server_init = pytest.fixture(server_init)
+with_request_context = pytest.yield_fixture(with_request_context)
+
+SWITCH_TYPE = 'http://schema.massopencloud.org/haas/v0/switches/simulator'
+
+
+@pytest.fixture
+def configure(tmpdir):
+    """Configure HIL"""
+    config_testsuite()
+    config_merge({
+        'extensions': {
+            'hil.ext.switches.simulator': '',
+            'hil.ext.network_allocators.null': None,
+            'hil.ext.network_allocators.vlan_pool': '',
+        },
+        'hil.ext.network_allocators.vlan_pool': {
+            'vlans': '100-200',
+        },
+        'hil.ext.switches.simulator': {
+            'latency_scale': '0',
+            'state_dir': str(tmpdir),
+        },
+    })
+    config.load_extensions()
+
+
+pytestmark = pytest.mark.usefixtures('configure',
+                                     'fresh_database',
+                                     'server_init',
+                                     'with_request_context')
+
+
+def _switch(frontend, ports):
+    """Register a simulated switch using `frontend`, with `ports`."""
+    api.switch_register('sw-' + frontend,
+                        type=SWITCH_TYPE,
+                        profile='dell',
+                        frontend=frontend)
+    for port in ports:
+        api.switch_register_port('sw-' + frontend, port)
+    return model.Switch.query.filter_by(label='sw-' + frontend).one()
+
+
+CHANGES = [
+    PortChange('1/0/1', 'vlan/native', '100'),
+    PortChange('1/0/2', 'vlan/native', '100'),
+    PortChange('1/0/1', 'vlan/101', '101'),
+    PortChange('1/0/2', None, None),
+]
+
+EXPECTED = {
+    '1/0/1': [('vlan/native', '100'), ('vlan/101', '101')],
+    '1/0/2': [],
+}
+
+
+def _networks(session, switch):
+    """Return get_port_networks for all of `switch`'s ports, by label."""
+    networks = session.get_port_networks(switch.ports)
+    return {port.label: sorted(nets) for port, nets in networks.items()}
+
+
+def test_direct():
+    """The direct frontend keeps state in process."""
+    switch = _switch('direct', ['1/0/1', '1/0/2'])
+    session = switch.session()
+    assert session.apply_port_changes(CHANGES) == [None] * len(CHANGES)
+    session.disconnect()
+    assert _networks(switch.session(), switch) == \
+        {k: sorted(v) for k, v in EXPECTED.items()}
+
+
+def test_direct_failures():
+    """With failure_rate set, changes fail with SwitchError."""
+    config_merge({'hil.ext.switches.simulator': {'failure_rate': '1'}})
+    switch = _switch('direct', ['1/0/1'])
+    session = switch.session()
+    with pytest.raises(SwitchError):
+        session.modify_port('1/0/1', 'vlan/native', '100')
+    assert all(isinstance(result, SwitchError)
+               for result in session.apply_port_changes(CHANGES))
+
+
+def test_timing():
+    """Costs come from the profile, scaled by latency_scale."""
+    from hil.ext.switches.simulator import Timing
+    config_merge({'hil.ext.switches.simulator': {
+        'latency_scale': '0.5',
+        'jitter': '0',
+    }})
+    timing = Timing('dell')
+    assert timing.cost('save') == 2.5
+    assert timing.cost('change', 4) == 1.6
+
+
+def test_http():
+    """The http frontend is driven through the REST driver code."""
+    switch = _switch('http', ['1/0/1', '1/0/2'])
+    session = switch.session()
+    # It doesn't need another driver's model:
+    assert not isinstance(session, model.Switch)
+    assert session.apply_port_changes(CHANGES) == [None] * len(CHANGES)
+    session.disconnect()
+    assert _networks(switch.session(), switch) == \
+        {k: sorted(v) for k, v in EXPECTED.items()}
+
+
+def test_console():
+    """The console frontend is driven through the dell console driver."""
+    switch = _switch('console', ['gi1/0/1', 'gi1/0/2'])
+    session = switch.session()
+    assert session.is_alive()
+    session.apply_port_changes([
+        PortChange('gi1/0/1', 'vlan/native', '100'),
+        PortChange('gi1/0/2', 'vlan/native', '100'),
+        PortChange('gi1/0/1', 'vlan/101', '101'),
+        PortChange('gi1/0/2', None, None),
+    ])
+    session.disconnect()
+
+    # The state outlives the session (and its process):
+    assert _networks(switch.session(), switch) == {
+        'gi1/0/1': [('vlan/101', 101), ('vlan/native', 100)],
+        'gi1/0/2': [],
+    }
@@ -5,8 +5,8 @@ if we call it `auth`, it chokes on the fact that there's a file `api/auth.py`
 as well. grr.
 """
 import pytest
-from hil import config
-from hil.auth import get_auth_backend
+from hil import config, model
+from hil.auth import AuthBackend, get_auth_backend
 from hil.rest import app
 from hil.test_common import config_testsuite, config_merge, fresh_database, \
     fail_on_log_warnings, server_init
@@ -49,3 +49,48 @@ def test_require_auth():
     client = app.test_client()
     resp = client.get('/v0/node/free')
     assert resp.status_code == 401
+
+
+class _PlainBackend(AuthBackend):
+    """An auth backend which doesn't override `_project_ids`.
+
+    It has access to the projects labelled `labels`, and records the labels
+    of the projects `_have_project_access` is called for in `checked`.
+    """
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.checked = []
+
+    def authenticate(self):
+        # pylint: disable=missing-docstring
+        return True
+
+    def _have_admin(self):
+        return False
+
+    def _have_project_access(self, project):
+        self.checked.append(project.label)
+        return project.label in self.labels
+
+
+def test_default_project_access():
+    """Without `_project_ids`, projects are checked one at a time, as needed,
+    and each answer is remembered for the rest of the request.
+    """
+    with app.test_request_context():
+        for label in 'runway', 'manhattan', 'empty-project':
+            model.db.session.add(model.Project(label))
+        model.db.session.commit()
+        runway = model.Project.query.filter_by(label='runway').one()
+        manhattan = model.Project.query.filter_by(label='manhattan').one()
+
+        backend = _PlainBackend(['runway'])
+        assert backend.have_project_access(runway)
+        assert not backend.have_project_access(manhattan)
+        assert backend.have_project_access(runway)
+        assert backend.checked == ['runway', 'manhattan']
+
+        assert backend.project_ids() == frozenset([runway.id])
+        assert backend.project_ids() == frozenset([runway.id])
+        assert backend.checked == ['runway', 'manhattan', 'empty-project']
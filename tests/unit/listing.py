@@ -0,0 +1,37 @@
+"""Unit tests for hil.listing"""
+
+import pytest
+from schema import SchemaError
+
+from hil import listing
+from hil.errors import BadArgumentError
+
+
+@pytest.mark.parametrize('name', ['node-1', u'n\xf6de', 'a/b+c='])
+def test_cursor_roundtrip(name):
+    """A cursor decodes to the name it was made from."""
+    assert listing.decode_cursor(listing.encode_cursor(name)) == name
+
+
+def test_bad_cursor():
+    """Malformed cursors are rejected."""
+    with pytest.raises(BadArgumentError):
+        listing.decode_cursor('not a cursor')
+
+
+def test_parse_fields():
+    """Fields are split on commas, and checked against those allowed."""
+    assert listing.parse_fields(None, ['a', 'b']) is None
+    assert listing.parse_fields('b,a', ['a', 'b']) == ['b', 'a']
+    with pytest.raises(BadArgumentError):
+        listing.parse_fields('a,c', ['a', 'b'])
+
+
+def test_list_schema():
+    """List schemas accept the common arguments, and convert limit."""
+    schema = listing.list_schema({'project': basestring})
+    assert schema.validate({'project': 'p', 'limit': '5'}) == \
+        {'project': 'p', 'limit': 5}
+    for bad in '0', 'five':
+        with pytest.raises(SchemaError):
+            schema.validate({'project': 'p', 'limit': bad})